@@ -1,4 +1,6 @@
-from urllib.parse import urljoin
+import copy
+from typing import Any, Callable, Iterator
+from urllib.parse import parse_qs, urljoin, urlsplit
 import dlt
 
 from dlt.sources.helpers.rest_client import RESTClient
@@ -8,6 +10,85 @@ from requests import Response, Request
 from dlt.common import jsonpath
 
 from dlt.sources.helpers.rest_client.paginators import BaseReferencePaginator
+from dlt.sources.helpers.rest_client.utils import join_url
+
+from load.ratelimit import RateLimitedAdapter, RateLimiter
+from load.streaming import NEXT_LINK, CountingReader, iter_json_results
+
+def cache_json(response: Response) -> Any:
+    """cache_json
+
+    レスポンスのJSONをデコードして返します。
+    デコードした値はレスポンスに保持し、以降の response.json() も同じ値を返すようにするため、
+    RESTClientとページネーターが同じレスポンスを何度もデコードすることがなくなります。
+    """
+    if "_decoded_json" not in response.__dict__:
+        response._decoded_json = response.json()
+        response.json = lambda **kwargs: response._decoded_json
+    return response._decoded_json
+
+
+class ConfluenceRESTClient(RESTClient):
+    """ConfluenceRESTClient
+
+    レスポンスのJSONを1回だけデコードするRESTClientです。
+    RESTClient.paginateは、データの抽出（extract_response）とページネーターのそれぞれで response.json() を呼ぶため、
+    最初にデコードした値を使い回します。
+    """
+
+    def detect_data_selector(self, response: Response) -> str:
+        cache_json(response)
+        return super().detect_data_selector(response)
+
+    def extract_response(self, response: Response, data_selector: jsonpath.TJsonPath) -> list:
+        cache_json(response)
+        return super().extract_response(response, data_selector)
+
+    def paginate_results(
+        self,
+        path: str,
+        params: dict | None = None,
+        paginator: "ConfluenceV2CursorPagenator | None" = None,
+        on_read: Callable[[int], None] | None = None,
+    ) -> Iterator[dict]:
+        """paginate_results
+
+        paginateと同様にページをたどりながら、レスポンスのresults配列の要素を1件ずつ返します。
+        レスポンスはストリーミングで受信し、要素をデコードできた時点で返すため、
+        本文付きのページ一覧のような大きなレスポンスでも、レスポンス全体をメモリに載せません。
+
+        Args:
+            path: リクエストするパス
+            params: クエリパラメータ
+            paginator: 使用するページネーター。省略時はクライアントのページネーター。
+                "next" のリンクをたどるため、ConfluenceV2CursorPagenatorである必要があります。
+            on_read: レスポンスを読み出すたびに、読み出したバイト数を渡して呼ぶ関数
+        """
+        paginator = copy.deepcopy(paginator or self.paginator)
+        request = Request(
+            method="GET",
+            url=join_url(self.base_url, path),
+            params=dict(params or {}),
+            headers=self.headers,
+            auth=self.auth,
+        )
+        while True:
+            response = self.session.send(self.session.prepare_request(request), stream=True)
+            with response:
+                response.raise_for_status()
+                # gzipなどで圧縮されている場合は展開しながら読む
+                response.raw.decode_content = True
+                next_link = None
+                for kind, value in iter_json_results(CountingReader(response.raw, on_read)):
+                    if kind == NEXT_LINK:
+                        next_link = value
+                    else:
+                        yield value
+            paginator.update_state_from_next_link(next_link, response.url)
+            if not paginator.has_next_page:
+                return
+            paginator.update_request(request)
+
 
 class ConfluenceV2CursorPagenator(BaseReferencePaginator):
     """ConfluenceV2CursorPagenator
@@ -23,18 +104,21 @@ class ConfluenceV2CursorPagenator(BaseReferencePaginator):
             }
         }
 
-    カーソルはレスポンスの "next" キーから抽出され、次のリクエストのクエリパラメータとして使用されます。
+    "next" のリンクをurllib.parseで解析し、カーソルを含むすべてのクエリパラメータを次のリクエストに引き継ぎます。
+    follow_next_urlがTrueの場合は、"next" のリンクをそのまま次のリクエストのURLにします。
     """
 
     def __init__(
         self,
         cursor_path: jsonpath.TJsonPath = "_links.next",
         cursor_param: str = "cursor",
+        follow_next_url: bool = False,
     ):
         """
         Args:
             cursor_path: Json内でのカーソルのキーまでのパス
             cursor_param: カーソルのトークンを示すクエリパラメータ
+            follow_next_url: Trueの場合、"next" のリンクのURLをそのまま次のリクエストに使う
 
         Examples:
             以下のJsonならば
@@ -49,17 +133,65 @@ class ConfluenceV2CursorPagenator(BaseReferencePaginator):
         super().__init__()
         self.cursor_path = jsonpath.compile_path(cursor_path)
         self.cursor_param = cursor_param
-    
+        self.follow_next_url = follow_next_url
+        self._next_url = None
+        self._next_params = {}
+
     def update_state(self, response: Response, data = None) -> None:
-        values = jsonpath.find_values("_links.next", response.json())
-        next_path = values[0] if values else None
-        self._next_reference = next_path.split("cursor=")[1].split("&")[0] if next_path else None
+        values = jsonpath.find_values(self.cursor_path, cache_json(response))
+        self.update_state_from_next_link(values[0] if values else None, response.url if self.follow_next_url else None)
+
+    def update_state_from_next_link(self, next_link: str | None, url: str | None = None) -> None:
+        """レスポンスから取り出した "next" のリンクから、次のリクエストの状態を更新します。
+
+        Args:
+            next_link: "next" のリンク。なければNone。
+            url: リクエストしたURL。follow_next_urlがTrueの場合、リンクはこのURLを基準に解決します。
+        """
+        if not next_link:
+            self._next_reference = None
+            self._next_url = None
+            self._next_params = {}
+            return
+
+        query = parse_qs(urlsplit(next_link).query, keep_blank_values=True)
+        self._next_params = {key: value[0] if len(value) == 1 else value for key, value in query.items()}
+        self._next_reference = self._next_params.get(self.cursor_param)
+        # "next" は "/wiki/api/v2/..." のようなホストからのパスなので、リクエストしたURLを基準に解決する
+        self._next_url = urljoin(url, next_link) if self.follow_next_url else None
 
     def update_request(self, request: Request) -> None:
+        if self._next_url:
+            # URLにすべてのクエリパラメータが含まれているため、元のパラメータは使わない
+            request.url = self._next_url
+            request.params = {}
+            return
+
         if request.params is None:
             request.params = {}
 
-        request.params["cursor"] = self._next_reference
+        request.params.update(self._next_params)
+        request.params[self.cursor_param] = self._next_reference
+
+def mount_rate_limited_adapter(client: RESTClient, rate_limiter: RateLimiter, pool_maxsize: int = 10) -> None:
+    """mount_rate_limited_adapter
+
+    クライアントのセッションに、RateLimiterに従って送信するアダプタを設定します。
+
+    ホストあたりのコネクション数はpool_maxsizeまでに制限され、上限に達した場合、
+    リクエストはコネクションが空くまで待機します（pool_block=True）。
+
+    Args:
+        client: 設定対象のRESTClient
+        rate_limiter: クライアント間で共有するRateLimiter
+        pool_maxsize: ホストあたりのコネクション数の上限
+    """
+    adapter = RateLimitedAdapter(rate_limiter, pool_maxsize=pool_maxsize, pool_block=True)
+    client.session.mount("https://", adapter)
+    client.session.mount("http://", adapter)
+
+# v1_clientとv2_clientで共有するRateLimiter
+rate_limiter = RateLimiter()
 
 v1_client = RESTClient(
     base_url=urljoin(dlt.secrets["credentials.CONFLUENCE_BASE_URL"], "wiki/rest/api"),
@@ -68,7 +200,7 @@ v1_client = RESTClient(
         password=dlt.secrets["credentials.CONFLUENCE_API_TOKEN"]
     ),
 )
-v2_client = RESTClient(
+v2_client = ConfluenceRESTClient(
     base_url=urljoin(dlt.secrets["credentials.CONFLUENCE_BASE_URL"],"wiki/api/v2"),
     auth=HttpBasicAuth(
         username=dlt.secrets["credentials.CONFLUENCE_USERNAME"],
@@ -76,3 +208,5 @@ v2_client = RESTClient(
     ),
     paginator=ConfluenceV2CursorPagenator()
 )
+mount_rate_limited_adapter(v1_client, rate_limiter)
+mount_rate_limited_adapter(v2_client, rate_limiter)
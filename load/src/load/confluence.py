@@ -1,11 +1,15 @@
+import threading
 from datetime import datetime, timedelta
-from itertools import product
+from functools import partial
+from itertools import islice
 
 from zoneinfo import ZoneInfo, available_timezones
 
 import dlt
+from dlt.common import logger
 
-from load.clients import v1_client, v2_client
+from load.clients import mount_rate_limited_adapter, rate_limiter, v1_client, v2_client
+from load.executors import chain_concurrently, map_ordered
 
 def get_date_range(days_num: int, tz_name: str = 'UTC') -> list:
     """
@@ -35,72 +39,320 @@ def get_date_range(days_num: int, tz_name: str = 'UTC') -> list:
     results = [{"date": (today - timedelta(days=i)).strftime('%Y-%m-%d')} for i in range(days_num + 1)]
     return results
 
+def batch_space_keys(space_keys: list[str], max_keys: int = 250, max_length: int = 2000) -> list[list[str]]:
+    """
+    スペースキーを、1回のリクエストでまとめて検索できる単位に分割する。
+    重複したキーは除き、指定された順序を保つ。
+
+    Args:
+        space_keys (list[str]): スペースキーのリスト
+        max_keys (int): 1回で検索するキーの数の上限（APIのlimitの上限）
+        max_length (int): カンマ区切りにしたキーの文字数の上限。URLが長くなりすぎないようにする。
+
+    Returns:
+        list[list[str]]: 分割したスペースキーのリスト
+
+    Examples:
+        >>> batch_space_keys(["a", "b", "a", "c"], max_keys=2)
+            [['a', 'b'], ['c']]
+    """
+    batches = []
+    batch = []
+    length = 0
+    for key in dict.fromkeys(space_keys):
+        if batch and (len(batch) >= max_keys or length + 1 + len(key) > max_length):
+            batches.append(batch)
+            batch = []
+            length = 0
+        length += len(key) + (1 if batch else 0)
+        batch.append(key)
+    if batch:
+        batches.append(batch)
+    return batches
+
 @dlt.source
-def confluence(target_spaces: list[str],analytics_backfill_days: int,) -> list:
+def confluence(
+    target_spaces: list[str],
+    analytics_backfill_days: int,
+    analytics_max_workers: int = 1,
+    max_connections_per_host: int = 10,
+    max_requests_per_second: float = 100.0,
+    incremental_pages: bool = False,
+    incremental_analytics: bool = False,
+    max_parallel_spaces: int = 1,
+    stream_page_bodies: bool = False,
+) -> list:
     """Confluence
 
     a dlt source that loads Atlassian Confluence space, page and analytics data.
-    Available resources: [spaces, pages, views, viewers]
+    Available resources: [spaces, pages, page_bodies, views, viewers]
 
     Args:
         target_spaces (list[str]): name of the target spaces. If empty, all spaces will be collected.
         analytics_backfill_days (int): the number of days to backfill views and viewers.
+        analytics_max_workers (int): the number of threads fetching views and viewers concurrently.
+            If 1, requests are sent one by one. The row order is the same regardless of this value.
+        max_connections_per_host (int): the upper limit of HTTP connections kept open to the Confluence host.
+        max_requests_per_second (float): the upper limit of the request rate shared by all clients.
+            The actual rate is lowered automatically when Confluence responds with 429 or rate limit headers.
+        incremental_pages (bool): if True, only bodies of pages whose version number differs from the loaded one
+            are fetched and merged on page_id. Bodies of deleted and archived pages are removed from the page_bodies
+            table. The pages table (metadata without bodies) is always replaced with the latest listing.
+        incremental_analytics (bool): if True, views and viewers of the dates already loaded are not fetched again.
+        max_parallel_spaces (int): the number of spaces whose pages are listed and fetched concurrently.
+            If 1, spaces are processed one by one. The row order is the same regardless of this value.
+        stream_page_bodies (bool): if True, responses of pages with bodies are decoded incrementally and each page
+            is yielded as soon as it is parsed, instead of decoding the whole response at once.
     """
+    rate_limiter.set_max_rate(max_requests_per_second)
+    mount_rate_limited_adapter(v1_client, rate_limiter, max_connections_per_host)
+    mount_rate_limited_adapter(v2_client, rate_limiter, max_connections_per_host)
 
     @dlt.resource(name="spaces", write_disposition="replace")
     def get_spaces():
         """get_spaces
 
         https://developer.atlassian.com/cloud/confluence/rest/v2/api-group-space/#api-spaces-get
+
+        target_spacesが指定された場合、キーをカンマ区切りでまとめて検索し、見つからなかったキーは警告として出力します。
         """
         if len(target_spaces) > 0:
-            for space_name in target_spaces:
-                for page in v2_client.paginate(f"/spaces?keys={space_name}"):
+            found_keys = set()
+            for space_keys in batch_space_keys(target_spaces):
+                for page in v2_client.paginate("/spaces", params={"keys": ",".join(space_keys), "limit": 250}):
+                    found_keys.update(space["key"] for space in page)
                     yield page
+            missing_keys = [key for key in dict.fromkeys(target_spaces) if key not in found_keys]
+            if missing_keys:
+                logger.warning(f"spaces not found: {', '.join(missing_keys)}")
         else:
             for page in v2_client.paginate("/spaces"):
                 yield page
 
-    @dlt.transformer(name="pages", data_from=get_spaces, write_disposition="replace")
-    def get_pages(space_list):
+    def __list_space_pages(space_item):
+        """__list_space_pages
+
+        スペースの全ページを本文なしで一覧します。
+        """
+        pages = []
+        transferred_bytes = 0
+        for response_page in v2_client.paginate(f"/spaces/{space_item['id']}/pages", params={"limit": 250}):
+            pages.extend(response_page)
+            transferred_bytes += len(response_page.response.content)
+        return {"space_id": space_item["id"], "pages": pages, "transferred_bytes": transferred_bytes}
+
+    @dlt.transformer(data_from=get_spaces)
+    def __get_page_listings(space_list):
+        """__get_page_listings
+
+        List all pages of each space without their bodies, and pass the listings of a batch of spaces together.
+        Up to max_parallel_spaces spaces are listed concurrently.
+        This function is not exposed as a closure because it does not need to be stored in a table.
+        """
+        yield list(map_ordered(__list_space_pages, space_list, max_parallel_spaces, max_parallel_spaces))
+
+    def __to_page_body(page):
+        """ページから、page_bodiesに保存する本文のレコードを作成します。"""
+        return {"page_id": page["id"], "version": page["version"]["number"], "body": page["body"]}
+
+    def __fetch_page_bodies(path, params, on_read=None):
+        """__fetch_page_bodies
+
+        本文付きのページを取得し、本文のレコードにして返します。
+        stream_page_bodiesがTrueの場合はレスポンスをストリーミングでデコードし、ページを1件ずつ返します。
+
+        Args:
+            on_read: 受信したバイト数を渡して呼ぶ関数
+        """
+        if stream_page_bodies:
+            for page in v2_client.paginate_results(path, params=params, on_read=on_read):
+                yield __to_page_body(page)
+        else:
+            for response_page in v2_client.paginate(path, params=params):
+                if on_read is not None:
+                    on_read(len(response_page.response.content))
+                yield [__to_page_body(page) for page in response_page]
+
+    # ページ取得で転送したバイト数の実行全体での合計。複数のスレッドから更新するためロックを取る
+    transfer_stats = {"listing_bytes": 0, "body_bytes": 0}
+    transfer_stats_lock = threading.Lock()
+
+    def __get_changed_page_bodies(page_listing, space_state):
+        """__get_changed_page_bodies
+
+        ページ一覧のversion.numberと前回ロード時の状態を比較し、新規・更新されたページのみの本文を取得します。
+        本文は /pages?id=... でページIDを指定し、まとめて取得します。
+        前回ロード時に存在し、今回の一覧からなくなった（削除・アーカイブされた）ページは、削除用のレコードとして返します。
+
+        状態はスペースごとにdltのresource stateに保存します。
+        resource stateはワーカースレッドからは参照できないため、スペースの状態（space_state）は呼び出し元で取り出して渡します。
+            {
+                "spaces": {
+                    "1111111": {
+                        "versions": {"11111111": 3, "2222222": 1}  # 前回ロード時に存在したページとそのバージョン
+                    }
+                }
+            }
+
+        https://developer.atlassian.com/cloud/confluence/rest/v2/api-group-page/#api-pages-get
+        """
+        space_id = page_listing["space_id"]
+        loaded_versions = space_state.get("versions", {})
+
+        current_pages = [page for page in page_listing["pages"] if page["status"] == "current"]
+        changed_ids = [
+            page["id"] for page in current_pages
+            if loaded_versions.get(page["id"]) != page["version"]["number"]
+        ]
+
+        body_bytes = 0
+
+        def count_body_bytes(size):
+            nonlocal body_bytes
+            body_bytes += size
+
+        for i in range(0, len(changed_ids), 250):
+            yield from __fetch_page_bodies(
+                "/pages",
+                {"id": ",".join(changed_ids[i:i+250]), "body-format": "storage", "limit": 250},
+                count_body_bytes,
+            )
+
+        current_versions = {page["id"]: page["version"]["number"] for page in current_pages}
+        deleted_ids = loaded_versions.keys() - current_versions.keys()
+        if deleted_ids:
+            yield [{"page_id": page_id, "_deleted": True} for page_id in sorted(deleted_ids)]
+
+        space_state["versions"] = current_versions
+
+        with transfer_stats_lock:
+            transfer_stats["listing_bytes"] += page_listing["transferred_bytes"]
+            transfer_stats["body_bytes"] += body_bytes
+            total_bytes = transfer_stats["listing_bytes"] + transfer_stats["body_bytes"]
+        logger.info(
+            f"space {space_id}: listed {len(current_pages)} pages ({page_listing['transferred_bytes']} bytes), "
+            f"fetched {len(changed_ids)} changed pages ({body_bytes} bytes), removed {len(deleted_ids)} pages. "
+            f"total transferred: {total_bytes} bytes"
+        )
+
+    @dlt.transformer(name="pages", data_from=__get_page_listings, write_disposition="replace")
+    def get_pages(page_listings):
         """get_pages
 
         https://developer.atlassian.com/cloud/confluence/rest/v2/api-group-page/#api-spaces-id-pages-get
+
+        本文を含まないページのメタデータです。一覧をそのまま保存するため、追加のリクエストは発生しません。
+        本文はpage_bodiesに保存します。
         """
-        for space_item in space_list:
-            for page in v2_client.paginate(f"/spaces/{space_item['id']}/pages", params={"body-format": "storage"}):
-                yield page
+        yield [
+            {key: value for key, value in page.items() if key != "body"}
+            for page_listing in page_listings
+            for page in page_listing["pages"]
+        ]
+
+    @dlt.transformer(
+        name="page_bodies",
+        data_from=__get_page_listings,
+        write_disposition="merge" if incremental_pages else "replace",
+        primary_key="page_id" if incremental_pages else None,
+        columns={"_deleted": {"data_type": "bool", "hard_delete": True}} if incremental_pages else None,
+    )
+    def get_page_bodies(page_listings):
+        """get_page_bodies
+
+        https://developer.atlassian.com/cloud/confluence/rest/v2/api-group-page/#api-spaces-id-pages-get
+
+        ページの本文（storage形式のHTML）を、ページIDとバージョンとともに保存します。
+        incremental_pagesがTrueの場合、新規・更新されたページのみを取得してpage_idでマージし、
+        削除・アーカイブされたページはテーブルから削除します。
 
-    @dlt.transformer(data_from=get_pages, write_disposition="replace")
-    def __get_pages_cross_join_date_range(page_list):
+        最大max_parallel_spaces個のスペースのページを同時に取得します。
+        先読みはスペースごとに数ページ分までに制限し、結果はスペースの順に返します。
+        """
+        if incremental_pages:
+            spaces_state = dlt.current.resource_state().setdefault("spaces", {})
+            fetchers = [
+                partial(__get_changed_page_bodies, page_listing, spaces_state.setdefault(page_listing["space_id"], {}))
+                for page_listing in page_listings
+            ]
+        else:
+            fetchers = [
+                partial(
+                    __fetch_page_bodies,
+                    f"/spaces/{page_listing['space_id']}/pages",
+                    {"body-format": "storage"},
+                )
+                for page_listing in page_listings
+            ]
+        yield from chain_concurrently(fetchers, max_parallel_spaces)
+
+    @dlt.transformer(data_from=__get_page_listings, write_disposition="replace")
+    def __get_pages_cross_join_date_range(page_listings):
         """__get_pages_cross_join_date_range
         
         For backfilling, perform a cross join between pages and dates.
         This function is not exposed as a closure because it does not need to be stored in a table.
+
+        Dates before the page was created are skipped, since they are discarded in cleansed_views and cleansed_viewers.
+        If incremental_analytics is True, dates up to the last loaded date of each page (kept in the resource state
+        per space) are also skipped. Today's counts are still incomplete, so the state advances only to yesterday
+        and today is fetched again on every run.
         """
-        page_id_dict_list = [{"id": page["id"]} for page in page_list]
-        date_range = get_date_range(analytics_backfill_days)
-        result = [dict(**d1, **d2) for d1, d2 in product(page_id_dict_list, date_range)]
-        for item in result:
-            yield item
+        date_range = [item["date"] for item in get_date_range(analytics_backfill_days)]
+        # 今日の閲覧数はまだ確定していないため、状態は昨日（確定した最後の日）までしか進めない
+        last_complete_date = (datetime.strptime(date_range[0], '%Y-%m-%d') - timedelta(days=1)).strftime('%Y-%m-%d')
+        spaces_state = dlt.current.resource_state().setdefault("spaces", {}) if incremental_analytics else {}
 
-    @dlt.resource(name="views", data_from=__get_pages_cross_join_date_range, write_disposition="append")
-    def get_views(page_date_item):
-        views = v1_client.get(
-                f"/analytics/content/{page_date_item['id']}/views?fromDate={page_date_item['date']}"
+        for page_listing in page_listings:
+            loaded_dates = spaces_state.get(page_listing["space_id"], {})
+
+            def page_date_items():
+                for page in page_listing["pages"]:
+                    # 日付文字列はYYYY-MM-DD形式なので、文字列のまま比較できる
+                    created_date = page["createdAt"][:10]
+                    # 以前のバージョンが今日まで進めた状態も、今日は取得し直す
+                    loaded_date = min(loaded_dates.get(page["id"], ""), last_complete_date)
+                    for date in date_range:
+                        if date >= created_date and date > loaded_date:
+                            yield {"id": page["id"], "date": date}
+
+            # 全組み合わせをリストにせず、500件ずつまとめて渡す。views/viewers側ではこの単位で並行に取得する
+            items = page_date_items()
+            while batch := list(islice(items, 500)):
+                yield batch
+
+            if incremental_analytics:
+                # 一覧から消えたページの状態は引き継がない
+                spaces_state[page_listing["space_id"]] = {
+                    page["id"]: last_complete_date for page in page_listing["pages"]
+                }
+
+    def __get_analytics(page_date_item, metric):
+        """__get_analytics
+
+        https://developer.atlassian.com/cloud/confluence/rest/v1/api-group-analytics/#api-wiki-rest-api-analytics-content-contentid-views-get
+        """
+        analytics = v1_client.get(
+                f"/analytics/content/{page_date_item['id']}/{metric}?fromDate={page_date_item['date']}"
             ).json()
-        return {"page_id": page_date_item["id"], "date": page_date_item["date"], "views": views["count"]}
+        return {"page_id": page_date_item["id"], "date": page_date_item["date"], metric: analytics["count"]}
+
+    @dlt.resource(name="views", data_from=__get_pages_cross_join_date_range, write_disposition="append")
+    def get_views(page_date_items):
+        yield from map_ordered(
+            lambda item: __get_analytics(item, "views"), page_date_items, analytics_max_workers
+        )
 
     @dlt.resource(name="viewers", data_from=__get_pages_cross_join_date_range, write_disposition="append")
-    def get_viewers(page_date_item):
-        viewers = v1_client.get(
-                f"/analytics/content/{page_date_item['id']}/viewers?fromDate={page_date_item['date']}"
-            ).json()
-        return {"page_id": page_date_item["id"], "date": page_date_item["date"], "viewers": viewers["count"]}
+    def get_viewers(page_date_items):
+        yield from map_ordered(
+            lambda item: __get_analytics(item, "viewers"), page_date_items, analytics_max_workers
+        )
 
     return [
         get_spaces,
         get_pages,
+        get_page_bodies,
         get_views,
         get_viewers
     ]
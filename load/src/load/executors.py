@@ -0,0 +1,134 @@
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from queue import Full, Queue
+from typing import Callable, Iterable, Iterator, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def map_ordered(
+    func: Callable[[T], R],
+    items: Iterable[T],
+    max_workers: int = 1,
+    buffer_size: int | None = None,
+) -> Iterator[R]:
+    """map_ordered
+
+    funcをitemsの各要素に適用し、結果を入力と同じ順序で返すジェネレータです。
+
+    max_workersが2以上の場合はスレッドプールで並行に実行します。
+    実行中（または結果待ち）のタスク数はbuffer_size件までに制限されるため、
+    itemsが巨大なイテレータでもメモリ使用量は一定に保たれます。
+
+    Args:
+        func: 各要素に適用する関数
+        items: 入力のイテラブル。先頭から遅延評価で読み出されます。
+        max_workers: 同時に実行するスレッド数。1以下なら逐次実行します。
+        buffer_size: 先読みするタスク数の上限。省略時はmax_workersの2倍。
+
+    Examples:
+        >>> list(map_ordered(lambda x: x * 2, [1, 2, 3], max_workers=4))
+            [2, 4, 6]
+    """
+    if max_workers <= 1:
+        yield from map(func, items)
+        return
+
+    buffer_size = buffer_size or max_workers * 2
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = deque()
+        for item in items:
+            futures.append(executor.submit(func, item))
+            if len(futures) >= buffer_size:
+                # 先頭のタスクが終わるまで待つことで、投入順に結果を返す
+                yield futures.popleft().result()
+        while futures:
+            yield futures.popleft().result()
+
+
+class _WorkerError:
+    """ワーカースレッドで発生した例外を、呼び出し元のスレッドへ渡すための入れ物"""
+    def __init__(self, exception: BaseException):
+        self.exception = exception
+
+
+_END = object()
+
+
+def chain_concurrently(
+    iterable_factories: Iterable[Callable[[], Iterable[T]]],
+    max_workers: int = 1,
+    buffer_size: int = 4,
+) -> Iterator[T]:
+    """chain_concurrently
+
+    iterable_factoriesが返す各イテラブルの要素を、itertools.chainと同じ順序で返すジェネレータです。
+
+    max_workersが2以上の場合、先頭から最大max_workers個のイテラブルをスレッドプールで同時に読み進めます。
+    各イテラブルは読み出した要素をbuffer_size件までしか溜めず、呼び出し元が消費するまで待機するため、
+    メモリ使用量はmax_workers × buffer_size件分に抑えられます。
+
+    Args:
+        iterable_factories: イテラブルを作成する引数なしの関数のイテラブル。
+            イテラブルはワーカースレッドで作成・消費されます。
+        max_workers: 同時に読み進めるイテラブルの数。1以下なら逐次実行します。
+        buffer_size: イテラブルごとに先読みする要素数の上限
+
+    Examples:
+        >>> list(chain_concurrently([lambda: range(2), lambda: range(3)], max_workers=2))
+            [0, 1, 0, 1, 2]
+    """
+    if max_workers <= 1:
+        for factory in iterable_factories:
+            yield from factory()
+        return
+
+    stop = threading.Event()
+
+    def put(buffer, item) -> bool:
+        """呼び出し元が消費するまで待機してバッファに入れる。中断された場合は入れずにFalseを返す。"""
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def run(factory, buffer):
+        # 終端と例外も、要素と同じく中断を確認しながら入れる
+        # （バッファが埋まったまま呼び出し元が抜けると、ブロックするputではスレッドプールの終了待ちが止まらない）
+        try:
+            for item in factory():
+                if not put(buffer, item):
+                    return
+            put(buffer, _END)
+        except BaseException as e:
+            put(buffer, _WorkerError(e))
+
+    factories = iter(iterable_factories)
+    buffers = deque()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+
+        def submit_next():
+            factory = next(factories, None)
+            if factory is not None:
+                buffer = Queue(maxsize=buffer_size)
+                executor.submit(run, factory, buffer)
+                buffers.append(buffer)
+
+        try:
+            for _ in range(max_workers):
+                submit_next()
+            while buffers:
+                buffer = buffers[0]
+                while (item := buffer.get()) is not _END:
+                    if isinstance(item, _WorkerError):
+                        raise item.exception
+                    yield item
+                buffers.popleft()
+                submit_next()
+        finally:
+            stop.set()
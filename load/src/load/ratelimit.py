@@ -0,0 +1,206 @@
+import random
+import threading
+import time
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+
+from requests import PreparedRequest, Response
+from requests.adapters import HTTPAdapter
+
+THROTTLE_STATUS_CODES = (429, 503)
+
+
+class RateLimiter:
+    """RateLimiter
+
+    複数のクライアント（スレッド）で共有する、トークンバケット方式のリクエストスケジューラです。
+
+    レスポンスから流量を学習し、送信レートを調整します（AIMD）。
+    - 429/503が返った場合: レートを半分に下げ、Retry-Afterの秒数（なければ指数バックオフ）だけ全リクエストを止めます。
+    - X-RateLimit-NearLimitが返った場合: レートを1割下げます。
+    - X-RateLimit-Remainingが0の場合: X-RateLimit-Resetの時刻まで全リクエストを止めます。
+    - それ以外の成功レスポンス: max_rateを上限に、レートを少しずつ上げます。
+
+    https://developer.atlassian.com/cloud/confluence/rate-limiting/
+
+    Examples:
+        >>> limiter = RateLimiter(max_rate=10)
+        >>> limiter.acquire()  # 送信してよいタイミングまで待機する
+        >>> limiter.update(response)  # レスポンスからレートを調整する
+        >>> limiter.stats
+            {'requests': 1, 'throttles': 0, 'wait_seconds': 0.0, 'rate': 10.0}
+    """
+
+    def __init__(
+        self,
+        max_rate: float = 100.0,
+        min_rate: float = 0.5,
+        burst: int = 5,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+        clock=time.monotonic,
+        sleep=time.sleep,
+    ):
+        """
+        Args:
+            max_rate: 1秒あたりのリクエスト数の上限
+            min_rate: 1秒あたりのリクエスト数の下限
+            burst: 連続して送信できるリクエスト数（バケットの容量）
+            backoff_base: 指数バックオフの初期値（秒）
+            backoff_max: 指数バックオフの上限（秒）
+            clock: 現在時刻（秒）を返す関数。テスト用。
+            sleep: 待機する関数。テスト用。
+        """
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.burst = burst
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._clock = clock
+        self._sleep = sleep
+
+        self._lock = threading.Lock()
+        self._rate = max_rate
+        self._tokens = float(burst)
+        self._last_refill = clock()
+        self._paused_until = 0.0
+
+        self._requests = 0
+        self._throttles = 0
+        self._wait_seconds = 0.0
+
+    @property
+    def rate(self) -> float:
+        """現在の1秒あたりのリクエスト数"""
+        return self._rate
+
+    @property
+    def stats(self) -> dict:
+        """送信したリクエスト数、スロットリングされた回数、待機した秒数の合計、現在のレート"""
+        with self._lock:
+            return {
+                "requests": self._requests,
+                "throttles": self._throttles,
+                "wait_seconds": round(self._wait_seconds, 3),
+                "rate": round(self._rate, 3),
+            }
+
+    def set_max_rate(self, max_rate: float) -> None:
+        """レートの上限を変更します。現在のレートが上限を超えていれば、上限まで下げます。"""
+        with self._lock:
+            self.max_rate = max_rate
+            self._rate = min(self._rate, max_rate)
+
+    def acquire(self) -> None:
+        """リクエストを1件送信してよいタイミングまで待機します。"""
+        while True:
+            with self._lock:
+                now = self._clock()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                else:
+                    self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self._rate)
+                    self._last_refill = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        self._requests += 1
+                        return
+                    wait = (1 - self._tokens) / self._rate
+                self._wait_seconds += wait
+            self._sleep(wait)
+
+    def backoff(self, attempt: int) -> float:
+        """attempt回目の再試行までの待機秒数を、フルジッター付きの指数バックオフで返します。"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def update(self, response: Response, attempt: int = 0) -> float | None:
+        """update
+
+        レスポンスのステータスコードとヘッダからレートを調整します。
+
+        Args:
+            response: 受信したレスポンス
+            attempt: このリクエストの再試行回数
+
+        Returns:
+            スロットリングされた場合は、再試行までに待機する秒数。されていなければNone。
+        """
+        headers = response.headers
+        with self._lock:
+            now = self._clock()
+            if response.status_code in THROTTLE_STATUS_CODES:
+                self._throttles += 1
+                self._rate = max(self.min_rate, self._rate / 2)
+                retry_after = _parse_retry_after(headers.get("Retry-After"))
+                if retry_after is None:
+                    retry_after = self.backoff(attempt)
+                else:
+                    # 全スレッドが同時に再送しないよう、少しだけずらす
+                    retry_after += random.uniform(0, self.backoff_base)
+                self._paused_until = max(self._paused_until, now + retry_after)
+                return retry_after
+
+            if headers.get("X-RateLimit-NearLimit", "").lower() == "true":
+                self._rate = max(self.min_rate, self._rate * 0.9)
+            else:
+                self._rate = min(self.max_rate, self._rate + self.max_rate / 50)
+
+            if headers.get("X-RateLimit-Remaining") == "0":
+                reset_after = _parse_reset(headers.get("X-RateLimit-Reset"))
+                if reset_after:
+                    self._paused_until = max(self._paused_until, now + reset_after)
+        return None
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """RateLimitedAdapter
+
+    RateLimiterに従ってリクエストを送信するHTTPAdapterです。
+    スロットリングされた場合は、max_throttle_retries回まで待機して再送します。
+    """
+
+    def __init__(self, rate_limiter: RateLimiter, max_throttle_retries: int = 5, **kwargs):
+        """
+        Args:
+            rate_limiter: 共有するRateLimiter
+            max_throttle_retries: スロットリングされた場合に再送する回数
+            kwargs: HTTPAdapterに渡す引数（pool_maxsizeなど）
+        """
+        super().__init__(**kwargs)
+        self.rate_limiter = rate_limiter
+        self.max_throttle_retries = max_throttle_retries
+
+    def send(self, request: PreparedRequest, **kwargs) -> Response:
+        for attempt in range(self.max_throttle_retries + 1):
+            self.rate_limiter.acquire()
+            response = super().send(request, **kwargs)
+            if self.rate_limiter.update(response, attempt) is None or attempt == self.max_throttle_retries:
+                return response
+            # 待機はacquireの中で行う
+            response.close()
+
+
+def _parse_retry_after(value: str | None) -> float | None:
+    """Retry-Afterヘッダ（秒数またはHTTP日付）を秒数にします。"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (retry_at - datetime.now(tz=retry_at.tzinfo)).total_seconds())
+
+
+def _parse_reset(value: str | None) -> float | None:
+    """X-RateLimit-Resetヘッダ（ISO 8601形式の時刻）を、現在からの秒数にします。"""
+    if not value:
+        return None
+    try:
+        reset_at = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return max(0.0, (reset_at - datetime.now(tz=reset_at.tzinfo)).total_seconds())
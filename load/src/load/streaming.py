@@ -0,0 +1,75 @@
+from typing import Any, BinaryIO, Callable, Iterator
+
+import ijson
+from ijson.common import ObjectBuilder
+
+# iter_json_resultsが返すイベントの種類
+RESULT = "result"
+NEXT_LINK = "next_link"
+
+
+class CountingReader:
+    """CountingReader
+
+    読み出したバイト数を数えるファイルライクオブジェクトのラッパーです。
+    ストリーミングで受信したレスポンスの転送量を記録するために使います。
+    """
+
+    def __init__(self, raw: BinaryIO, on_read: Callable[[int], None] | None = None):
+        """
+        Args:
+            raw: 読み出し元のファイルライクオブジェクト
+            on_read: 読み出すたびに、読み出したバイト数を渡して呼ぶ関数
+        """
+        self.raw = raw
+        self.on_read = on_read
+        self.bytes_read = 0
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self.raw.read(size)
+        self.bytes_read += len(chunk)
+        if self.on_read is not None:
+            self.on_read(len(chunk))
+        return chunk
+
+
+def iter_json_results(
+    stream: BinaryIO,
+    results_prefix: str = "results.item",
+    next_link_prefix: str = "_links.next",
+) -> Iterator[tuple[str, Any]]:
+    """iter_json_results
+
+    Confluence REST API v2のレスポンスを先頭から読み進め、results配列の要素を1件ずつデコードして返すジェネレータです。
+    レスポンス全体をデコードしないため、本文付きのページ一覧のような大きなレスポンスでも、
+    メモリ上に保持するのはデコード中の1件分だけになります。
+
+    Args:
+        stream: レスポンスボディのファイルライクオブジェクト
+        results_prefix: 返す要素のijsonのプレフィックス
+        next_link_prefix: 次のページへのリンクのijsonのプレフィックス
+
+    Returns:
+        (RESULT, 要素) と、次のページへのリンクがあれば (NEXT_LINK, リンク) のタプル。
+        Confluenceのレスポンスでは_linksがresultsの後に来るため、NEXT_LINKは最後に返ります。
+
+    Examples:
+        >>> list(iter_json_results(io.BytesIO(b'{"results": [{"id": "1"}], "_links": {"next": "/pages?cursor=a"}}')))
+            [('result', {'id': '1'}), ('next_link', '/pages?cursor=a')]
+    """
+    builder = None
+    for prefix, event, value in ijson.parse(stream, use_float=True):
+        if builder is not None:
+            builder.event(event, value)
+            # 要素の終わりだけが、要素と同じプレフィックスのend_map/end_arrayになる
+            if prefix == results_prefix and event in ("end_map", "end_array"):
+                yield RESULT, builder.value
+                builder = None
+        elif prefix == results_prefix:
+            if event in ("start_map", "start_array"):
+                builder = ObjectBuilder()
+                builder.event(event, value)
+            else:
+                yield RESULT, value
+        elif prefix == next_link_prefix and event == "string":
+            yield NEXT_LINK, value
@@ -1,5 +1,7 @@
 import os
 import dlt
+from dlt.common import logger
+from load.clients import rate_limiter
 from load.confluence import confluence
 
 
@@ -10,6 +12,13 @@ pipeline = dlt.pipeline(
 )
 data = confluence(
     target_spaces=[],
-    analytics_backfill_days=0
+    analytics_backfill_days=0,
+    analytics_max_workers=8,
+    max_connections_per_host=8,
+    incremental_pages=True,
+    incremental_analytics=True,
+    max_parallel_spaces=4,
+    stream_page_bodies=True,
 )
 result = pipeline.run(data)
+logger.info(f"Confluence API requests: {rate_limiter.stats}")
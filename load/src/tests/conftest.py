@@ -1,5 +1,9 @@
 import datetime
 import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
 from unittest.mock import MagicMock, patch
 import pytest
@@ -114,6 +118,22 @@ def mock_api_server():
                 open(Path(BASE_DIR / "tests/testdata/spaces_response_selected_space.json"))
             ),
         },
+        {
+            # Confluence.get_pagesテスト用（本文なしのページ一覧）
+            "base_url": BASE_URL + V2_API_RELATIVE_PATH,
+            "path": "/spaces/1111111/pages?limit=250",
+            "response": json.load(
+                open(Path(BASE_DIR / "tests/testdata/pages_response_page1.json"))
+            ),
+        },
+        {
+            # Confluence.get_pagesテスト用（本文なしのページ一覧）
+            "base_url": BASE_URL + V2_API_RELATIVE_PATH,
+            "path": "/spaces/1111111/pages?limit=250&cursor=test-cursor-1",
+            "response": json.load(
+                open(Path(BASE_DIR / "tests/testdata/pages_response_page2.json"))
+            ),
+        },
         {
             # Confluence.get_pagesテスト用
             "base_url": BASE_URL + V2_API_RELATIVE_PATH,
@@ -131,14 +151,157 @@ def mock_api_server():
             ),
         },
     ]
+    def space_pages(space_id, file_name):
+        """テストデータのページを、ページIDを `{space_id}-{元のID}` に変えて、指定したスペースのページにする"""
+        response = json.load(open(Path(BASE_DIR / "tests/testdata" / file_name)))
+        for page in response["results"]:
+            page["id"] = f"{space_id}-{page['id']}"
+            page["spaceId"] = space_id
+        if "next" in response["_links"]:
+            response["_links"]["next"] = response["_links"]["next"].replace("/spaces/1111111/", f"/spaces/{space_id}/")
+        return response
+
     with requests_mock.Mocker() as m:
+        # Confluence.get_pagesテスト用（スペース 1111111 以外のページ一覧）
+        # 後から登録したエンドポイントが優先されるため、スペース 1111111 には下のテストデータが返る
+        def pages_of_space(request, context):
+            space_id = re.search(r"/spaces/(\d+)/pages", request.path).group(1)
+            file_name = "pages_response_page2.json" if "cursor" in request.qs else "pages_response_page1.json"
+            return space_pages(space_id, file_name)
+
+        m.get(re.compile(re.escape(BASE_URL + V2_API_RELATIVE_PATH) + r"/spaces/\d+/pages"), json=pages_of_space)
+
         # モック化するエンドポイントを登録
         for endpoint in endpoints:
             m.get(endpoint["base_url"] + endpoint["path"], json=endpoint["response"])
 
+        # Confluence.get_spacesテスト用（キーを指定した検索）
+        # クエリパラメータ keys で指定されたスペースだけを、テストデータのスペースから返す
+        all_spaces = [
+            space
+            for file_name in ["spaces_response_multi_space_page1.json", "spaces_response_multi_space_page2.json"]
+            for space in json.load(open(Path(BASE_DIR / "tests/testdata" / file_name)))["results"]
+        ]
+
+        def spaces_by_keys(request, context):
+            keys = request.qs["keys"][0].split(",")
+            return {"results": [space for space in all_spaces if space["key"] in keys], "_links": {}}
+
+        m.get(
+            BASE_URL + V2_API_RELATIVE_PATH + "/spaces",
+            json=spaces_by_keys,
+            additional_matcher=lambda request: "keys" in request.qs,
+        )
+
+        # Confluence.get_pagesテスト用（ページIDを指定した本文付きの取得）
+        # クエリパラメータ id で指定されたページだけを、テストデータのページから返す
+        all_pages = [
+            page
+            for file_name in ["pages_response_page1.json", "pages_response_page2.json"]
+            for page in json.load(open(Path(BASE_DIR / "tests/testdata" / file_name)))["results"]
+        ]
+
+        def pages_by_ids(request, context):
+            ids = request.qs["id"][0].split(",")
+            pages = [page for page in all_pages if page["id"] in ids]
+            for page_id in ids:
+                if "-" in page_id:
+                    space_id, original_id = page_id.split("-")
+                    pages += [
+                        page
+                        for file_name in ["pages_response_page1.json", "pages_response_page2.json"]
+                        for page in space_pages(space_id, file_name)["results"]
+                        if page["id"] == page_id
+                    ]
+            return {"results": pages, "_links": {}}
+
+        m.get(BASE_URL + V2_API_RELATIVE_PATH + "/pages", json=pages_by_ids)
+
+        # Confluence.get_views, Confluence.get_viewersテスト用
+        # ページIDと日付によらず同じレスポンスを返す
+        for metric in ["views", "viewers"]:
+            m.get(
+                re.compile(re.escape(BASE_URL + V1_API_RELATIVE_PATH) + rf"/analytics/content/\d+/{metric}"),
+                json=json.load(open(Path(BASE_DIR / f"tests/testdata/{metric}_response.json"))),
+            )
+
         yield m
 
 
+class MockConfluenceHandler(BaseHTTPRequestHandler):
+    """MockConfluenceHandler
+
+    ベンチマーク用のConfluenceモックサーバのリクエストハンドラです。
+    スペース1件、ページ `server.page_count` 件を返し、analytics APIは `server.latency` 秒待ってから応答します。
+    analytics APIへの同時リクエスト数の最大を `server.max_in_flight` に記録します。
+    """
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/wiki/api/v2/spaces":
+            body = {"results": [{"id": "1111111", "key": "bench"}], "_links": {}}
+        elif re.fullmatch(r"/wiki/api/v2/spaces/\d+/pages", path):
+            body = {
+                "results": [
+                    {"id": str(i), "createdAt": "2024-01-01T00:00:00.000Z", "version": {"number": 1}}
+                    for i in range(self.server.page_count)
+                ],
+                "_links": {},
+            }
+        elif re.fullmatch(r"/wiki/rest/api/analytics/content/\d+/(views|viewers)", path):
+            with self.server.lock:
+                self.server.in_flight += 1
+                self.server.max_in_flight = max(self.server.max_in_flight, self.server.in_flight)
+            try:
+                time.sleep(self.server.latency)
+            finally:
+                with self.server.lock:
+                    self.server.in_flight -= 1
+            body = {"id": path.split("/")[-2], "count": 1}
+        else:
+            self.send_error(404)
+            return
+
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def mock_confluence_server():
+    """mock_confluence_server
+
+    ローカルで実際にHTTP通信を受け付けるConfluenceモックサーバを起動します。
+    requests_mockと違い、通信の待ち時間を伴うため、並行実行の効果を計測できます。
+
+    Examples:
+        >>> def test_benchmark(mock_confluence_server):
+        ...     mock_confluence_server.page_count = 100
+        ...     base_url = mock_confluence_server.base_url
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockConfluenceHandler)
+    server.daemon_threads = True
+    server.page_count = 10
+    server.latency = 0.01
+    server.lock = threading.Lock()
+    server.in_flight = 0
+    server.max_in_flight = 0
+    server.base_url = f"http://127.0.0.1:{server.server_address[1]}/"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
 @pytest.fixture
 def v1_rest_client():
     v1_client = RESTClient(
@@ -151,9 +314,12 @@ def v1_rest_client():
 
 @pytest.fixture
 def v2_rest_client():
-    v2_client = RESTClient(
+    from load.clients import ConfluenceRESTClient, ConfluenceV2CursorPagenator
+
+    v2_client = ConfluenceRESTClient(
         base_url=BASE_URL + V2_API_RELATIVE_PATH,
         headers={"Accept": "application/json"},
+        paginator=ConfluenceV2CursorPagenator(),
     )
     with patch("load.clients.v2_client", v2_client):
         yield v2_client
@@ -0,0 +1,209 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from dlt.common import jsonpath
+from dlt.sources.helpers.rest_client import RESTClient
+from dlt.sources.helpers.rest_client.paginators import BaseReferencePaginator
+from requests import Request, Response
+
+from tests.conftest import V1_API_RELATIVE_PATH, V2_API_RELATIVE_PATH
+
+@pytest.fixture
+def local_rest_clients(mock_confluence_server, setup_mocks, monkeypatch):
+    """local_rest_clients
+    confluence sourceが使うクライアントを、ローカルのモックサーバ向けのものに差し替えます。
+    """
+    from load.clients import ConfluenceRESTClient, ConfluenceV2CursorPagenator
+
+    v1_client = RESTClient(base_url=mock_confluence_server.base_url + V1_API_RELATIVE_PATH)
+    v2_client = ConfluenceRESTClient(
+        base_url=mock_confluence_server.base_url + V2_API_RELATIVE_PATH,
+        paginator=ConfluenceV2CursorPagenator(),
+    )
+    monkeypatch.setattr("load.confluence.v1_client", v1_client)
+    monkeypatch.setattr("load.confluence.v2_client", v2_client)
+    return v1_client, v2_client
+
+
+class LegacyCursorPagenator(BaseReferencePaginator):
+    """LegacyCursorPagenator
+    比較用の、書き換え前のConfluenceV2CursorPagenatorの実装
+    """
+    def update_state(self, response, data=None):
+        values = jsonpath.find_values("_links.next", response.json())
+        next_path = values[0] if values else None
+        self._next_reference = next_path.split("cursor=")[1].split("&")[0] if next_path else None
+
+    def update_request(self, request):
+        if request.params is None:
+            request.params = {}
+        request.params["cursor"] = self._next_reference
+
+
+def make_page_responses(page_count, results_per_page=25):
+    """ページ一覧APIのレスポンスを模したResponseをpage_count件作成する"""
+    responses = []
+    for i in range(page_count):
+        body = {
+            "results": [
+                {
+                    "id": str(i * results_per_page + j),
+                    "status": "current",
+                    "title": f"page {i}-{j}",
+                    "spaceId": "1111111",
+                    "createdAt": "2024-01-01T00:00:00.000Z",
+                    "version": {"number": 1, "createdAt": "2024-01-01T00:00:00.000Z"},
+                }
+                for j in range(results_per_page)
+            ],
+            "_links": {"next": f"/wiki/api/v2/spaces/1111111/pages?limit=250&cursor=cursor-{i}"},
+        }
+        response = Response()
+        response.status_code = 200
+        response.url = "https://api.example.com/wiki/api/v2/spaces/1111111/pages?limit=250"
+        response._content = json.dumps(body).encode()
+        responses.append(response)
+    return responses
+
+
+# 本文付きのページ一覧のレスポンスを読み、ピークRSSの増分を出力するスクリプト
+# 他の測定の影響を受けないよう、測定ごとに別のプロセスで実行する
+MEASURE_PEAK_RSS_SCRIPT = """
+import json, resource, sys
+from requests import Response
+from dlt.sources.helpers.rest_client import RESTClient
+from load.streaming import RESULT, iter_json_results
+
+mode, path = sys.argv[1:]
+baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+with open(path, "rb") as f:
+    if mode == "decode_all":
+        response = Response()
+        response.status_code = 200
+        response.raw = f
+        count = len(RESTClient("https://api.example.com").extract_response(response, "results"))
+    else:
+        count = sum(1 for kind, page in iter_json_results(f) if kind == RESULT)
+peak_kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+print(json.dumps({"count": count, "peak_mib": peak_kib / 1024}))
+"""
+
+
+def write_large_pages_response(path, page_count=250, body_size=200_000):
+    """本文付きのページ一覧APIを模した、約50MBのレスポンスボディをファイルに書き出す"""
+    html = "<p>" + "x" * (body_size - 7) + "</p>"
+    with open(path, "w") as f:
+        f.write('{"results": [')
+        for i in range(page_count):
+            if i > 0:
+                f.write(",")
+            json.dump(
+                {
+                    "id": str(i),
+                    "status": "current",
+                    "title": f"page {i}",
+                    "version": {"number": 1},
+                    "body": {"storage": {"value": html, "representation": "storage"}},
+                },
+                f,
+            )
+        f.write('], "_links": {"base": "https://api.example.com/wiki"}}')
+
+
+@pytest.mark.benchmark
+class TestBenchmark:
+
+    def test__stream_page_bodies__peak_rss(self, tmp_path):
+        """test__stream_page_bodies__peak_rss
+        約50MBのページ一覧のレスポンスを読むときのピークRSSが、
+        全体をデコードする場合よりストリーミングでデコードする場合の方が小さいことを確認する
+        """
+        response_path = tmp_path / "pages.json"
+        write_large_pages_response(response_path)
+        size_mib = response_path.stat().st_size / 1024 / 1024
+
+        src_dir = Path(__file__).resolve().parent.parent
+        peaks = {}
+        for mode in ["decode_all", "stream"]:
+            output = subprocess.run(
+                [sys.executable, "-c", MEASURE_PEAK_RSS_SCRIPT, mode, str(response_path)],
+                capture_output=True, check=True, text=True, env={**os.environ, "PYTHONPATH": str(src_dir)},
+            ).stdout
+            result = json.loads(output.splitlines()[-1])
+            assert result["count"] == 250
+            peaks[mode] = result["peak_mib"]
+            print(f"{mode}: peak RSS +{peaks[mode]:.1f} MiB for a {size_mib:.1f} MiB response")
+
+        assert peaks["stream"] < peaks["decode_all"] / 4
+
+    def test__paginator__cpu_per_page(self):
+        """test__paginator__cpu_per_page
+        RESTClient.paginateの1ページ分の処理（データの抽出とページネーターの更新）のCPU時間が、
+        書き換え前のページネーターより短いことを確認する
+        """
+        from load.clients import ConfluenceRESTClient, ConfluenceV2CursorPagenator
+
+        page_count = 5000
+        cases = {
+            "legacy": (RESTClient("https://api.example.com"), LegacyCursorPagenator()),
+            "current": (ConfluenceRESTClient("https://api.example.com"), ConfluenceV2CursorPagenator()),
+        }
+        cpu_per_page = {}
+        for name, (client, paginator) in cases.items():
+            responses = make_page_responses(page_count)
+            request = Request(method="GET", url=responses[0].url, params={"limit": 250})
+            start = time.process_time()
+            for response in responses:
+                data = client.extract_response(response, "results")
+                paginator.update_state(response, data)
+                paginator.update_request(request)
+            cpu_per_page[name] = (time.process_time() - start) / page_count
+            assert request.params["cursor"] == f"cursor-{page_count - 1}"
+            print(f"{name}: {cpu_per_page[name] * 1e6:.1f} us/page")
+
+        assert cpu_per_page["current"] < cpu_per_page["legacy"]
+
+    def test__get_views__throughput_scales_with_workers(self, mock_confluence_server, local_rest_clients):
+        """test__get_views__throughput_scales_with_workers
+        views取得のリクエストが、並行数の分だけ同時に実行されることを確認する（スループットは表示のみ）
+
+        モックサーバはanalytics APIへの各リクエストに10msの遅延を入れて応答し、同時リクエスト数の最大を記録する。
+        所要時間はマシンの負荷で揺れるため、判定には使わない。
+        """
+        from load.confluence import confluence
+
+        mock_confluence_server.page_count = 50
+        mock_confluence_server.latency = 0.01
+        analytics_backfill_days = 3  # 50ページ × 4日 = 200リクエスト
+
+        throughputs = {}
+        max_in_flight = {}
+        for workers in [1, 2, 4, 8]:
+            mock_confluence_server.max_in_flight = 0
+            source = confluence(
+                [],
+                analytics_backfill_days,
+                analytics_max_workers=workers,
+                max_connections_per_host=workers,
+                max_requests_per_second=10000,
+            )
+            start = time.perf_counter()
+            rows = list(source.resources["views"])
+            elapsed = time.perf_counter() - start
+            throughputs[workers] = len(rows) / elapsed
+            max_in_flight[workers] = mock_confluence_server.max_in_flight
+            print(
+                f"workers={workers}: {len(rows)} requests in {elapsed:.2f}s ({throughputs[workers]:.1f} req/s), "
+                f"max in flight {max_in_flight[workers]}"
+            )
+
+        # 同時リクエスト数は並行数を超えず、並行数を増やせば実際に重なって実行される
+        assert max_in_flight[1] == 1
+        assert all(max_in_flight[workers] <= workers for workers in max_in_flight)
+        assert max_in_flight[8] > 1
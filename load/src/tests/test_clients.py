@@ -6,7 +6,7 @@ from unittest.mock import Mock
 
 from requests.models import Response, Request
 
-from load.clients import ConfluenceV2CursorPagenator
+from load.clients import ConfluenceRESTClient, ConfluenceV2CursorPagenator, cache_json
 
 @pytest.mark.usefixtures("mock_api_server", "setup_mocks")
 @pytest.mark.unit
@@ -40,6 +40,58 @@ class TestConfluenceV2CursorPagenator:
         assert paginator._next_reference is None
         assert paginator.has_next_page is False
 
+    def test__update_state__passes_through_query_params(self):
+        """test__update_state__passes_through_query_params
+        Paginatorのupdate_stateメソッド単体テスト
+        カーソルがクエリパラメータの先頭になくても取り出し、すべてのクエリパラメータを次のリクエストに引き継ぐ
+        """
+        paginator = ConfluenceV2CursorPagenator()
+        response = Mock(
+            Response,
+            json=lambda: {
+                "_links": {
+                    "next": "/wiki/api/v2/pages?space-id=12345678&cursor=abc%3D%3D&limit=250",
+                }
+            },
+        )
+        paginator.update_state(response)
+        assert paginator._next_reference == "abc=="
+
+        request = Request(method="GET", url="https://api.example.com/wiki/api/v2/pages", params={"limit": 250})
+        paginator.update_request(request)
+        assert request.params == {"space-id": "12345678", "cursor": "abc==", "limit": "250"}
+
+    def test__update_state__follow_next_url(self):
+        """test__update_state__follow_next_url
+        Paginatorのupdate_state, update_requestメソッド単体テスト
+        follow_next_url を指定した場合、"next" のリンクのURLをそのまま次のリクエストに使う
+        """
+        paginator = ConfluenceV2CursorPagenator(follow_next_url=True)
+        response = Response()
+        response.url = "https://api.example.com/wiki/api/v2/pages?limit=250"
+        response._content = json.dumps(
+            {"results": [], "_links": {"next": "/wiki/api/v2/pages?limit=250&cursor=test-cursor"}}
+        ).encode()
+        paginator.update_state(response)
+        assert paginator.has_next_page is True
+
+        request = Request(method="GET", url=response.url, params={"limit": 250})
+        paginator.update_request(request)
+        assert request.url == "https://api.example.com/wiki/api/v2/pages?limit=250&cursor=test-cursor"
+        assert request.params == {}
+
+    def test__cache_json(self):
+        """test__cache_json
+        同じレスポンスのJSONは1回だけデコードする
+        """
+        decode = Mock(return_value={"results": [1, 2]})
+        response = Mock(Response, json=decode)
+
+        assert cache_json(response) == {"results": [1, 2]}
+        assert response.json() == {"results": [1, 2]}
+        assert cache_json(response) == {"results": [1, 2]}
+        assert decode.call_count == 1
+
     def test__update_request__has_next_page(self):
         """test__update_request__has_next_page
         Paginatorのupdate_requestメソッド単体テスト
@@ -81,3 +133,28 @@ class TestConfluenceV2CursorPagenator:
         assert pages[1][0] == json.load(
             open(Path(BASE_DIR / "tests/testdata/cursor_response_page2.json"))
         )
+
+    def test__paginator__decodes_once(self, monkeypatch):
+        """test__paginator__decodes_once
+
+        ConfluenceRESTClientとPaginatorを用いたリクエストのテスト
+        データの抽出とPaginatorで、各レスポンスのJSONを1回だけデコードすることを確認する。
+        """
+        decode_count = 0
+        original_json = Response.json
+
+        def counting_json(self, **kwargs):
+            nonlocal decode_count
+            decode_count += 1
+            return original_json(self, **kwargs)
+
+        monkeypatch.setattr(Response, "json", counting_json)
+
+        client = ConfluenceRESTClient(
+            base_url="https://api.example.com/wiki/api/v2",
+            paginator=ConfluenceV2CursorPagenator(),
+        )
+        pages = list(client.paginate("/cursor-response"))
+
+        assert len(pages) == 2
+        assert decode_count == 2
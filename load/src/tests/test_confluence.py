@@ -2,6 +2,8 @@ import json
 from pathlib import Path
 import pytest
 
+import dlt
+
 @pytest.mark.usefixtures("mock_api_server", "setup_mocks")
 @pytest.mark.unit
 class TestConfluenceSource:
@@ -40,6 +42,25 @@ class TestConfluenceSource:
         spaces = list(get_spaces())
         assert len(spaces) == 1
 
+    def test__get_spaces__batched_keys(self, v2_rest_client, mock_api_server, caplog):
+        """test__get_spaces__batched_keys
+        Confluence.get_spacesのテスト
+        target_spaces のキーは重複を除いて1回のリクエストでまとめて検索し、見つからなかったキーを警告する
+        """
+        # :NOTE インポートをここから動かさないで！
+        from load.confluence import confluence
+
+        target_spaces = ["test-space-1", "test-space-3", "test-space-1", "unknown-space"]
+        sources = confluence(target_spaces, 0)
+
+        call_count = mock_api_server.call_count
+        spaces = list(sources.resources["spaces"])
+
+        assert [space["key"] for space in spaces] == ["test-space-1", "test-space-3"]
+        assert mock_api_server.call_count - call_count == 1
+        assert mock_api_server.last_request.qs["keys"] == ["test-space-1,test-space-3,unknown-space"]
+        assert "spaces not found: unknown-space" in caplog.text
+
     def test__get_pages(self, v2_rest_client):
         """test__get_pages
         Confluence.get_pagesのテスト
@@ -64,9 +85,204 @@ class TestConfluenceSource:
             open(Path(BASE_DIR / "tests/testdata/pages_response_page2.json"))
         )
         actual_data = actual_data_page1["results"] + actual_data_page2["results"]
+        # 本文はpage_bodiesに保存するため、pagesには含めない
+        for page in actual_data:
+            del page["body"]
 
         assert pages == actual_data
 
+    def test__get_page_bodies(self, v2_rest_client):
+        """test__get_page_bodies
+        Confluence.get_page_bodiesのテスト
+        ページの本文を、ページIDとバージョンとともに返す
+        """
+        # :NOTE インポートをここから動かさないで！
+        from load.confluence import confluence
+
+        sources = confluence(["test-space-1"], 0)
+        page_bodies = list(sources.resources["page_bodies"])
+
+        assert [(body["page_id"], body["version"]) for body in page_bodies] == [
+            ("11111111", 3), ("2222222", 1), ("3333333", 2), ("4444444", 1),
+        ]
+        assert page_bodies[0]["body"]["storage"]["value"].startswith("<h1>Snowflake設計</h1>")
+
+    def test__get_page_bodies__incremental__first_run(self, v2_rest_client, monkeypatch):
+        """test__get_page_bodies__incremental__first_run
+        Confluence.get_page_bodiesのテスト
+        incremental_pages を指定し、状態が空の場合、全ページを取得して状態を保存する
+        """
+        # :NOTE インポートをここから動かさないで！
+        from load.confluence import confluence
+
+        state = {}
+        monkeypatch.setattr(dlt.current, "resource_state", lambda: state)
+
+        sources = confluence(["test-space-1"], 0, incremental_pages=True)
+        page_bodies = list(sources.resources["page_bodies"])
+
+        assert [body["page_id"] for body in page_bodies] == ["11111111", "2222222", "3333333", "4444444"]
+        assert all("value" in body["body"]["storage"] for body in page_bodies)
+        assert state["spaces"]["1111111"] == {
+            "versions": {"11111111": 3, "2222222": 1, "3333333": 2, "4444444": 1},
+        }
+
+    def test__get_page_bodies__incremental__changed_and_deleted(self, v2_rest_client, monkeypatch):
+        """test__get_page_bodies__incremental__changed_and_deleted
+        Confluence.get_page_bodiesのテスト
+        incremental_pages を指定した場合、ロード済みのバージョンと異なるページと、削除されたページのみを返す
+        """
+        # :NOTE インポートをここから動かさないで！
+        from load.confluence import confluence
+
+        state = {
+            "spaces": {
+                "1111111": {
+                    # 3333333と4444444は前回ロード時からバージョンが上がっている。9999999は削除された。
+                    "versions": {"11111111": 3, "2222222": 1, "3333333": 1, "9999999": 1},
+                }
+            }
+        }
+        monkeypatch.setattr(dlt.current, "resource_state", lambda: state)
+
+        sources = confluence(["test-space-1"], 0, incremental_pages=True)
+        page_bodies = list(sources.resources["page_bodies"])
+
+        assert [body["page_id"] for body in page_bodies] == ["3333333", "4444444", "9999999"]
+        assert page_bodies[-1] == {"page_id": "9999999", "_deleted": True}
+        assert state["spaces"]["1111111"]["versions"] == {"11111111": 3, "2222222": 1, "3333333": 2, "4444444": 1}
+
+    @pytest.mark.parametrize("incremental_pages", [False, True])
+    def test__get_page_bodies__parallel_spaces(self, v2_rest_client, monkeypatch, incremental_pages):
+        """test__get_page_bodies__parallel_spaces
+        Confluence.get_page_bodiesのテスト
+        max_parallel_spaces を指定して複数スペースを並行に取得しても、逐次取得と同じ結果を同じ順序で返す
+        """
+        # :NOTE インポートをここから動かさないで！
+        from load.confluence import confluence
+
+        results = {}
+        for max_parallel_spaces in [1, 4]:
+            state = {}
+            monkeypatch.setattr(dlt.current, "resource_state", lambda: state)
+            sources = confluence([], 0, incremental_pages=incremental_pages, max_parallel_spaces=max_parallel_spaces)
+            results[max_parallel_spaces] = (list(sources.resources["page_bodies"]), state)
+
+        page_bodies, state = results[1]
+        # 全6スペース × 4ページ。スペース 1111111 以外のページIDは `{space_id}-{元のID}`
+        assert len(page_bodies) == 24
+        assert {body["page_id"].split("-")[0] for body in page_bodies if "-" in body["page_id"]} == {
+            "2222222", "3333333", "4444444", "5555555", "6666666",
+        }
+        assert results[4] == results[1]
+
+    @pytest.mark.parametrize("incremental_pages", [False, True])
+    def test__get_page_bodies__stream_page_bodies(self, v2_rest_client, monkeypatch, incremental_pages):
+        """test__get_page_bodies__stream_page_bodies
+        Confluence.get_page_bodiesのテスト
+        stream_page_bodies を指定してレスポンスをストリーミングでデコードしても、同じページを返す
+        """
+        # :NOTE インポートをここから動かさないで！
+        from load.confluence import confluence
+
+        results = {}
+        for stream_page_bodies in [False, True]:
+            state = {}
+            monkeypatch.setattr(dlt.current, "resource_state", lambda: state)
+            sources = confluence(
+                [], 0, incremental_pages=incremental_pages, stream_page_bodies=stream_page_bodies,
+            )
+            # 1回にyieldする単位が変わり、dltがスペースのバッチをまたいで取り出す順序が変わるため、ページIDで並べて比較する
+            page_bodies = sorted(sources.resources["page_bodies"], key=lambda body: body["page_id"])
+            results[stream_page_bodies] = (page_bodies, state)
+
+        assert len(results[True][0]) == 24
+        assert results[True] == results[False]
+
+    @pytest.mark.parametrize("resource_name", ["views", "viewers"])
+    def test__get_analytics__concurrent(self, v1_rest_client, v2_rest_client, resource_name):
+        """test__get_analytics__concurrent
+        Confluence.get_views, Confluence.get_viewersのテスト
+        並行数を変えても、取得結果とその並び順が逐次実行と一致する
+        """
+        # :NOTE インポートをここから動かさないで！
+        from load.confluence import confluence
+
+        serial = list(confluence(["test-space-1"], 1, analytics_max_workers=1).resources[resource_name])
+        concurrent = list(confluence(["test-space-1"], 1, analytics_max_workers=4).resources[resource_name])
+
+        # 4ページ × 2日分
+        assert len(serial) == 8
+        assert sorted((row["page_id"], row["date"]) for row in serial) == sorted(
+            (page_id, date)
+            for page_id in ["11111111", "2222222", "3333333", "4444444"]
+            for date in ["2024-02-01", "2024-01-31"]
+        )
+        assert concurrent == serial
+
+    def test__get_views__skip_dates_before_created(self, v1_rest_client, v2_rest_client, monkeypatch):
+        """test__get_views__skip_dates_before_created
+        Confluence.get_viewsのテスト
+        ページの作成日よりも前の日付は取得しない
+        """
+        # :NOTE インポートをここから動かさないで！
+        from load.confluence import confluence
+
+        monkeypatch.setattr(
+            "load.confluence.get_date_range",
+            lambda days_num, tz_name="UTC": [{"date": "2021-07-21"}, {"date": "2021-07-20"}, {"date": "2021-07-19"}],
+        )
+
+        views = list(confluence(["test-space-1"], 2).resources["views"])
+
+        # 4444444は2021-07-20に作成されている
+        assert [row["date"] for row in views if row["page_id"] == "4444444"] == ["2021-07-21", "2021-07-20"]
+        assert len(views) == 11
+
+    def test__get_views__incremental(self, v1_rest_client, v2_rest_client, monkeypatch):
+        """test__get_views__incremental
+        Confluence.get_viewsのテスト
+        incremental_analytics を指定した場合、ロード済みの日付は取得せず、状態を昨日（確定した最後の日）まで進める
+        """
+        # :NOTE インポートをここから動かさないで！
+        from load.confluence import confluence
+
+        state = {"spaces": {"1111111": {"11111111": "2024-01-31", "9999999": "2024-01-31"}}}
+        monkeypatch.setattr(dlt.current, "resource_state", lambda: state)
+
+        views = list(confluence(["test-space-1"], 1, incremental_analytics=True).resources["views"])
+
+        assert [row["date"] for row in views if row["page_id"] == "11111111"] == ["2024-02-01"]
+        assert len(views) == 7
+        # 一覧から消えたページの状態は削除される
+        assert state["spaces"]["1111111"] == {
+            "11111111": "2024-01-31",
+            "2222222": "2024-01-31",
+            "3333333": "2024-01-31",
+            "4444444": "2024-01-31",
+        }
+
+    def test__get_views__incremental__same_day(self, v1_rest_client, v2_rest_client, monkeypatch):
+        """test__get_views__incremental__same_day
+        Confluence.get_viewsのテスト
+        同じ日に2回実行した場合、確定した日付は取得し直さず、まだ確定していない今日の閲覧数は毎回取得し直す。
+        以前のバージョンが今日まで進めた状態でも、今日は取得し直す
+        """
+        # :NOTE インポートをここから動かさないで！
+        from load.confluence import confluence
+
+        state = {"spaces": {"1111111": {"11111111": "2024-02-01"}}}
+        monkeypatch.setattr(dlt.current, "resource_state", lambda: state)
+
+        first = list(confluence(["test-space-1"], 1, incremental_analytics=True).resources["views"])
+        second = list(confluence(["test-space-1"], 1, incremental_analytics=True).resources["views"])
+
+        assert [row["date"] for row in first if row["page_id"] == "11111111"] == ["2024-02-01"]
+        assert sorted({row["date"] for row in first}) == ["2024-01-31", "2024-02-01"]
+        assert {row["date"] for row in second} == {"2024-02-01"}
+        assert sorted(row["page_id"] for row in second) == sorted(state["spaces"]["1111111"])
+        assert set(state["spaces"]["1111111"].values()) == {"2024-01-31"}
+
     @pytest.mark.parametrize(
             [
                 "days_num",
@@ -96,3 +312,40 @@ class TestConfluenceSource:
         actual = get_date_range(days_num, tz_name)
         assert actual == expected
 
+
+    @pytest.mark.parametrize(
+            [
+                "space_keys",
+                "max_keys",
+                "max_length",
+                "expected"
+            ],
+            [
+                pytest.param(
+                    ["a", "b", "a", "c"],
+                    250,
+                    2000,
+                    [["a", "b", "c"]]
+                ),
+                pytest.param(
+                    ["a", "b", "c"],
+                    2,
+                    2000,
+                    [["a", "b"], ["c"]]
+                ),
+                pytest.param(
+                    ["aaa", "bbb", "ccc"],
+                    250,
+                    7,
+                    [["aaa", "bbb"], ["ccc"]]
+                ),
+            ]
+    )
+    def test__batch_space_keys(self, space_keys, max_keys, max_length, expected):
+        """test__batch_space_keys
+        Confluence.batch_space_keysのテスト
+        """
+        # :NOTE インポートをここから動かさないで！
+        from load.confluence import batch_space_keys
+
+        assert batch_space_keys(space_keys, max_keys, max_length) == expected
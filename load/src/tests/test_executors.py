@@ -0,0 +1,129 @@
+import threading
+import time
+
+import pytest
+
+from load.executors import chain_concurrently, map_ordered
+
+@pytest.mark.unit
+class TestMapOrdered:
+
+    def test__map_ordered__serial(self):
+        """test__map_ordered__serial
+        max_workers=1 の場合、呼び出し元のスレッドで逐次実行する
+        """
+        thread_ids = set()
+
+        def func(x):
+            thread_ids.add(threading.get_ident())
+            return x * 2
+
+        assert list(map_ordered(func, range(5))) == [0, 2, 4, 6, 8]
+        assert thread_ids == {threading.get_ident()}
+
+    def test__map_ordered__keeps_order(self):
+        """test__map_ordered__keeps_order
+        完了順がばらばらでも、入力と同じ順序で結果を返す
+        """
+        def func(x):
+            time.sleep(0.01 * (5 - x))
+            return x
+
+        assert list(map_ordered(func, range(5), max_workers=5)) == [0, 1, 2, 3, 4]
+
+    def test__map_ordered__bounded_buffer(self):
+        """test__map_ordered__bounded_buffer
+        入力イテレータはbuffer_size件を超えて先読みされない
+        """
+        consumed = []
+
+        def items():
+            for i in range(100):
+                consumed.append(i)
+                yield i
+
+        results = map_ordered(lambda x: x, items(), max_workers=2, buffer_size=4)
+        assert next(results) == 0
+        assert len(consumed) <= 4
+        assert list(results) == list(range(1, 100))
+
+
+@pytest.mark.unit
+class TestChainConcurrently:
+
+    def test__chain_concurrently__keeps_order(self):
+        """test__chain_concurrently__keeps_order
+        各イテラブルを並行に読み進めても、itertools.chainと同じ順序で返す
+        """
+        def slow_range(start, delay):
+            for i in range(start, start + 3):
+                time.sleep(delay)
+                yield i
+
+        factories = [lambda: slow_range(0, 0.03), lambda: slow_range(3, 0.01), lambda: slow_range(6, 0)]
+        assert list(chain_concurrently(factories, max_workers=3)) == list(range(9))
+
+    def test__chain_concurrently__bounded_buffer(self):
+        """test__chain_concurrently__bounded_buffer
+        同時に読み進めるイテラブルはmax_workers個まで、先読みはイテラブルごとにbuffer_size件までに制限される
+        """
+        consumed = []
+
+        def items(n):
+            for i in range(100):
+                consumed.append((n, i))
+                yield i
+
+        results = chain_concurrently([lambda n=n: items(n) for n in range(5)], max_workers=2, buffer_size=2)
+        assert next(results) == 0
+        time.sleep(0.1)
+        # 各イテラブルはバッファ分と、putで待機中の1件までしか読み進めない
+        assert {n for n, _ in consumed} <= {0, 1}
+        assert len(consumed) <= 2 * (2 + 2)
+        assert len(list(results)) == 499
+
+    def test__chain_concurrently__propagates_error(self):
+        """test__chain_concurrently__propagates_error
+        ワーカースレッドで発生した例外は、呼び出し元に送出される
+        """
+        def failing():
+            yield 1
+            raise ValueError("failed")
+
+        results = chain_concurrently([failing, lambda: range(3)], max_workers=2)
+        assert next(results) == 1
+        with pytest.raises(ValueError):
+            list(results)
+
+    @pytest.mark.parametrize("failure", ["error", "close"])
+    def test__chain_concurrently__stops_with_full_buffer(self, failure):
+        """test__chain_concurrently__stops_with_full_buffer
+        先頭のイテラブルが失敗する（または呼び出し元が途中で閉じる）とき、後続のイテラブルのバッファが埋まっていても、
+        終端を入れようと待ち続けずに終了する
+        """
+        buffer_size = 2
+
+        def first():
+            yield 0
+            time.sleep(0.3)
+            if failure == "error":
+                raise ValueError("failed")
+            yield 1
+
+        def run():
+            # 後続のイテラブルは、先頭の失敗より前にちょうどbuffer_size件を読み終え、終端を入れようとしている
+            results = chain_concurrently([first, lambda: range(buffer_size)], max_workers=2, buffer_size=buffer_size)
+            assert next(results) == 0
+            if failure == "error":
+                with pytest.raises(ValueError):
+                    list(results)
+            else:
+                time.sleep(0.1)
+                results.close()
+            finished.set()
+
+        finished = threading.Event()
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        thread.join(5)
+        assert finished.is_set(), "chain_concurrently did not return"
@@ -0,0 +1,125 @@
+import io
+
+import pytest
+
+from requests import PreparedRequest, Response
+from requests.adapters import HTTPAdapter
+
+from load.ratelimit import RateLimitedAdapter, RateLimiter
+
+class FakeClock:
+    """FakeClock
+    sleepで時刻が進むだけの時計。実際には待機しない。
+    """
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def make_response(status_code, headers=None):
+    response = Response()
+    response.status_code = status_code
+    response.headers.update(headers or {})
+    response.raw = io.BytesIO(b"")
+    return response
+
+
+@pytest.mark.unit
+class TestRateLimiter:
+
+    def test__acquire__paces_requests(self):
+        """test__acquire__paces_requests
+        バケットが空になったら、レートに応じた間隔で送信する
+        """
+        clock = FakeClock()
+        limiter = RateLimiter(max_rate=2, burst=1, clock=clock, sleep=clock.sleep)
+
+        for _ in range(3):
+            limiter.acquire()
+
+        assert clock.now == pytest.approx(1.0)
+        assert limiter.stats["requests"] == 3
+        assert limiter.stats["wait_seconds"] == pytest.approx(1.0)
+
+    def test__update__throttled_with_retry_after(self):
+        """test__update__throttled_with_retry_after
+        429が返ったら、レートを半分にし、Retry-Afterの秒数以上すべての送信を止める
+        """
+        clock = FakeClock()
+        limiter = RateLimiter(max_rate=10, backoff_base=1.0, clock=clock, sleep=clock.sleep)
+
+        wait = limiter.update(make_response(429, {"Retry-After": "3"}))
+        assert 3 <= wait <= 4
+        assert limiter.rate == 5
+        assert limiter.stats["throttles"] == 1
+
+        limiter.acquire()
+        assert clock.now == pytest.approx(wait)
+
+    def test__update__throttled_without_retry_after(self):
+        """test__update__throttled_without_retry_after
+        Retry-Afterがなければ、指数バックオフの上限以内で待機する
+        """
+        limiter = RateLimiter(max_rate=10, backoff_base=1.0, backoff_max=60.0)
+
+        assert 0 <= limiter.update(make_response(429), attempt=3) <= 8
+        assert 0 <= limiter.update(make_response(429), attempt=10) <= 60
+
+    def test__update__adjusts_rate(self):
+        """test__update__adjusts_rate
+        成功したらmax_rateまで少しずつレートを上げ、X-RateLimit-NearLimitが返ったら下げる
+        """
+        limiter = RateLimiter(max_rate=10, min_rate=1)
+        limiter.update(make_response(429, {"Retry-After": "0"}))
+        assert limiter.rate == 5
+
+        limiter.update(make_response(200))
+        assert limiter.rate == pytest.approx(5.2)
+
+        limiter.update(make_response(200, {"X-RateLimit-NearLimit": "true"}))
+        assert limiter.rate == pytest.approx(4.68)
+
+        for _ in range(100):
+            limiter.update(make_response(200))
+        assert limiter.rate == 10
+
+
+@pytest.mark.unit
+class TestRateLimitedAdapter:
+
+    def test__send__retries_throttled_request(self, monkeypatch):
+        """test__send__retries_throttled_request
+        スロットリングされたリクエストは、待機してから再送する
+        """
+        responses = [make_response(429, {"Retry-After": "0"}), make_response(200)]
+        monkeypatch.setattr(HTTPAdapter, "send", lambda self, request, **kwargs: responses.pop(0))
+
+        clock = FakeClock()
+        limiter = RateLimiter(max_rate=10, clock=clock, sleep=clock.sleep)
+        adapter = RateLimitedAdapter(limiter)
+
+        response = adapter.send(PreparedRequest())
+
+        assert response.status_code == 200
+        assert limiter.stats["requests"] == 2
+        assert limiter.stats["throttles"] == 1
+
+    def test__send__gives_up_after_max_retries(self, monkeypatch):
+        """test__send__gives_up_after_max_retries
+        max_throttle_retries回再送してもスロットリングされる場合は、そのレスポンスを返す
+        """
+        monkeypatch.setattr(HTTPAdapter, "send", lambda self, request, **kwargs: make_response(429, {"Retry-After": "0"}))
+
+        clock = FakeClock()
+        limiter = RateLimiter(max_rate=10, clock=clock, sleep=clock.sleep)
+        adapter = RateLimitedAdapter(limiter, max_throttle_retries=2)
+
+        response = adapter.send(PreparedRequest())
+
+        assert response.status_code == 429
+        assert limiter.stats["requests"] == 3
@@ -0,0 +1,49 @@
+import io
+import json
+
+import pytest
+
+from load.streaming import NEXT_LINK, RESULT, CountingReader, iter_json_results
+
+@pytest.mark.unit
+class TestIterJsonResults:
+
+    def test__iter_json_results(self):
+        """test__iter_json_results
+        results配列の要素を1件ずつ、ネストしたオブジェクトも含めてデコードし、最後に次のページへのリンクを返す
+        """
+        body = {
+            "results": [
+                {"id": "1", "version": {"number": 2}, "labels": ["a", "b"], "score": 1.5},
+                {"id": "2", "version": {"number": 1}, "labels": [], "score": None},
+            ],
+            "_links": {"next": "/wiki/api/v2/pages?cursor=test-cursor", "base": "https://api.example.com/wiki"},
+        }
+        events = list(iter_json_results(io.BytesIO(json.dumps(body).encode())))
+
+        assert events == [
+            (RESULT, body["results"][0]),
+            (RESULT, body["results"][1]),
+            (NEXT_LINK, "/wiki/api/v2/pages?cursor=test-cursor"),
+        ]
+
+    def test__iter_json_results__no_next_link(self):
+        """test__iter_json_results__no_next_link
+        次のページへのリンクがなければ、results配列の要素だけを返す
+        """
+        body = {"results": [{"id": "1"}], "_links": {"base": "https://api.example.com/wiki"}}
+        events = list(iter_json_results(io.BytesIO(json.dumps(body).encode())))
+
+        assert events == [(RESULT, {"id": "1"})]
+
+    def test__counting_reader(self):
+        """test__counting_reader
+        読み出したバイト数を数え、読み出すたびにon_readを呼ぶ
+        """
+        sizes = []
+        reader = CountingReader(io.BytesIO(b"0123456789"), sizes.append)
+
+        assert reader.read(4) == b"0123"
+        assert reader.read() == b"456789"
+        assert reader.bytes_read == 10
+        assert sizes == [4, 6]
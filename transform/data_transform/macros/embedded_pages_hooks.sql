@@ -0,0 +1,34 @@
+{% macro delete_stale_embeddings() %}
+    {#-
+        削除されたページと、本文が空になったページのチャンクを削除する。
+        delete+insertでは、チャンクがなくなったページの行は置き換えられないため、post-hookで削除する。
+    -#}
+    delete from {{ this }}
+    where page_id not in (
+        select
+            t1.page_id
+        from
+            {{ ref('page_html_to_markdown') }} t1
+            inner join {{ ref('cleansed_pages') }} t2
+                on t1.page_id = t2.page_id
+        where
+            array_size(t1.chunked_contents) > 0
+    )
+{% endmacro %}
+
+{% macro log_embedding_counts() %}
+    {#-
+        今回の実行で、埋め込みを再利用したチャンクと計算し直したチャンクの件数をログに出力する。
+        再利用したチャンクはembedded_atが前回以前の日時のまま、計算し直したチャンクはupdated_atと同じ日時になる。
+        今回の実行で書き込んだ行（updated_atがdbtの実行開始より後の行）だけを数えるため、変更がなければどちらも0件になる。
+    -#}
+    {% if execute %}
+        {% set results = run_query(
+            "select coalesce(count_if(embedded_at < updated_at), 0), coalesce(count_if(embedded_at = updated_at), 0)"
+            ~ " from " ~ this
+            ~ " where updated_at >= '" ~ run_started_at.isoformat() ~ "'::timestamp_ltz"
+        ) %}
+        {% set row = results.rows[0] %}
+        {% do log(this.identifier ~ ": reused " ~ row[0] ~ " embeddings, recomputed " ~ row[1] ~ " embeddings", info=True) %}
+    {% endif %}
+{% endmacro %}
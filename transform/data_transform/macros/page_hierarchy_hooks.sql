@@ -0,0 +1,15 @@
+{% macro delete_removed_pages() %}
+    {#-
+        削除されたページ（currentでなくなったページを含む）の行を削除する。
+        delete+insertでは、なくなったページの行は置き換えられないため、post-hookで削除する。
+    -#}
+    delete from {{ this }}
+    where page_id not in (
+        select
+            id
+        from
+            {{ source('confluence', 'pages') }}
+        where
+            status in ('current')
+    )
+{% endmacro %}
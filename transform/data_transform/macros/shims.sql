@@ -0,0 +1,38 @@
+{#-
+    SnowflakeとDuckDBで構文が違う処理を、アダプタごとに切り替えるマクロ。
+    関数で置き換えられるもの（iff, sha2など）は、DuckDBの接続に登録する互換レイヤー（transform/src/transform/duckdb_shims.py）にある。
+-#}
+
+{% macro flatten(input, alias) %}
+    {#-
+        配列の各要素を行に展開する（Snowflakeの lateral flatten）。
+        展開した要素は <alias>.VALUE、配列内の位置（0始まり）は <alias>.INDEX で参照する。
+        from句で、展開する配列を持つテーブルの後に置く。
+    -#}
+    {{ return(adapter.dispatch('flatten')(input, alias)) }}
+{% endmacro %}
+
+{% macro snowflake__flatten(input, alias) %}
+    , lateral flatten(input => {{ input }}) {{ alias }}
+{% endmacro %}
+
+{% macro duckdb__flatten(input, alias) %}
+    cross join lateral (
+        select
+            unnest({{ input }}) as VALUE,
+            generate_subscripts({{ input }}, 1) - 1 as INDEX
+    ) {{ alias }}
+{% endmacro %}
+
+{% macro empty_array() %}
+    {#- 空の配列（要素は文字列） -#}
+    {{ return(adapter.dispatch('empty_array')()) }}
+{% endmacro %}
+
+{% macro snowflake__empty_array() %}
+    array_construct()
+{% endmacro %}
+
+{% macro duckdb__empty_array() %}
+    []::varchar[]
+{% endmacro %}
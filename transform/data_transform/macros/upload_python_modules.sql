@@ -0,0 +1,21 @@
+{% macro upload_python_modules() %}
+    {{ return(adapter.dispatch('upload_python_modules')()) }}
+{% endmacro %}
+
+{% macro default__upload_python_modules() %}
+    {#- DuckDBではmodule_pathsからimportするため、アップロードは不要 -#}
+{% endmacro %}
+
+{% macro snowflake__upload_python_modules() %}
+    {#-
+        Pythonモデルがimportするモジュール（transform/src/transform/confluence_markdown.py）をステージにアップロードする。
+        ファイルのパスはdata_transformディレクトリからの相対パスなので、dbtはdata_transformディレクトリで実行すること。
+    -#}
+    {% if execute %}
+        {% set stage = env_var('DBT__PYTHON_MODULES_STAGE', 'python_modules') %}
+        {% do run_query("create stage if not exists " ~ stage) %}
+        {% do run_query(
+            "put file://../src/transform/confluence_markdown.py @" ~ stage ~ " auto_compress = false overwrite = true"
+        ) %}
+    {% endif %}
+{% endmacro %}
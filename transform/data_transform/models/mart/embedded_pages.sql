@@ -1,19 +1,114 @@
+-- depends_on: {{ ref('cleansed_pages') }}
+{#- post_hookはプロジェクトのマクロを呼ぶため、ymlではなくモデルで設定する（ymlのconfigはパース時にマクロなしで描画される） -#}
+{{
+    config(
+        post_hook=[
+            "{{ delete_stale_embeddings() }}",
+            "{{ log_embedding_counts() }}",
+        ]
+    )
+}}
 with markdown as (
     select
         *
     from
         {{ ref('page_html_to_markdown') }}
+    {% if is_incremental() %}
+    -- 前回の実行以降にマークダウン化されたページだけを対象にする
+    where
+        processed_at > (select coalesce(max(markdown_processed_at), '1970-01-01'::timestamp_ltz) from {{ this }})
+    {% endif %}
 ),
 
-final as (
+chunks as (
     select
         t1.page_id,
-        t2.VALUE as chunk,
-        SNOWFLAKE.CORTEX.EMBED_TEXT_1024('multilingual-e5-large', t2.VALUE) as embedded_chunk,
+        t2.INDEX as chunk_index,
+        t2.VALUE['text']::string as chunk,
+        sha2(t2.VALUE['text']::string, 256) as chunk_hash,
+        t2.VALUE['breadcrumb'] as breadcrumb,
+        t2.VALUE['start']::number as chunk_start,
+        t2.VALUE['end']::number as chunk_end,
+        t1.processed_at as markdown_processed_at
+    from
+        markdown t1
+        {{ flatten('t1.chunked_contents', 't2') }}
+),
+
+{% if is_incremental() %}
+-- 同じページに同じ内容のチャンクがすでにあれば、その埋め込みを再利用する
+-- （チャンクの位置がずれても、内容が同じなら再利用できるよう、chunk_indexではなくchunk_hashで突き合わせる）
+existing_embeddings as (
+    select
+        page_id,
+        chunk_hash,
+        embedded_chunk,
+        embedded_at
+    from
+        {{ this }}
+    where
+        page_id in (select page_id from markdown)
+    qualify
+        row_number() over (partition by page_id, chunk_hash order by chunk_index) = 1
+),
+
+reused as (
+    select
+        t1.*,
+        t2.embedded_chunk,
+        t2.embedded_at
+    from
+        chunks t1
+        inner join existing_embeddings t2
+            on t1.page_id = t2.page_id
+            and t1.chunk_hash = t2.chunk_hash
+),
+
+recomputed as (
+    select
+        t1.*,
+        SNOWFLAKE.CORTEX.EMBED_TEXT_1024('multilingual-e5-large', t1.chunk) as embedded_chunk,
+        current_timestamp() as embedded_at
+    from
+        chunks t1
+        left join existing_embeddings t2
+            on t1.page_id = t2.page_id
+            and t1.chunk_hash = t2.chunk_hash
+    where
+        t2.chunk_hash is null
+),
+
+embeddings as (
+    select * from reused
+    union all
+    select * from recomputed
+),
+{% else %}
+embeddings as (
+    select
+        *,
+        SNOWFLAKE.CORTEX.EMBED_TEXT_1024('multilingual-e5-large', chunk) as embedded_chunk,
+        current_timestamp() as embedded_at
+    from
+        chunks
+),
+{% endif %}
+
+final as (
+    select
+        page_id,
+        chunk_index,
+        chunk,
+        chunk_hash,
+        breadcrumb,
+        chunk_start,
+        chunk_end,
+        embedded_chunk,
+        embedded_at,
+        markdown_processed_at,
         current_timestamp() as updated_at
     from
-        markdown t1,
-        lateral flatten(input => t1.chunked_contents) t2
+        embeddings
 )
 
 select *
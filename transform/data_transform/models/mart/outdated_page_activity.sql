@@ -1,5 +1,5 @@
 {% set report_window = env_var('DBT__REPORT_WINDOW', 14) %}
-{% set unique_views_threshold = env_var('DBT__UNIQUE_VIEWS_THRESHOLD', null) %}
+{% set unique_views_threshold = env_var('DBT__UNIQUE_VIEWS_THRESHOLD', 'null') %}
 
 with cleansed_pages as (
     select
@@ -11,24 +11,14 @@ with cleansed_pages as (
         age > {{ report_window }}
 ),
 
-cleansed_views as (
-    -- report_window日以内の閲覧数
+daily_activity as (
+    -- report_window日以内の日別の閲覧数・ユニーク閲覧者数
     select
         *
     from
-        {{ ref('cleansed_views') }}
+        {{ ref('page_daily_activity') }}
     where
-        date <= dateadd(day, {{ report_window }}, to_date({{ get_last_load_datetime() }}))
-),
-
-cleansed_viewers as (
-    -- report_window日以内のユニーク閲覧者数
-    select
-        *
-    from
-        {{ ref('cleansed_viewers') }}
-    where
-        date <= dateadd(day, {{ report_window }}, to_date({{ get_last_load_datetime() }}))
+        date > {{ dbt.dateadd('day', '-' ~ report_window, 'to_date(' ~ get_last_load_datetime() ~ ')') }}
 ),
 
 calc_viewers_threshold as (
@@ -36,31 +26,23 @@ calc_viewers_threshold as (
     select
         coalesce({{ unique_views_threshold }}, avg(t1.viewers)) as threshold
     from
-        cleansed_viewers t1
+        daily_activity t1
         inner join cleansed_pages t2
             on t1.page_id = t2.page_id
 ),
 
-agg_viewers as (
-    -- report_window日以内のユニーク閲覧者数平均
+agg_activity as (
+    -- 各ページのreport_window日以内の合計閲覧回数と、ユニーク閲覧者数の平均
     select
         page_id,
+        sum(views) as total_views,
         avg(viewers) as avg_viewers
     from
-        cleansed_viewers
-    group by
-        page_id
-),
-
-agg_views as (
-    -- 各ページのreport_window日以内の合計閲覧回数
-    select
-        page_id,
-        sum(viewers) as total_views
-    from
-        cleansed_viewers
+        daily_activity
     group by
         page_id
+    having
+        count(viewers) > 0
 ),
 
 final as (
@@ -73,19 +55,17 @@ final as (
         t1.updated_at,
         t1.path,
         t2.total_views,
-        t3.avg_viewers,
+        t2.avg_viewers,
         case
-            when t3.avg_viewers <= (select threshold from calc_viewers_threshold) and t1.days_since_last_updated <= {{ report_window }} then '見逃されたページ'
-            when t3.avg_viewers <= (select threshold from calc_viewers_threshold) and t1.days_since_last_updated > {{ report_window }} then 'アーカイブ'
-            when t3.avg_viewers > (select threshold from calc_viewers_threshold) and t1.days_since_last_updated <= {{ report_window }} then '活発なページ'
-            when t3.avg_viewers > (select threshold from calc_viewers_threshold) and t1.days_since_last_updated > {{ report_window }} then '安定したページ'
+            when t2.avg_viewers <= (select threshold from calc_viewers_threshold) and t1.days_since_last_updated <= {{ report_window }} then '見逃されたページ'
+            when t2.avg_viewers <= (select threshold from calc_viewers_threshold) and t1.days_since_last_updated > {{ report_window }} then 'アーカイブ'
+            when t2.avg_viewers > (select threshold from calc_viewers_threshold) and t1.days_since_last_updated <= {{ report_window }} then '活発なページ'
+            when t2.avg_viewers > (select threshold from calc_viewers_threshold) and t1.days_since_last_updated > {{ report_window }} then '安定したページ'
         end as activity_category
     from
         cleansed_pages t1
-        inner join agg_views t2
+        inner join agg_activity t2
             on t1.page_id = t2.page_id
-        inner join agg_viewers t3
-            on t1.page_id = t3.page_id
 )
 
 select *
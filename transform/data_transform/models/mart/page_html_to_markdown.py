@@ -1,173 +1,125 @@
-import re
-from bs4 import BeautifulSoup, NavigableString
+import logging
+import time
 
-from snowflake.snowpark.types import StringType, VariantType
-from snowflake.snowpark.functions import udf, current_timestamp
+import pandas as pd
+
+# transform/src/transform/confluence_markdown.py を、on-run-startでステージにアップロードしてimportする
+# （モデルのconfigのimportsを参照）。DuckDBで実行するときは、profiles.ymlのmodule_pathsからimportする
+from confluence_markdown import chunking, html_to_markdown
+
+
+def convert_batch(html_series):
+    """
+    HTMLのバッチをまとめてマークダウンにし、チャンクに分割します。
+    マークダウンとチャンクは、1ページごとに {"md_contents": ..., "chunked_contents": [...]} の形で返します。
+
+    Snowflakeからはバッチ単位で呼ばれるため、1行ごとの呼び出しのオーバーヘッドがなく、
+    マークダウンを一度SQLの値にしてからチャンク分割のUDFに渡し直すこともありません。
+    バッチごとの件数と処理時間をログに出力します。
+    """
+    start = time.perf_counter()
+    results = []
+    for html in html_series:
+        # NULLはNoneまたはNaNで渡される
+        md_contents = html_to_markdown(html) if isinstance(html, str) else None
+        chunked_contents = chunking(md_contents) if md_contents is not None else None
+        results.append(dict(md_contents=md_contents, chunked_contents=chunked_contents))
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    logging.getLogger("page_html_to_markdown").info(
+        f"converted {len(html_series)} pages in {elapsed_ms:.1f} ms "
+        f"({elapsed_ms / max(len(html_series), 1):.2f} ms/page)"
+    )
+    return pd.Series(results)
 
 
 def model(dbt, session):
     """ページのHTMLのマークダウン化
     
-    最後にこのモデルが実行された日以降に更新日付がついているページだけを対象にして、
-    delete&insertで更新する。
+    (page_id, version) がまだこのモデルにないページだけを対象にして、delete&insertで更新する。
+    各ページのバージョンはちょうど1回だけ変換され、1回の実行で変換するのは前回から更新されたページだけになる。
+
+    ページの更新日時（updated_at）は元のページの値をそのまま持ち、変換した日時はprocessed_atに記録する。
+
+    マークダウン化とチャンク分割の処理は、ローカルでテスト・計測できるように confluence_markdown モジュールにある。
     """
     dbt.config(
         materialized = "incremental",
         incremental_strategy = "delete+insert",
         unique_key = "page_id",
-        packages = ["snowflake-snowpark-python", "beautifulsoup4"]
+        packages = ["snowflake-snowpark-python", "pandas"]
     )
 
+    if "duckdb" in type(session).__module__:
+        return duckdb_model(dbt, session)
+    return snowpark_model(dbt, session)
+
+
+def snowpark_model(dbt, session):
+    """Snowflakeで実行するときの変換。ベクトル化UDFでHTMLをバッチごとに変換する。"""
+    from snowflake.snowpark.types import PandasSeriesType, StringType, VariantType
+    from snowflake.snowpark.functions import col, current_timestamp, pandas_udf
+
     # テーブルの読み出し
-    page_df = dbt.ref("cleansed_pages")
+    # 対象のページをメタデータで絞り込んでから、本文を結合する
+    page_df = dbt.ref("cleansed_pages").select("PAGE_ID", "VERSION", "UPDATED_AT")
     if dbt.is_incremental:
-        max_from_this = f"select max(updated_at) from {dbt.this}"
-        page_df = page_df.filter(page_df.updated_at >= session.sql(max_from_this).collect()[0][0])
-
-    # マークダウン化とチャンク分割のための関数定義
-    # FIXME:
-    # これらの関数をmodelの外に出そうとするとエラーになる。
-    # おそらくhtml_to_markdownでbs4をつかうのに、model関数の外部だとbs4が参照できなくなるせいなのだが、
-    # udfの定義でpackagesを追加したり、add_packages関数を呼ぶなりしてセッションにパッケージを紐づけようとしてもうまくいかず、、、
-    # 泣く泣くmodelの内部関数にして対応。。。テスタビリティが低いので、いつか直したい。
-    # - 発生したエラー： No module named 'main_modules'
-    # - 関連してそうなissue： https://discourse.getdbt.com/t/creating-udf-in-dbt-python-models-with-snowflake-as-database/8464
-    def html_to_markdown(html):
-        """
-        html文書をmarkdownにします。
-        マークダウンのチャンク化も同時に行います。
-        
-        #### markdown変換仕様
-        1. script, styleなどのタグや、コンフル固有のタグ(ac)を削除します。
-        2. よくみられるタグを処理します。
-            - 見出し
-            - リンク
-            - 太字
-            - 斜体
-            - リスト（箇条書きと連番）
-            - コードブロック
-        3. 余計な空白を削除します。
-        """
-        soup = BeautifulSoup(html, 'html.parser')
-        
-        # 不要なタグの削除
-        # 対象は、<script>, <style>, <ac:*>(Atlassian Confluenceの独自タグ)
-        for script in soup(["script", "style", "ac"]):
-            script.decompose()
-        
-        # hタグの置換
-        # 例：
-        #   <h1>タイトル</h1>
-        #   ↓
-        #   # タイトル
-        # 
-        # NOTE:
-        # 置換は、ヘッダー コンテンツの前にMarkdownヘッダー構文を挿入し、ヘッダー タグをアンラップする形で行います。
-        # 対象文字列の置換での実装は、同じ文字列が本文中に存在する場合でも同様に変換してしまうので、やめてください。
-        # 悪い例：
-        #   <h1>設計</h1>
-        #   <p>本ページは、設計についての記述です。</p>
-        #   ↓
-        #   # 設計
-        #   本ページは、
-        # 　# 設計
-        # 　についての記述です。
-        for i in range(6, 0, -1):
-            for header in soup.find_all(f'h{i}'):
-                header.insert_before("\n\n"+NavigableString(f"{'#' * i} "))
-                header.insert_after("\n\n")
-                header.unwrap()
-        
-        # Aタグの置換
-        for link in soup.find_all('a'):
-            link.replace_with(f"[{link.get_text()}]({link.get('href')})")
-        
-        # strongタグ, bタグの置換
-        for bold in soup.find_all(['strong', 'b']):
-            bold.replace_with(f"**{bold.get_text()}**")
-        
-        # emタグ、iタグの置換
-        for italic in soup.find_all(['em', 'i']):
-            italic.replace_with(f"*{italic.get_text()}*")
-        
-        # 箇条書きの置換
-        for ul in soup.find_all('ul'):
-            for li in ul.find_all('li'):
-                li.replace_with(f"\n- {li.get_text()}\n")
-            ul.unwrap()
-        
-        # 箇条書きの置換
-        for ol in soup.find_all('ol'):
-            for i, li in enumerate(ol.find_all('li'), 1):
-                li.replace_with(f"\n{i}. {li.get_text()}\n")
-            ol.unwrap()
-        
-        # コードブロックの置換
-        for code in soup.find_all('code'):
-            code.replace_with(f"`{code.get_text()}`")
-        
-        # 余計なスペースの削除
-        text = soup.get_text()
-        text = re.sub(r'\n\s*\n', '\n\n', text)
-        text = text.strip()
-        
-        return text
-
-    def __is_blank_or_none(string):
-        """
-        空白文字のみ、改行文字のみ、Noneの文字列を判定する。
-        """
-        # Noneの場合
-        if string is None or string == 'none':
-            return True
-        # 空白のみまたは改行のみの場合
-        if isinstance(string, str) and string.strip() == '':
-            return True
-        return False
-
-    def chunking(md_contents, level=1, CHUNK_SIZE=1000):
-        """チャンキング
-        SnowflakeのVector Embedding関数（EMBED_TEXT_768、EMBED_TEXT_1024）が受け取れるトークン数の上限は512であるため、
-        1トークンが日本語の2~4文字に相当すると仮定して、1,000~2,000文字程度の文章しかベクトル化ができない。
-
-        そこで、今回は以下のように文書をチャンクに分割する。
-        - ページ全体の文字数を取得する。もし、1,000文字以内ならば、チャンクに区切らない。
-        - 1,000文字を超える場合は、h1タグ区切りで文書を分割する。もしh1タグ単位で分割しても1,000文字を超える場合は、h2タグで分割する。
-        - これを繰り返して、もしh5タグで分割をしても1,000を超えてしまうのならば、残りを適当に1,000文字づつでパラグラフを切る。
-        """
-        results = []
-        if len(md_contents) <= CHUNK_SIZE:
-            # チャンクサイズ以下の長さなら、そのまま
-            results.extend([md_contents])
-        elif level <= 5:
-            # 分割するヘッダーレベルが5を超えていないなら、ヘッダごとに分割する。
-            # パターン：改行コードに続いて、#が指定された回数だけ連続し、一つの半角スペースの後に任意の文字列が続いて改行で終わる。
-            # NOTE:
-            # Pythonでは、以下のreplaceを、level変数をf文字列として直接中に書くこともできるはずだが、
-            # dbtモデルでは二重波括弧がJinjaとして解釈されてしまいエラーになる。なのであえてのreplace。
-            pattern_str = r'\n+#{level_keyword}\s.*?(?=\n|$)'.replace('level_keyword', str(level))
-            pattern = re.compile(pattern_str)
-            chunks = pattern.split(md_contents)
-            for chunk in chunks:
-                results.extend(chunking(chunk, level+1))
-        else:
-            # 分割時のレベルが5を超えていたら（#### のブロック単体でCHUNK_SIZEを超えてしまっていれば）、単純に文字長で切る
-            results.extend([md_contents[i: i+CHUNK_SIZE] for i in range(0, len(md_contents), CHUNK_SIZE)])
-
-        # 空白行で始まっていると、中身がないチャンクができてしまうことがある。
-        # 空白文字のみ、改行文字のみ、Noneのチャンクがあれば消す。
-        filtered_results = list(filter(lambda x: not __is_blank_or_none(x), results))
-
-        return filtered_results
-
-    # python関数のudf化
-    h2m = udf(html_to_markdown, return_type=StringType(), input_types=[StringType()], name="h2m")
-    m2c = udf(chunking, return_type=VariantType(), input_types=[StringType()], name="m2c")
-
-    # UDFをそれぞれの列にApply
-    page_df = page_df.with_column('MD_CONTENTS', h2m("HTML_CONTENTS"))
-    page_df = page_df.with_column('CHUNKED_CONTENTS', m2c("MD_CONTENTS"))
-    page_df = page_df.with_column('UPDATED_AT', current_timestamp())
-    result = page_df.select("PAGE_ID", "MD_CONTENTS", "CHUNKED_CONTENTS", "UPDATED_AT")
-
-    return result
+        # 変換済みの (page_id, version) を除く。
+        # 日時で絞り込むと、実行の直前に更新されたページの取りこぼしや、境界のページの再変換が起きるため、バージョンで比較する
+        converted_df = session.table(f"{dbt.this}").select("PAGE_ID", "VERSION")
+        page_df = page_df.join(converted_df, ["PAGE_ID", "VERSION"], how="leftanti")
+    body_df = dbt.ref("cleansed_page_bodies")
+    page_df = page_df.join(
+        body_df.select("PAGE_ID", "VERSION", "HTML_CONTENTS"), ["PAGE_ID", "VERSION"]
+    )
+
+    # python関数のベクトル化UDF化
+    # UDFからもconfluence_markdownをimportできるように、モデルと同じimportsを渡す
+    h2mc = pandas_udf(
+        convert_batch,
+        return_type=PandasSeriesType(VariantType()),
+        input_types=[PandasSeriesType(StringType())],
+        name="h2mc",
+        imports=dbt.config.get("imports"),
+    )
+
+    # UDFをApplyし、結果のオブジェクトからそれぞれの列を取り出す
+    page_df = page_df.with_column('CONVERTED', h2mc("HTML_CONTENTS"))
+    page_df = page_df.with_column('MD_CONTENTS', col("CONVERTED")["md_contents"].cast(StringType()))
+    page_df = page_df.with_column('CHUNKED_CONTENTS', col("CONVERTED")["chunked_contents"])
+    page_df = page_df.with_column('PROCESSED_AT', current_timestamp())
+    return page_df.select("PAGE_ID", "VERSION", "UPDATED_AT", "MD_CONTENTS", "CHUNKED_CONTENTS", "PROCESSED_AT")
+
+
+def duckdb_model(dbt, session):
+    """
+    DuckDBで実行するときの変換（dbt run --target duckdb）。
+    対象のページをArrowのテーブルに読み出してdbtのプロセス内で変換し、chunked_contentsは構造体の配列にする。
+    """
+    import pyarrow as pa
+
+    page_rel = dbt.ref("cleansed_pages").select("page_id, version, updated_at")
+    if dbt.is_incremental:
+        converted_rel = session.table(f"{dbt.this}").select("page_id, version")
+        page_rel = page_rel.join(converted_rel, "page_id, version", how="anti")
+    body_rel = dbt.ref("cleansed_page_bodies").select("page_id, version, html_contents")
+    # 0件でも列の型が変わらないよう、pandasではなくArrowのテーブルに読み出す
+    # （DuckDB 1.4以降の.arrow()はテーブルではなくRecordBatchReaderを返すため、read_allでテーブルにする）
+    page_table = page_rel.join(body_rel, "page_id, version").arrow()
+    if isinstance(page_table, pa.RecordBatchReader):
+        page_table = page_table.read_all()
+
+    converted = convert_batch(pd.Series(page_table.column("html_contents").to_pylist(), dtype=object))
+    chunk_type = pa.struct([
+        ("text", pa.string()),
+        ("breadcrumb", pa.list_(pa.string())),
+        ("start", pa.int64()),
+        ("end", pa.int64()),
+        ("tokens", pa.int64()),
+    ])
+    table = page_table.select(["page_id", "version", "updated_at"])
+    table = table.append_column("md_contents", pa.array([r["md_contents"] for r in converted], pa.string()))
+    table = table.append_column(
+        "chunked_contents", pa.array([r["chunked_contents"] for r in converted], pa.list_(chunk_type))
+    )
+    # dbt-duckdbは返した値をPythonの変数として読むため、DuckDBのリレーションではなくArrowのテーブルで返す
+    return session.from_arrow(table).project("*, current_timestamp as processed_at").arrow()
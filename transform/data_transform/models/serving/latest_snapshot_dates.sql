@@ -0,0 +1,35 @@
+with snapshot_dates as (
+    select
+        'recent_page_activity' as model_name,
+        agg_target_date
+    from
+        {{ ref('recent_page_activity') }}
+    group by
+        agg_target_date
+
+    union all
+
+    select
+        'outdated_page_activity' as model_name,
+        agg_target_date
+    from
+        {{ ref('outdated_page_activity') }}
+    group by
+        agg_target_date
+),
+
+final as (
+    -- martごとに、最新と1つ前の集計対象日を1行にする
+    select
+        model_name,
+        agg_target_date,
+        lag(agg_target_date) over (partition by model_name order by agg_target_date) as prev_agg_target_date,
+        (select max(load_id) from {{ ref('cleansed_loads') }}) as load_id
+    from
+        snapshot_dates
+    qualify
+        row_number() over (partition by model_name order by agg_target_date desc) = 1
+)
+
+select *
+from final
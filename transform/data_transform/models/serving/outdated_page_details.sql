@@ -0,0 +1,35 @@
+with snapshot_dates as (
+    select
+        *
+    from
+        {{ ref('latest_snapshot_dates') }}
+    where
+        model_name = 'outdated_page_activity'
+),
+
+final as (
+    -- 最新のスナップショットだけを、UIの一覧に表示する列に絞る
+    select
+        t1.agg_target_date,
+        t1.space_id,
+        t1.page_id,
+        t1.title,
+        t1.created_at,
+        t1.updated_at,
+        t1.path,
+        t1.total_views,
+        t1.avg_viewers,
+        t1.activity_category,
+        -- UIの一覧の並び順（活動状態・階層）。キーセットページネーションのカーソルに使う
+        row_number() over (
+            partition by t1.space_id
+            order by t1.activity_category desc nulls last, t1.path nulls last, t1.page_id
+        ) as row_order
+    from
+        {{ ref('outdated_page_activity') }} t1
+        inner join snapshot_dates t2
+            on t1.agg_target_date = t2.agg_target_date
+)
+
+select *
+from final
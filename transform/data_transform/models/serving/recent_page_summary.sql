@@ -0,0 +1,32 @@
+with snapshot_dates as (
+    select
+        *
+    from
+        {{ ref('latest_snapshot_dates') }}
+    where
+        model_name = 'recent_page_activity'
+),
+
+final as (
+    -- スペースごとに、最新と1つ前のスナップショットの件数を横持ちにする
+    select
+        t2.agg_target_date,
+        t1.space_id,
+        sum(iff(t1.agg_target_date = t2.agg_target_date, 1, 0)) as added_pages,
+        sum(iff(t1.agg_target_date = t2.agg_target_date and t1.activity_category = '活発なページ', 1, 0)) as hot_pages,
+        sum(iff(t1.agg_target_date = t2.agg_target_date and t1.activity_category = '見逃されたページ', 1, 0)) as unreaded_pages,
+        sum(iff(t1.agg_target_date = t2.prev_agg_target_date, 1, 0)) as prev_added_pages,
+        sum(iff(t1.agg_target_date = t2.prev_agg_target_date and t1.activity_category = '活発なページ', 1, 0)) as prev_hot_pages,
+        sum(iff(t1.agg_target_date = t2.prev_agg_target_date and t1.activity_category = '見逃されたページ', 1, 0)) as prev_unreaded_pages
+    from
+        {{ ref('recent_page_activity') }} t1
+        inner join snapshot_dates t2
+            on t1.agg_target_date = t2.agg_target_date
+            or t1.agg_target_date = t2.prev_agg_target_date
+    group by
+        t2.agg_target_date,
+        t1.space_id
+)
+
+select *
+from final
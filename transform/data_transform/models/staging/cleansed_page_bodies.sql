@@ -0,0 +1,18 @@
+with raw_page_bodies as (
+    select *
+    from {{ source('confluence', 'page_bodies') }}
+),
+
+final as (
+    select
+        page_id,
+        version,
+        body__storage__value as html_contents,
+        _dlt_load_id,
+        _dlt_id
+    from
+        raw_page_bodies
+)
+
+select *
+from final
@@ -8,10 +8,9 @@ with raw_pages as (
 ),
 
 loads as (
+    -- pagesは差分ロードされることがあるため、各ページのロードIDではなく最新のロード日時を基準にする
     select
-        *
-    from
-        {{ source('confluence', '_dlt_loads') }}
+        {{ get_last_load_datetime() }} as inserted_at
 ),
 
 cleansed as (
@@ -29,29 +28,34 @@ cleansed as (
         version__number as version,
         created_at,
         version__created_at as updated_at,
-        body__storage__value as html_contents,
-        sys_connect_by_path(title, ' / ') as path,
         _dlt_load_id,
         _dlt_id
     from
         raw_pages
-        start with parent_id is null
-        connect by
-            parent_id = prior page_id
-        order by
-            page_id
+),
+
+hierarchy as (
+    select
+        *
+    from
+        {{ ref('page_hierarchy') }}
 ),
 
 final as (
     select
         cleansed.*,
+        hierarchy.ancestor_ids,
+        hierarchy.depth,
+        hierarchy.path,
+        hierarchy.is_detached,
         loads.inserted_at,
-        datediff(day, cleansed.created_at,loads.inserted_at) as age,
-        datediff(day, greatest(cleansed.created_at, cleansed.updated_at), loads.inserted_at) as days_since_last_updated
+        {{ dbt.datediff('cleansed.created_at', 'loads.inserted_at', 'day') }} as age,
+        {{ dbt.datediff('greatest(cleansed.created_at, cleansed.updated_at)', 'loads.inserted_at', 'day') }} as days_since_last_updated
     from
         cleansed
-        inner join loads
-            on cleansed._dlt_load_id = loads.load_id
+        left join hierarchy
+            on cleansed.page_id = hierarchy.page_id
+        cross join loads
 )
 
 select *
@@ -0,0 +1,88 @@
+with cleansed_views as (
+    select
+        *
+    from
+        {{ ref('cleansed_views') }}
+),
+
+cleansed_viewers as (
+    select
+        *
+    from
+        {{ ref('cleansed_viewers') }}
+),
+
+{% if is_incremental() %}
+loaded_keys as (
+    -- 前回の実行以降にロードされた (page_id, date)
+    select
+        page_id,
+        date
+    from
+        cleansed_views
+    where
+        _dlt_load_id > (select max(_dlt_load_id) from {{ this }})
+
+    union
+
+    select
+        page_id,
+        date
+    from
+        cleansed_viewers
+    where
+        _dlt_load_id > (select max(_dlt_load_id) from {{ this }})
+),
+{% endif %}
+
+views as (
+    -- 同じ (page_id, date) が複数回ロードされていれば、最新のロードの値を使う
+    select
+        t1.page_id,
+        t1.date,
+        t1.views,
+        t1._dlt_load_id
+    from
+        cleansed_views t1
+        {% if is_incremental() %}
+        inner join loaded_keys t2
+            on t1.page_id = t2.page_id
+            and t1.date = t2.date
+        {% endif %}
+    qualify
+        row_number() over (partition by t1.page_id, t1.date order by t1._dlt_load_id desc) = 1
+),
+
+viewers as (
+    select
+        t1.page_id,
+        t1.date,
+        t1.viewers,
+        t1._dlt_load_id
+    from
+        cleansed_viewers t1
+        {% if is_incremental() %}
+        inner join loaded_keys t2
+            on t1.page_id = t2.page_id
+            and t1.date = t2.date
+        {% endif %}
+    qualify
+        row_number() over (partition by t1.page_id, t1.date order by t1._dlt_load_id desc) = 1
+),
+
+final as (
+    select
+        coalesce(t1.page_id, t2.page_id) as page_id,
+        coalesce(t1.date, t2.date) as date,
+        t1.views,
+        t2.viewers,
+        greatest(coalesce(t1._dlt_load_id, ''), coalesce(t2._dlt_load_id, '')) as _dlt_load_id
+    from
+        views t1
+        full outer join viewers t2
+            on t1.page_id = t2.page_id
+            and t1.date = t2.date
+)
+
+select *
+from final
@@ -0,0 +1,173 @@
+{{
+    config(
+        post_hook=[
+            "{{ delete_removed_pages() }}",
+        ]
+    )
+}}
+with recursive pages as (
+    select
+        id as page_id,
+        parent_id,
+        title
+    from
+        {{ source('confluence', 'pages') }}
+    where
+        status in ('current')
+),
+
+{% if is_incremental() %}
+previous as (
+    select
+        *
+    from
+        {{ this }}
+),
+
+seeds as (
+    -- 追加されたページと、タイトルか親が変わったページ
+    select
+        t1.page_id
+    from
+        pages t1
+        left join previous t2
+            on t1.page_id = t2.page_id
+            and t1.title = t2.title
+            and t1.parent_id is not distinct from t2.parent_id
+    where
+        t2.page_id is null
+
+    union all
+
+    -- 削除されたページ（子ページは、親をたどれなくなる）
+    select
+        t1.page_id
+    from
+        previous t1
+        left join pages t2
+            on t1.page_id = t2.page_id
+    where
+        t2.page_id is null
+),
+
+affected (page_id) as (
+    -- seedsと、その子孫のページ（このページだけを計算し直す）
+    select
+        page_id
+    from
+        seeds
+
+    union all
+
+    select
+        t1.page_id
+    from
+        pages t1
+        inner join affected t2
+            on t1.parent_id = t2.page_id
+),
+
+targets as (
+    select
+        *
+    from
+        pages
+    where
+        page_id in (select page_id from affected)
+),
+
+unchanged as (
+    -- 前回の結果のうち、計算し直さないページ（削除されたページは含まない）
+    select
+        *
+    from
+        previous
+    where
+        page_id not in (select page_id from affected)
+),
+
+anchors as (
+    -- 計算し直すページのうち、親が計算し直す対象でないページ。
+    -- 親の行が前回の結果にあれば、その祖先とパスを引き継ぐ。なければ（親がいない、または親がページでない）ルートにする
+    select
+        t1.page_id,
+        t1.parent_id,
+        t1.title,
+        case
+            when t2.page_id is not null then array_append(t2.ancestor_ids, t2.page_id)
+            else {{ empty_array() }}
+        end as ancestor_ids,
+        coalesce(t2.depth + 1, 0) as depth,
+        coalesce(t2.path, '') || ' / ' || t1.title as path,
+        coalesce(t2.is_detached, t1.parent_id is not null) as is_detached
+    from
+        targets t1
+        left join unchanged t2
+            on t1.parent_id = t2.page_id
+    where
+        t1.parent_id is null
+        or t1.parent_id not in (select page_id from targets)
+),
+{% else %}
+targets as (
+    select
+        *
+    from
+        pages
+),
+
+anchors as (
+    -- 親がいないページと、親がページでない（フォルダ、ホワイトボードなど）か、削除されたページをルートにする
+    select
+        t1.page_id,
+        t1.parent_id,
+        t1.title,
+        {{ empty_array() }} as ancestor_ids,
+        0 as depth,
+        ' / ' || t1.title as path,
+        t1.parent_id is not null as is_detached
+    from
+        targets t1
+    where
+        t1.parent_id is null
+        or t1.parent_id not in (select page_id from targets)
+),
+{% endif %}
+
+hierarchy (page_id, parent_id, title, ancestor_ids, depth, path, is_detached) as (
+    select
+        *
+    from
+        anchors
+
+    union all
+
+    select
+        t1.page_id,
+        t1.parent_id,
+        t1.title,
+        array_append(t2.ancestor_ids, t2.page_id) as ancestor_ids,
+        t2.depth + 1 as depth,
+        t2.path || ' / ' || t1.title as path,
+        t2.is_detached
+    from
+        targets t1
+        inner join hierarchy t2
+            on t1.parent_id = t2.page_id
+),
+
+final as (
+    select
+        page_id,
+        parent_id,
+        title,
+        ancestor_ids,
+        depth,
+        path,
+        is_detached
+    from
+        hierarchy
+)
+
+select *
+from final
@@ -0,0 +1,18 @@
+from pathlib import Path
+
+import pytest
+
+GOLDEN_DIR = Path(__file__).parent / "testdata" / "golden"
+
+
+def load_golden_pages():
+    """testdata/golden の (名前, HTML, 期待するマークダウン) の一覧を返す"""
+    return [
+        (path.stem, path.read_text(encoding="utf-8"), path.with_suffix(".md").read_text(encoding="utf-8").rstrip("\n"))
+        for path in sorted(GOLDEN_DIR.glob("*.html"))
+    ]
+
+
+@pytest.fixture
+def golden_pages():
+    return load_golden_pages()
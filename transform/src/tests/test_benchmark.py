@@ -0,0 +1,181 @@
+import re
+import time
+
+import pytest
+from bs4 import BeautifulSoup, NavigableString
+
+from transform.confluence_markdown import chunking, estimate_tokens, html_to_markdown
+from tests.conftest import load_golden_pages
+
+# 計測に使うページ数。testdata/golden のページを繰り返して作る
+PAGE_COUNT = 500
+
+
+def legacy_html_to_markdown(html):
+    """legacy_html_to_markdown
+    比較用の、MarkdownConverterに書き換える前のhtml_to_markdownの実装（BeautifulSoupでタグの種類ごとに走査する）
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    for script in soup(["script", "style", "ac"]):
+        script.decompose()
+    for i in range(6, 0, -1):
+        for header in soup.find_all(f'h{i}'):
+            header.insert_before("\n\n"+NavigableString(f"{'#' * i} "))
+            header.insert_after("\n\n")
+            header.unwrap()
+    for link in soup.find_all('a'):
+        link.replace_with(f"[{link.get_text()}]({link.get('href')})")
+    for bold in soup.find_all(['strong', 'b']):
+        bold.replace_with(f"**{bold.get_text()}**")
+    for italic in soup.find_all(['em', 'i']):
+        italic.replace_with(f"*{italic.get_text()}*")
+    for ul in soup.find_all('ul'):
+        for li in ul.find_all('li'):
+            li.replace_with(f"\n- {li.get_text()}\n")
+        ul.unwrap()
+    for ol in soup.find_all('ol'):
+        for i, li in enumerate(ol.find_all('li'), 1):
+            li.replace_with(f"\n{i}. {li.get_text()}\n")
+        ol.unwrap()
+    for code in soup.find_all('code'):
+        code.replace_with(f"`{code.get_text()}`")
+    text = soup.get_text()
+    text = re.sub(r'\n\s*\n', '\n\n', text)
+    return text.strip()
+
+
+def legacy_chunking(md_contents, level=1, CHUNK_SIZE=1000):
+    """legacy_chunking
+    比較用の、トークン数で詰めるchunkingに書き換える前の実装（見出しのレベルごとに正規表現で再帰的に分割する）
+    """
+    results = []
+    if len(md_contents) <= CHUNK_SIZE:
+        results.extend([md_contents])
+    elif level <= 5:
+        pattern = re.compile(rf'\n+#{{{level}}}\s.*?(?=\n|$)')
+        for chunk in pattern.split(md_contents):
+            results.extend(legacy_chunking(chunk, level+1))
+    else:
+        results.extend([md_contents[i: i+CHUNK_SIZE] for i in range(0, len(md_contents), CHUNK_SIZE)])
+    return [x for x in results if not (x is None or x == 'none' or x.strip() == '')]
+
+
+def make_large_markdown(size):
+    """見出し・段落・リスト・コードブロックを繰り返した、約size文字のマークダウンを作る"""
+    sections = []
+    length = 0
+    i = 0
+    while length < size:
+        section = (
+            f"# 章{i}\n\n"
+            + "この章では、データ基盤の設計について説明します。" * 8 + "\n\n"
+            + f"## 節{i}-1\n\n"
+            + "- 項目A\n- 項目B\n    - 項目C\n\n"
+            + "```sql\n# not a heading\nselect page_id, title from pages where space_id = 1;\n```\n\n"
+            + f"### 項{i}-1-1\n\n"
+            + "Snowflake and dbt are used for the transformation layer. " * 6
+        )
+        sections.append(section)
+        length += len(section) + 2
+        i += 1
+    return "\n\n".join(sections)
+
+
+@pytest.fixture(scope="module")
+def pages():
+    htmls = [html for _, html, _ in load_golden_pages()]
+    return [htmls[i % len(htmls)] for i in range(PAGE_COUNT)]
+
+
+def record_throughput(benchmark, pages):
+    """1ページあたりの処理時間から、ページ/秒をextra_infoに記録する"""
+    if benchmark.stats is None:
+        # --benchmark-disableのときは1回実行するだけで、計測結果がない
+        return
+    benchmark.extra_info["pages"] = len(pages)
+    benchmark.extra_info["pages_per_sec"] = len(pages) / benchmark.stats.stats.mean
+    print(f"{benchmark.name}: {benchmark.extra_info['pages_per_sec']:.1f} pages/s")
+
+
+def record_kb_per_sec(benchmark, md_contents):
+    """1回あたりの処理時間から、KB/秒をextra_infoに記録する"""
+    if benchmark.stats is None:
+        # --benchmark-disableのときは1回実行するだけで、計測結果がない
+        return
+    benchmark.extra_info["kb_per_sec"] = len(md_contents) / 1000 / benchmark.stats.stats.mean
+
+
+@pytest.mark.benchmark(group="html_to_markdown")
+class TestBenchmark:
+
+    def test__html_to_markdown__legacy(self, benchmark, pages):
+        """test__html_to_markdown__legacy
+        比較用に、書き換え前の実装のスループットを計測する
+        """
+        benchmark(lambda: [legacy_html_to_markdown(html) for html in pages])
+        record_throughput(benchmark, pages)
+
+    def test__html_to_markdown(self, benchmark, pages):
+        """test__html_to_markdown
+        html_to_markdownのスループットを計測する
+        """
+        results = benchmark(lambda: [html_to_markdown(html) for html in pages])
+        record_throughput(benchmark, pages)
+        assert len(results) == len(pages)
+
+    def test__html_to_markdown_and_chunking(self, benchmark, pages):
+        """test__html_to_markdown_and_chunking
+        page_html_to_markdownモデルのUDFと同じく、マークダウン化とチャンク分割を合わせたスループットを計測する
+        """
+        benchmark(lambda: [chunking(html_to_markdown(html)) for html in pages])
+        record_throughput(benchmark, pages)
+
+
+@pytest.mark.benchmark(group="chunking")
+class TestChunkingBenchmark:
+
+    @pytest.mark.parametrize("size", [100_000, 400_000])
+    def test__chunking__legacy(self, benchmark, size):
+        """test__chunking__legacy
+        比較用に、書き換え前の実装で100KB以上のページを分割する時間を計測する
+        """
+        md_contents = make_large_markdown(size)
+        benchmark(legacy_chunking, md_contents)
+        record_kb_per_sec(benchmark, md_contents)
+
+    @pytest.mark.parametrize("size", [100_000, 400_000])
+    def test__chunking(self, benchmark, size):
+        """test__chunking
+        100KB以上のページを分割する時間を計測する
+        """
+        md_contents = make_large_markdown(size)
+        chunks = benchmark(chunking, md_contents)
+        record_kb_per_sec(benchmark, md_contents)
+        assert all(chunk["tokens"] <= 500 for chunk in chunks)
+
+    def test__chunking__linear_time(self):
+        """test__chunking__linear_time
+        文書の長さを4倍にしても、count_tokensに渡す文字数は文書の長さにおおむね比例する（線形時間で分割する）ことを確認する
+
+        処理時間はマシンの負荷で揺れるため、表示のみとし、判定には決定的なcount_tokensの走査量を使う。
+        """
+        scanned_per_char = {}
+        for size in [100_000, 400_000]:
+            md_contents = make_large_markdown(size)
+            scanned = 0
+
+            def count_tokens(text):
+                nonlocal scanned
+                scanned += len(text)
+                return estimate_tokens(text)
+
+            start = time.perf_counter()
+            chunking(md_contents, count_tokens=count_tokens)
+            elapsed = time.perf_counter() - start
+            scanned_per_char[size] = scanned / len(md_contents)
+            print(
+                f"chunking {len(md_contents) / 1000:.0f} KB: {elapsed * 1000:.1f} ms, "
+                f"count_tokens scanned {scanned_per_char[size]:.2f} chars per char"
+            )
+
+        assert scanned_per_char[400_000] < scanned_per_char[100_000] * 1.5
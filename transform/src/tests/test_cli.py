@@ -0,0 +1,40 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from transform.cli import main
+from tests.conftest import GOLDEN_DIR
+
+
+@pytest.mark.unit
+class TestCli:
+
+    def test__main__directory(self, tmp_path, golden_pages):
+        """test__main__directory
+        ディレクトリ内の *.html を変換し、出力先に同じ名前の *.md を書き出す
+        """
+        assert main([str(GOLDEN_DIR), str(tmp_path), "--workers", "2"]) == 0
+
+        for name, _, expected in golden_pages:
+            assert (tmp_path / f"{name}.md").read_text(encoding="utf-8") == expected
+
+    def test__main__parquet(self, tmp_path, golden_pages):
+        """test__main__parquet
+        Parquetのhtml_contents列を変換し、md_contents, chunked_contents列を追加したParquetを書き出す
+        """
+        input_path = tmp_path / "pages.parquet"
+        output_path = tmp_path / "converted.parquet"
+        pq.write_table(
+            pa.table({
+                "page_id": [name for name, _, _ in golden_pages] + ["empty"],
+                "html_contents": [html for _, html, _ in golden_pages] + [None],
+            }),
+            input_path,
+        )
+
+        assert main([str(input_path), str(output_path), "--workers", "2"]) == 0
+
+        rows = pq.read_table(output_path).to_pylist()
+        assert [row["md_contents"] for row in rows] == [md for _, _, md in golden_pages] + [None]
+        assert all([chunk["text"] for chunk in row["chunked_contents"]] == [row["md_contents"]] for row in rows[:-1])
+        assert rows[-1]["chunked_contents"] is None
@@ -0,0 +1,128 @@
+import pytest
+
+from transform.confluence_markdown import chunking, estimate_tokens, html_to_markdown
+from tests.conftest import load_golden_pages
+
+
+@pytest.mark.unit
+class TestHtmlToMarkdown:
+
+    @pytest.mark.parametrize(
+        "html, expected",
+        [pytest.param(html, md, id=name) for name, html, md in load_golden_pages()],
+    )
+    def test__html_to_markdown__golden(self, html, expected):
+        """test__html_to_markdown__golden
+        testdata/golden の *.html を変換した結果が、同じ名前の *.md と一致する
+        """
+        assert html_to_markdown(html) == expected
+
+    def test__html_to_markdown__none(self):
+        """test__html_to_markdown__none
+        本文がない場合はNoneを返す
+        """
+        assert html_to_markdown(None) is None
+
+    def test__html_to_markdown__heading_text_in_body(self):
+        """test__html_to_markdown__heading_text_in_body
+        見出しと同じ文字列が本文中にあっても、見出しだけを変換する
+        """
+        html = "<h1>設計</h1><p>本ページは、設計についての記述です。</p>"
+        assert html_to_markdown(html) == "# 設計\n\n本ページは、設計についての記述です。"
+
+
+@pytest.mark.unit
+class TestChunking:
+
+    def test__chunking__short(self):
+        """test__chunking__short
+        上限以下の文書は分割しない
+        """
+        md_contents = "# 設計\n\n本文"
+        assert chunking(md_contents) == [
+            {"text": md_contents, "breadcrumb": [], "start": 0, "end": len(md_contents), "tokens": 5},
+        ]
+
+    def test__chunking__empty(self):
+        """test__chunking__empty
+        空白だけの文書はチャンクにしない
+        """
+        assert chunking("\n \n") == []
+
+    def test__chunking__breadcrumb(self):
+        """test__chunking__breadcrumb
+        見出しを消さず、チャンクの先頭を囲む見出しをパンくずとして先頭に付ける
+        """
+        section_a = "本文A" * 30
+        section_b = "本文B" * 30
+        md_contents = f"# 概要\n\n{section_a}\n\n## 詳細\n\n{section_b}\n\n{section_b}"
+
+        chunks = chunking(md_contents, max_tokens=200, overlap_tokens=0)
+
+        assert [chunk["text"] for chunk in chunks] == [
+            f"# 概要\n\n{section_a}\n\n## 詳細\n\n{section_b}",
+            f"# 概要\n## 詳細\n\n{section_b}",
+        ]
+        assert [chunk["breadcrumb"] for chunk in chunks] == [[], ["概要", "詳細"]]
+
+    def test__chunking__offsets(self):
+        """test__chunking__offsets
+        start, endは元の文書の中でのチャンクの本文の位置を指し、チャンクの文字列はパンくずと本文からなる
+        """
+        md_contents = "\n\n".join(f"# 見出し{i}\n\n" + "段落です。" * 20 for i in range(10))
+
+        for chunk in chunking(md_contents, max_tokens=100, overlap_tokens=20):
+            body = md_contents[chunk["start"]:chunk["end"]]
+            assert chunk["text"].endswith(body)
+            assert chunk["tokens"] <= 100
+
+    def test__chunking__token_budget(self):
+        """test__chunking__token_budget
+        区切りのない長い段落も、トークン数が上限以下になるように分割する
+        """
+        md_contents = "あ" * 2500
+        chunks = chunking(md_contents, max_tokens=500, overlap_tokens=0)
+
+        assert [chunk["tokens"] for chunk in chunks] == [500] * 5
+        assert "".join(chunk["text"] for chunk in chunks) == md_contents
+
+    def test__chunking__overlap(self):
+        """test__chunking__overlap
+        次のチャンクの先頭に、前のチャンクの末尾の文をoverlap_tokensまで重ねる
+        """
+        md_contents = "。".join(f"文{i:03d}" for i in range(200)) + "。"
+        chunks = chunking(md_contents, max_tokens=100, overlap_tokens=30)
+
+        for previous, chunk in zip(chunks, chunks[1:]):
+            assert previous["start"] < chunk["start"] < previous["end"]
+            overlap = md_contents[chunk["start"]:previous["end"]]
+            assert 0 < estimate_tokens(overlap) <= 30
+        assert chunks[-1]["end"] == len(md_contents)
+
+    def test__chunking__keeps_code_block(self):
+        """test__chunking__keeps_code_block
+        コードブロックの中の # は見出しとして扱わず、上限に収まるコードブロックは途中で切らない
+        """
+        code = "```python\n# コメント\nprint('hello')\n```"
+        md_contents = "# 手順\n\n" + "説明です。" * 15 + "\n\n" + code
+
+        chunks = chunking(md_contents, max_tokens=60, overlap_tokens=0)
+
+        assert chunks[-1]["text"].endswith("\n\n" + code)
+        assert chunks[-1]["breadcrumb"] == ["手順"]
+
+    def test__chunking__count_tokens(self):
+        """test__chunking__count_tokens
+        トークン数を数える関数を差し替えられる
+        """
+        md_contents = "a b c d e f"
+        chunks = chunking(md_contents, max_tokens=3, overlap_tokens=0, count_tokens=lambda text: len(text.split()))
+
+        assert [chunk["text"] for chunk in chunks] == ["a b c", "d e f"]
+
+    @pytest.mark.parametrize("text, expected", [("", 0), ("本文", 2), ("Snowflake", 3), ("a, b", 3)])
+    def test__estimate_tokens(self, text, expected):
+        """test__estimate_tokens
+        英数字は4文字ごとに1トークン、それ以外の文字は1文字1トークンとして数える
+        """
+        assert estimate_tokens(text) == expected
@@ -0,0 +1,109 @@
+import duckdb
+import pytest
+
+from transform.duckdb_shims import EMBEDDING_DIMENSIONS, embed_text, register_shims
+
+
+@pytest.fixture
+def conn():
+    conn = duckdb.connect()
+    register_shims(conn)
+    yield conn
+    conn.close()
+
+
+@pytest.mark.unit
+class TestRegisterShims:
+
+    def test__register_shims__functions(self, conn):
+        """test__register_shims__functions
+        Snowflakeの関数をSnowflakeと同じ名前・引数で呼べる
+        """
+        row = conn.sql("""
+            select
+                iff(1 = 1, 'a', 'b'),
+                to_date('2024-07-01 12:00:00'::timestamp),
+                sha2('abc', 256) = sha256('abc'),
+                array_size([1, 2, 3]),
+                contains((select parse_json('[1000000,1000001]')), '1000001'),
+                '1970-01-01'::timestamp_ltz is not null,
+                '12'::number
+        """).fetchone()
+        assert row[0] == "a"
+        assert str(row[1]) == "2024-07-01"
+        assert row[2:6] == (True, 3, True, True)
+        assert row[6] == 12
+
+    def test__register_shims__contains(self, conn):
+        """test__register_shims__contains
+        containsはJSONの配列なら要素の一致で判定し（部分一致するIDには一致しない）、文字列なら部分一致で判定する
+        """
+        rows = conn.sql("""
+            select
+                page_id,
+                contains((select parse_json('[11111111,2222222]')), page_id),
+                contains((select parse_json('["11111111","2222222"]')), page_id)
+            from
+                (values ('1'), ('11111111'), ('2222222'), ('222')) as pages(page_id)
+            order by
+                page_id
+        """).fetchall()
+        assert rows == [
+            ("1", False, False),
+            ("11111111", True, True),
+            ("222", False, False),
+            ("2222222", True, True),
+        ]
+        assert conn.sql("select contains('abc', 'b'), contains('abc', 'x'), contains(parse_json('[]'), '1')").fetchone() == (True, False, False)
+
+    def test__register_shims__cortex(self, conn):
+        """test__register_shims__cortex
+        SNOWFLAKE.CORTEX.EMBED_TEXT_1024 は1024次元のベクトルを返し、
+        vector_cosine_similarityは共通の文字列が多いテキストほど大きくなる
+        """
+        similar, unrelated, length = conn.sql("""
+            with embeddings as (
+                select
+                    SNOWFLAKE.CORTEX.EMBED_TEXT_1024('multilingual-e5-large', 'データ基盤の要件定義') as query_vector,
+                    SNOWFLAKE.CORTEX.EMBED_TEXT_1024('multilingual-e5-large', 'データ基盤の要件定義書') as similar_vector,
+                    SNOWFLAKE.CORTEX.EMBED_TEXT_1024('multilingual-e5-large', 'release notes') as unrelated_vector
+            )
+            select
+                vector_cosine_similarity(query_vector, similar_vector),
+                vector_cosine_similarity(query_vector, unrelated_vector),
+                len(query_vector)
+            from
+                embeddings
+        """).fetchone()
+        assert length == EMBEDDING_DIMENSIONS
+        assert similar > 0.8
+        assert similar > unrelated
+
+        response = conn.sql("select snowflake.cortex.complete('llama3.1-70b', '質問')").fetchone()[0]
+        assert "llama3.1-70b" in response and "質問" in response
+
+    def test__register_shims__twice_and_cursor(self, conn):
+        """test__register_shims__twice_and_cursor
+        同じ接続に2回登録でき、登録した関数は同じ接続のカーソルからも使える
+        """
+        register_shims(conn)
+        with conn.cursor() as cursor:
+            assert cursor.sql("select iff(false, 1, 2), len(snowflake.cortex.embed_text_1024('m', 'a'))").fetchone() == (2, EMBEDDING_DIMENSIONS)
+
+
+@pytest.mark.unit
+class TestEmbedText:
+
+    def test__embed_text__deterministic(self):
+        """test__embed_text__deterministic
+        同じテキストからは同じ、L2ノルムが1のベクトルを返す
+        """
+        vector = embed_text("multilingual-e5-large", "要件定義")
+        assert vector == embed_text("multilingual-e5-large", "要件定義")
+        assert sum(value * value for value in vector) == pytest.approx(1.0)
+
+    def test__embed_text__empty(self):
+        """test__embed_text__empty
+        空のテキストはゼロベクトルを返す
+        """
+        assert embed_text("multilingual-e5-large", "") == [0.0] * EMBEDDING_DIMENSIONS
@@ -0,0 +1,96 @@
+from pathlib import Path
+
+import duckdb
+import pytest
+
+from transform.synthetic import RAW_TABLES, generate_tenant, load_csv_tenant, main
+
+# uiのテストデータ
+UI_TEST_DATA_DIR = Path(__file__).resolve().parents[3] / "ui" / "tests" / "data"
+
+
+@pytest.fixture
+def conn():
+    conn = duckdb.connect()
+    yield conn
+    conn.close()
+
+
+@pytest.mark.unit
+class TestGenerateTenant:
+
+    def test__generate_tenant__tables(self, conn):
+        """test__generate_tenant__tables
+        loadと同じ名前の生テーブルを、指定したページ数・スペース数で作る
+        """
+        generate_tenant(conn, "confluence", pages=1000, spaces=10)
+
+        counts = {table: conn.sql(f"select count(*) from confluence.{table}").fetchone()[0] for table in RAW_TABLES}
+        assert counts["pages"] == counts["page_bodies"] == 1000
+        assert counts["spaces"] == 10
+        assert counts["_dlt_loads"] == 1
+        assert counts["views"] == counts["viewers"] > 0
+
+    def test__generate_tenant__page_tree(self, conn):
+        """test__generate_tenant__page_tree
+        各スペースの最初のページだけが根で、他のページの親は同じスペースの、先に作成されたページになる
+        """
+        generate_tenant(conn, "confluence", pages=1000, spaces=10)
+
+        roots, invalid = conn.sql("""
+            select
+                count_if(t1.parent_id is null),
+                count_if(t1.parent_id is not null and (
+                    t2.id is null or t1.space_id != t2.space_id or t1.created_at <= t2.created_at
+                ))
+            from
+                confluence.pages t1
+                left join confluence.pages t2
+                    on t1.parent_id = t2.id
+        """).fetchone()
+        assert roots == 10
+        assert invalid == 0
+
+    def test__generate_tenant__seed(self, conn):
+        """test__generate_tenant__seed
+        同じシードなら同じテナントを、異なるシードなら異なるテナントを作る
+        """
+        def snapshot(schema, seed):
+            generate_tenant(conn, schema, pages=200, spaces=2, seed=seed)
+            return conn.sql(f"""
+                select list(views order by page_id, date) from {schema}.views
+            """).fetchone()[0]
+
+        assert snapshot("a", 0) == snapshot("b", 0)
+        assert snapshot("a", 0) != snapshot("c", 1)
+
+
+@pytest.mark.unit
+class TestLoadCsvTenant:
+
+    def test__load_csv_tenant(self, conn):
+        """test__load_csv_tenant
+        pages.csvをpagesとpage_bodiesに分け、views.csvがなければ空のviewsを作る
+        """
+        load_csv_tenant(conn, "confluence", UI_TEST_DATA_DIR)
+
+        assert conn.sql("select count(*) from confluence.pages").fetchone()[0] == 21
+        assert conn.sql("select count(*) from confluence.page_bodies where body__storage__value like '<!DOCTYPE%'").fetchone()[0] == 21
+        assert conn.sql("select count(*) from confluence.views").fetchone()[0] == 0
+        assert conn.sql("select count(*) from confluence.pages where parent_id is null").fetchone()[0] == 1
+        columns = {row[0].lower() for row in conn.sql("describe confluence.pages").fetchall()}
+        assert "body__storage__value" not in columns
+
+
+@pytest.mark.unit
+class TestMain:
+
+    def test__main(self, tmp_path):
+        """test__main
+        データベースファイルに合成テナントを作る
+        """
+        database = tmp_path / "tenant.duckdb"
+        assert main([str(database), "--schema", "confluence", "--pages", "100", "--spaces", "2"]) == 0
+
+        with duckdb.connect(str(database), read_only=True) as conn:
+            assert conn.sql("select count(*) from confluence.pages").fetchone()[0] == 100
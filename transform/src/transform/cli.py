@@ -0,0 +1,88 @@
+"""cli
+
+ページ本文のHTMLを、dbtやSnowflakeを使わずにローカルでマークダウンに変換するコマンドです。
+page_html_to_markdownモデルと同じconfluence_markdownモジュールを使うため、変換結果の確認や性能の計測に使えます。
+
+Examples:
+    # ディレクトリ内の *.html を変換し、出力先のディレクトリに *.md を書き出す
+    $ confluence-markdown pages/ out/ --workers 8
+    # page_id, html_contents 列を持つParquetを変換し、md_contents, chunked_contents 列を追加したParquetを書き出す
+    $ confluence-markdown pages.parquet out.parquet
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from pathlib import Path
+
+from transform.confluence_markdown import chunking, html_to_markdown
+
+
+def convert(html):
+    """1ページ分のHTMLを、マークダウンとチャンクのタプルにします。"""
+    md_contents = html_to_markdown(html)
+    if md_contents is None:
+        return None, None
+    return md_contents, chunking(md_contents)
+
+
+def convert_directory(input_dir: Path, output_dir: Path, executor: Executor, chunksize: int) -> int:
+    """input_dir内の *.html を変換し、output_dirに同じ名前の *.md を書き出します。変換したページ数を返します。"""
+    paths = sorted(input_dir.glob("*.html"))
+    output_dir.mkdir(parents=True, exist_ok=True)
+    htmls = (path.read_text(encoding="utf-8") for path in paths)
+    for path, (md_contents, _) in zip(paths, executor.map(convert, htmls, chunksize=chunksize)):
+        (output_dir / path.with_suffix(".md").name).write_text(md_contents, encoding="utf-8")
+    return len(paths)
+
+
+def convert_parquet(input_path: Path, output_path: Path, executor: Executor, chunksize: int, column: str) -> int:
+    """Parquetのcolumn列を変換し、md_contents, chunked_contents列を追加したParquetを書き出します。変換したページ数を返します。"""
+    # pyarrowはParquetを変換するときだけ必要なので、ここでimportする
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # chunkingが返すチャンクの辞書
+    chunk_type = pa.struct([
+        ("text", pa.string()),
+        ("breadcrumb", pa.list_(pa.string())),
+        ("start", pa.int64()),
+        ("end", pa.int64()),
+        ("tokens", pa.int64()),
+    ])
+
+    table = pq.read_table(input_path)
+    results = list(executor.map(convert, table.column(column).to_pylist(), chunksize=chunksize))
+    table = table.append_column("md_contents", pa.array([md for md, _ in results], pa.string()))
+    table = table.append_column("chunked_contents", pa.array([chunks for _, chunks in results], pa.list_(chunk_type)))
+    pq.write_table(table, output_path)
+    return table.num_rows
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="confluence-markdown",
+        description="ConfluenceのページのHTMLをマークダウンに変換し、チャンクに分割します。",
+    )
+    parser.add_argument("input", type=Path, help="*.html を含むディレクトリ、またはParquetファイル")
+    parser.add_argument("output", type=Path, help="*.md を書き出すディレクトリ、またはParquetファイル")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="変換するプロセス数（既定値: CPU数）")
+    parser.add_argument("--chunksize", type=int, default=16, help="1回にプロセスへ渡すページ数")
+    parser.add_argument("--column", default="html_contents", help="ParquetのHTMLの列名")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        if args.input.is_dir():
+            count = convert_directory(args.input, args.output, executor, args.chunksize)
+        else:
+            count = convert_parquet(args.input, args.output, executor, args.chunksize, args.column)
+    elapsed = time.perf_counter() - start
+
+    print(f"converted {count} pages in {elapsed:.2f}s ({count / elapsed:.1f} pages/s)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,487 @@
+"""confluence_markdown
+
+Confluenceのページ本文（storage形式のHTML）をマークダウンにし、チャンクに分割するモジュールです。
+
+dbtのPythonモデル（page_html_to_markdown）からは、ステージにアップロードしたこのファイルをimportして使います。
+Snowflakeの実行環境でもそのまま動くよう、標準ライブラリ以外には依存しません。
+
+Examples:
+    >>> md_contents = html_to_markdown("<h1>設計</h1><p>本文</p>")
+    >>> md_contents
+        '# 設計\n\n本文'
+    >>> chunking(md_contents)
+        [{'text': '# 設計\n\n本文', 'breadcrumb': [], 'start': 0, 'end': 8, 'tokens': 5}]
+"""
+import re
+from dataclasses import dataclass
+from html.parser import HTMLParser
+
+
+class MarkdownConverter(HTMLParser):
+    """
+    Confluenceのstorage形式のHTMLを、先頭から1回だけ読み進めてマークダウンにするパーサーです。
+    タグの開始・終了とテキストのイベントごとに出力を組み立てるため、ツリーを作らず、タグの種類ごとに何度も走査しません。
+
+    リンクや太字のように中身を加工してから出力する要素は、出力先のバッファをスタックに積んで中身を受け取ります。
+    """
+    # 中身ごと捨てるタグ
+    DROP_TAGS = {"script", "style", "ac:image", "ac:emoticon", "ac:placeholder", "ac:task-id"}
+    # 中身を引用として出力するマクロ
+    QUOTE_MACROS = {"info", "note", "warning", "tip", "panel"}
+    BLOCK_TAGS = {"p", "div", "section", "article", "header", "footer", "ac:layout-section", "ac:layout-cell"}
+    INLINE_MARKS = {"strong": "**", "b": "**", "em": "*", "i": "*"}
+    LIST_TAGS = {"ul", "ol", "ac:task-list"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.buffers = [[]]
+        self.drop = None  # (捨てているタグ名, ネストの深さ)
+        self.lists = []  # [リストのタグ名, 番号]
+        self.tables = []  # 行のリスト
+        self.macros = []  # マクロ名とパラメータ
+        self.links = []  # href, またはac:linkのリンク先のタイトル
+        self.pre_depth = 0
+        self.cell_depth = 0
+
+    # 出力バッファの操作
+    def write(self, text):
+        self.buffers[-1].append(text)
+
+    def push(self):
+        self.buffers.append([])
+
+    def pop(self):
+        return "".join(self.buffers.pop())
+
+    def ends_with_space(self):
+        buffer = self.buffers[-1]
+        return not buffer or buffer[-1][-1:] in ("", " ", "\n")
+
+    def inline_only(self):
+        """リストの項目や表のセルの中では、改行を含むブロックを作れない"""
+        return bool(self.lists) or self.cell_depth > 0
+
+    def block(self):
+        """ブロック要素の区切りを出力する"""
+        if self.inline_only():
+            if not self.ends_with_space():
+                self.write(" ")
+        else:
+            self.write("\n\n")
+
+    def write_code_block(self, code, language=""):
+        self.block()
+        self.write("```" + language + "\n" + code.strip("\n") + "\n```")
+        self.block()
+
+    # HTMLParserのイベント
+    def handle_starttag(self, tag, attrs):
+        if self.drop is not None:
+            if tag == self.drop[0]:
+                self.drop = (tag, self.drop[1] + 1)
+            return
+        attrs = dict(attrs)
+
+        if tag in self.DROP_TAGS:
+            self.drop = (tag, 1)
+        elif re.fullmatch(r"h[1-6]", tag) and not self.inline_only():
+            self.write("\n\n" + "#" * int(tag[1]) + " ")
+        elif tag in self.BLOCK_TAGS or tag == "blockquote":
+            if tag == "blockquote":
+                self.push()
+            self.block()
+        elif tag in self.INLINE_MARKS or tag == "code":
+            self.push()
+        elif tag == "a":
+            self.links.append(attrs.get("href"))
+            self.push()
+        elif tag == "ac:link":
+            self.links.append(None)
+            self.push()
+        elif tag.startswith("ri:"):
+            # ac:linkのリンク先。本文がなければタイトルを表示する
+            if self.links and self.links[-1] is None:
+                self.links[-1] = attrs.get("ri:content-title") or attrs.get("ri:filename") or ""
+        elif tag == "br":
+            self.write(" " if self.inline_only() else "\n")
+        elif tag == "hr":
+            self.block()
+            self.write("---")
+            self.block()
+        elif tag == "pre":
+            self.pre_depth += 1
+            self.push()
+        elif tag in self.LIST_TAGS:
+            if not self.lists:
+                self.block()
+            self.lists.append([tag, 0])
+        elif tag == "li" and self.lists:
+            self.lists[-1][1] += 1
+            list_tag, number = self.lists[-1]
+            marker = f"{number}. " if list_tag == "ol" else "- "
+            self.write("\n" + "    " * (len(self.lists) - 1) + marker)
+        elif tag == "ac:task-status":
+            self.push()
+        elif tag == "table":
+            self.block()
+            self.tables.append([])
+        elif tag == "tr" and self.tables:
+            self.tables[-1].append([])
+        elif tag in ("td", "th") and self.tables:
+            self.cell_depth += 1
+            self.push()
+        elif tag == "ac:structured-macro":
+            name = attrs.get("ac:name", "")
+            self.macros.append({"name": name, "params": {}, "parameter": None})
+            if name in self.QUOTE_MACROS:
+                self.block()
+                self.push()
+        elif tag in ("ac:parameter", "ac:plain-text-body", "ac:plain-text-link-body"):
+            self.push()
+            if tag == "ac:parameter" and self.macros:
+                self.macros[-1]["parameter"] = attrs.get("ac:name", "")
+
+    def handle_endtag(self, tag):
+        if self.drop is not None:
+            if tag == self.drop[0]:
+                depth = self.drop[1] - 1
+                self.drop = (tag, depth) if depth > 0 else None
+            return
+
+        if re.fullmatch(r"h[1-6]", tag) and not self.inline_only():
+            self.write("\n\n")
+        elif tag in self.BLOCK_TAGS:
+            self.block()
+        elif tag == "blockquote":
+            self.write_quote(self.pop())
+        elif tag in self.INLINE_MARKS or tag == "code":
+            text = self.pop()
+            if tag == "code":
+                self.write(text if self.pre_depth else f"`{text}`")
+            else:
+                mark = self.INLINE_MARKS[tag]
+                self.write(f"{mark}{text.strip()}{mark}" if text.strip() else text)
+        elif tag in ("a", "ac:link") and self.links:
+            target = self.links.pop()
+            text = self.pop().strip()
+            if tag == "a":
+                self.write(f"[{text}]({target})" if target else text)
+            else:
+                self.write(text or target or "")
+        elif tag == "pre" and self.pre_depth:
+            self.pre_depth -= 1
+            self.write_code_block(self.pop())
+        elif tag in self.LIST_TAGS and self.lists:
+            self.lists.pop()
+            if not self.lists:
+                self.block()
+        elif tag == "ac:task-status":
+            status = self.pop().strip()
+            if self.lists:
+                self.lists[-1][1] += 1
+                checkbox = "[x]" if status == "complete" else "[ ]"
+                self.write("\n" + "    " * (len(self.lists) - 1) + f"- {checkbox} ")
+        elif tag == "table" and self.tables:
+            self.write_table(self.tables.pop())
+            self.block()
+        elif tag in ("td", "th") and self.tables and self.cell_depth:
+            self.cell_depth -= 1
+            cell = re.sub(r"\s+", " ", self.pop()).strip().replace("|", "\\|")
+            if self.tables[-1]:
+                self.tables[-1][-1].append(cell)
+        elif tag == "ac:structured-macro" and self.macros:
+            macro = self.macros.pop()
+            if macro["name"] in self.QUOTE_MACROS:
+                title = macro["params"].get("title")
+                body = self.pop()
+                self.write_quote((f"**{title}**\n\n" if title else "") + body)
+        elif tag == "ac:parameter":
+            value = self.pop().strip()
+            if self.macros:
+                self.macros[-1]["params"][self.macros[-1]["parameter"]] = value
+        elif tag == "ac:plain-text-body":
+            code = self.pop()
+            language = self.macros[-1]["params"].get("language", "") if self.macros else ""
+            self.write_code_block(code, language)
+        elif tag == "ac:plain-text-link-body":
+            self.write(self.pop())
+
+    def handle_data(self, data):
+        if self.drop is not None:
+            return
+        if self.pre_depth:
+            self.write(data)
+            return
+        text = re.sub(r"\s+", " ", data)
+        if self.ends_with_space():
+            text = text.lstrip(" ")
+        if text:
+            self.write(text)
+
+    def unknown_decl(self, data):
+        # <![CDATA[...]]> はマクロの本文（コードなど）なので、そのまま出力する
+        if data.startswith("CDATA[") and self.drop is None:
+            self.write(data[len("CDATA["):])
+
+    # 出力の組み立て
+    def write_quote(self, text):
+        self.block()
+        lines = [line.rstrip() for line in re.sub(r"\n\s*\n", "\n\n", text.strip()).split("\n")]
+        self.write("\n".join(f"> {line}" if line else ">" for line in lines))
+        self.block()
+
+    def write_table(self, rows):
+        rows = [row for row in rows if row]
+        if not rows:
+            return
+        width = max(len(row) for row in rows)
+        lines = []
+        for i, row in enumerate(rows):
+            lines.append("| " + " | ".join(row + [""] * (width - len(row))) + " |")
+            if i == 0:
+                # 1行目を見出し行にする
+                lines.append("|" + " --- |" * width)
+        self.write("\n".join(lines))
+
+    def markdown(self):
+        self.close()
+        text = "".join(self.buffers[0])
+        text = re.sub(r"[ \t]+\n", "\n", text)
+        text = re.sub(r"\n\s*\n", "\n\n", text)
+        return text.strip()
+
+
+def html_to_markdown(html):
+    """
+    html文書をmarkdownにします。
+
+    #### markdown変換仕様
+    HTMLを先頭から1回だけ読み進め（MarkdownConverter）、以下のように変換します。
+    1. script, styleなどのタグや、画像・絵文字などのコンフル固有のタグ(ac)を、中身ごと削除します。
+    2. よくみられるタグを処理します。
+        - 見出し
+        - リンク（コンフルのページへのリンクは、リンクの文字列かページのタイトル）
+        - 太字
+        - 斜体
+        - リスト（箇条書きと連番）。ネストしたリストはインデントします。
+        - タスクリスト
+        - コード、コードブロック（コンフルのcodeマクロを含む）
+        - 表
+        - 引用（コンフルのinfo, note, warning, tip, panelマクロを含む）
+    3. 余計な空白を削除します。
+    """
+    if html is None:
+        return None
+    converter = MarkdownConverter()
+    converter.feed(html)
+    return converter.markdown()
+
+
+# estimate_tokensで1トークンと数える文字列。ASCIIの英数字の4文字までの並びと、それ以外の空白でない1文字
+TOKEN_PATTERN = re.compile(r"[A-Za-z0-9_]{1,4}|[^A-Za-z0-9_\s]")
+HEADING_PATTERN = re.compile(r"(#{1,6}) +(.*)")
+FENCE_PATTERN = re.compile(r"`{3,}|~{3,}")
+# 長すぎるブロックを分割する区切り。改行、文末の順に試し、それでも長ければ文字数で切る
+SPLIT_PATTERNS = [re.compile(r"\n+"), re.compile(r"[。．！？!?]+\s*|\.\s+")]
+
+
+def estimate_tokens(text):
+    """
+    multilingual-e5-large（XLM-RoBERTaのSentencePiece）のトークン数を、トークナイザーを使わずに見積もります。
+
+    - ASCIIの英数字の並びは、4文字ごとに1トークン
+    - 日本語の文字や記号は、1文字1トークン
+
+    日本語は実際には2文字程度で1トークンになることが多いため、多めに見積もります。
+    埋め込み関数の上限を超えた部分は切り捨てられるため、少なく見積もるよりは安全です。
+    """
+    return len(TOKEN_PATTERN.findall(text))
+
+
+@dataclass
+class Block:
+    """チャンクを組み立てる単位（見出し、段落、コードブロック、または長すぎるブロックを分割したもの）"""
+    start: int
+    end: int
+    tokens: int
+    # ブロックを囲む見出しの (レベル, 見出しの文字列) のタプル。見出しのブロックでは、自身は含まない
+    breadcrumb: tuple
+    is_heading: bool = False
+
+
+def split_blocks(md_contents):
+    """
+    マークダウンを1行ずつ読み進め、見出し・段落・コードブロックの (開始位置, 終了位置, 見出しの階層, 見出しか) に分けます。
+    コードブロックの中の # は見出しとして扱いません。
+    """
+    spans = []
+    breadcrumb = ()
+    start = end = None
+    fence = None
+    position = 0
+    for line in md_contents.splitlines(keepends=True):
+        line_start = position
+        position += len(line)
+        line_end = line_start + len(line.rstrip("\r\n"))
+        stripped = line.strip()
+
+        if fence is not None:
+            # コードブロックの中。閉じるフェンスまでを1つのブロックにする
+            end = line_end
+            if stripped.startswith(fence) and not stripped.strip(fence[0]):
+                spans.append((start, end, breadcrumb, False))
+                start = fence = None
+            continue
+
+        fence_match = FENCE_PATTERN.match(stripped)
+        heading_match = HEADING_PATTERN.fullmatch(stripped)
+        if fence_match or heading_match or not stripped:
+            # 段落の終わり
+            if start is not None:
+                spans.append((start, end, breadcrumb, False))
+                start = None
+            if fence_match:
+                start, end, fence = line_start, line_end, fence_match.group()
+            elif heading_match:
+                level = len(heading_match.group(1))
+                breadcrumb = tuple(h for h in breadcrumb if h[0] < level)
+                spans.append((line_start, line_end, breadcrumb, True))
+                breadcrumb = breadcrumb + ((level, heading_match.group(2).strip()),)
+            continue
+
+        if start is None:
+            start = line_start
+        end = line_end
+
+    if start is not None:
+        spans.append((start, end, breadcrumb, False))
+    return spans
+
+
+def split_span(md_contents, start, end, max_tokens, count_tokens, level=0):
+    """
+    md_contents[start:end] を、トークン数がmax_tokens以下の (開始位置, 終了位置, トークン数) に分けます。
+    上限を超える部分だけをSPLIT_PATTERNSの区切りで細かく分け、区切りがなければ文字数で切ります。
+    分けた部分はchunkingで上限まで詰め直すため、ここでは詰めません。
+    """
+    tokens = count_tokens(md_contents[start:end])
+    if tokens <= max_tokens:
+        return [(start, end, tokens)]
+
+    if level >= len(SPLIT_PATTERNS):
+        # 区切りがないため、トークン数が上限に収まる文字数で切る
+        width = max(1, (end - start) * max_tokens // tokens)
+        return [
+            piece
+            for i in range(start, end, width)
+            for piece in split_span(md_contents, i, min(i + width, end), max_tokens, count_tokens, level)
+        ]
+
+    pieces = []
+    piece_start = start
+    for match in SPLIT_PATTERNS[level].finditer(md_contents, start, end):
+        if match.end() > piece_start and match.end() < end:
+            pieces.extend(split_span(md_contents, piece_start, match.end(), max_tokens, count_tokens, level + 1))
+            piece_start = match.end()
+    pieces.extend(split_span(md_contents, piece_start, end, max_tokens, count_tokens, level + 1))
+
+    return pieces
+
+
+def chunking(md_contents, max_tokens=500, overlap_tokens=50, count_tokens=estimate_tokens):
+    """チャンキング
+    SnowflakeのVector Embedding関数（EMBED_TEXT_1024）のmultilingual-e5-largeが受け取れるトークン数の上限は512であるため、
+    文書をトークン数がmax_tokens以下のチャンクに分割する。
+
+    1. 文書を1回だけ読み進め、見出し・段落・コードブロックのブロックに分け、各ブロックを囲む見出しの階層を記録する。
+       上限を超えるブロックは、改行、文末、文字数の順に区切って分ける。
+    2. ブロックを先頭から順に、トークン数が上限を超えない範囲でチャンクに詰める。
+       チャンクが見出しで終わる場合は、見出しを次のチャンクに送る。
+    3. 次のチャンクの先頭には、前のチャンクの末尾のブロックを、合計がoverlap_tokens以下になるまでブロック単位で重ねて含める。
+    4. チャンクの先頭のブロックを囲む見出し（パンくず）を、チャンクの文字列の先頭に付ける。
+
+    ブロックのトークン数は1回だけ数えるため、処理時間は文書の長さに比例する。
+
+    Args:
+        md_contents: マークダウンの文字列
+        max_tokens: チャンクのトークン数の上限（パンくずを含む）
+        overlap_tokens: 前のチャンクと重ねるトークン数の上限
+        count_tokens: 文字列のトークン数を数える関数。
+            実際のトークナイザーを使う場合は、例えば tokenizers パッケージで
+            tokenizer = Tokenizer.from_pretrained("intfloat/multilingual-e5-large") として、
+            lambda text: len(tokenizer.encode(text, add_special_tokens=False).ids) を渡す。
+
+    Returns:
+        チャンクの辞書のリスト。
+        - text: パンくずを付けたチャンクの文字列
+        - breadcrumb: チャンクの先頭を囲む見出しの文字列のリスト
+        - start, end: md_contentsの中でのチャンクの本文の位置（md_contents[start:end]が本文）
+        - tokens: textのトークン数の見積もり
+    """
+    prefixes = {}
+
+    def prefix_of(breadcrumb):
+        """パンくずの文字列とトークン数。同じ見出しの階層では1回だけ数える"""
+        if breadcrumb not in prefixes:
+            text = "\n".join("#" * level + " " + heading for level, heading in breadcrumb)
+            tokens = count_tokens(text)
+            if tokens > max_tokens // 2:
+                # 見出しが長すぎる場合は、本文を優先してパンくずを付けない
+                text, tokens = "", 0
+            prefixes[breadcrumb] = (text, tokens)
+        return prefixes[breadcrumb]
+
+    blocks = []
+    for start, end, breadcrumb, is_heading in split_blocks(md_contents):
+        budget = max_tokens - prefix_of(breadcrumb)[1]
+        for piece_start, piece_end, tokens in split_span(md_contents, start, end, budget, count_tokens):
+            blocks.append(Block(piece_start, piece_end, tokens, breadcrumb, is_heading))
+
+    chunks = []
+
+    def emit(chunk_blocks):
+        prefix, prefix_tokens = prefix_of(chunk_blocks[0].breadcrumb)
+        start, end = chunk_blocks[0].start, chunk_blocks[-1].end
+        # 区切りで分けた部分の前後の空白は、本文に含めない
+        body = md_contents[start:end]
+        start += len(body) - len(body.lstrip())
+        body = body.strip()
+        end = start + len(body)
+        chunks.append({
+            "text": prefix + "\n\n" + body if prefix else body,
+            "breadcrumb": [heading for _, heading in chunk_blocks[0].breadcrumb],
+            "start": start,
+            "end": end,
+            "tokens": prefix_tokens + sum(block.tokens for block in chunk_blocks),
+        })
+
+    current = []
+    current_tokens = 0
+    for block in blocks:
+        if current and current_tokens + block.tokens + prefix_of(current[0].breadcrumb)[1] > max_tokens:
+            # 末尾の見出しは、本文と同じチャンクになるよう次のチャンクに送る
+            carried = []
+            while len(current) > 1 and current[-1].is_heading:
+                carried.insert(0, current.pop())
+            emit(current)
+
+            # 見出しを送らない場合は、前のチャンクの末尾のブロックを重ねる
+            overlap = []
+            if not carried:
+                overlap_sum = 0
+                for previous in reversed(current):
+                    if overlap_sum + previous.tokens > overlap_tokens:
+                        break
+                    overlap.insert(0, previous)
+                    overlap_sum += previous.tokens
+            current = overlap + carried
+            current_tokens = sum(b.tokens for b in current)
+            # 重ねた分で上限を超える場合は、重ねない
+            while current and current_tokens + block.tokens + prefix_of(current[0].breadcrumb)[1] > max_tokens:
+                current_tokens -= current.pop(0).tokens
+        current.append(block)
+        current_tokens += block.tokens
+    if current:
+        emit(current)
+
+    return chunks
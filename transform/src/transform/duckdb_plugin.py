@@ -0,0 +1,14 @@
+"""duckdb_plugin
+
+dbt-duckdbのプラグインです。dbtがDuckDBに接続するときに、互換レイヤー（duckdb_shims）を登録します。
+profiles.ymlのduckdbターゲットの plugins に指定して使います。
+"""
+from dbt.adapters.duckdb.plugins import BasePlugin
+
+from transform.duckdb_shims import register_shims
+
+
+class Plugin(BasePlugin):
+
+    def configure_connection(self, conn):
+        register_shims(conn)
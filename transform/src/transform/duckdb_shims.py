@@ -0,0 +1,114 @@
+"""duckdb_shims
+
+dbtのモデルとUIのクエリを、Snowflakeの代わりにローカルのDuckDBで実行するための互換レイヤーです。
+Snowflakeにしかない関数を、DuckDBのマクロとPythonの関数で置き換えます。
+
+- iff, to_date, sha2, array_size, parse_json, contains, vector_cosine_similarity, current_timestamp() などの関数
+- timestamp_ltz, number などの型（DuckDBの型の別名として登録します）
+- SNOWFLAKE.CORTEX.EMBED_TEXT_1024, SNOWFLAKE.CORTEX.COMPLETE
+  （テキストから決定的に計算するローカルの埋め込みと、プロンプトをそのまま返す応答で代用します）
+
+lateral flatten のように構文が違うものは、関数では置き換えられません。
+dbtのモデルでは、アダプタごとに実装を切り替えるマクロ（macros/shims.sql）を使います。
+
+Examples:
+    >>> conn = duckdb.connect("confluence.duckdb")
+    >>> register_shims(conn)
+    >>> conn.sql("select iff(1 = 1, 'a', 'b'), snowflake.cortex.embed_text_1024('multilingual-e5-large', '設計')")
+"""
+import math
+import zlib
+
+import duckdb
+
+# ローカルの埋め込みの次元数（EMBED_TEXT_1024に合わせる）
+EMBEDDING_DIMENSIONS = 1024
+
+# Snowflakeの関数と同じ名前のマクロ
+SHIM_MACROS = {
+    "iff": "(condition, true_value, false_value) as case when condition then true_value else false_value end",
+    "to_date": "(value) as cast(value as date)",
+    "sha2": "(value, digest_size) as sha256(value)",
+    "array_size": "(value) as len(value)",
+    "parse_json": "(value) as json(value)",
+    # UIのクエリは contains(parse_json('[...]'), page_id) でページIDの配列に含まれるかを調べる。
+    # DuckDBの組み込みのcontainsは文字列の部分一致のため、1が[11111111]に一致しないよう、JSONの配列は要素で比較する
+    "contains": (
+        "(value, part) as case when typeof(value) = 'JSON' and json_type(value::json) = 'ARRAY'"
+        " then list_contains(from_json(value::json, '[\"VARCHAR\"]'), part::varchar)"
+        " else strpos(value::varchar, part::varchar) > 0 end"
+    ),
+    "current_timestamp": "() as now()",
+    "vector_cosine_similarity": "(left_vector, right_vector) as list_cosine_similarity(left_vector::float[], right_vector::float[])",
+}
+
+# Snowflakeの型と同じ名前の、DuckDBの型の別名
+SHIM_TYPES = {
+    "timestamp_ltz": "timestamptz",
+    "timestamp_ntz": "timestamp",
+    "number": "decimal(38, 0)",
+}
+
+
+def embed_text(model, text):
+    """
+    テキストの文字のbigramを、ハッシュで1024次元に割り振って数えたベクトル（L2ノルムで正規化）を返します。
+    同じテキストからは必ず同じベクトルになり、共通の文字列が多いテキストほどコサイン類似度が高くなります。
+    """
+    vector = [0.0] * EMBEDDING_DIMENSIONS
+    if not text:
+        return vector
+    text = text.lower()
+    for i in range(max(len(text) - 1, 1)):
+        gram = text[i:i + 2].encode()
+        vector[zlib.crc32(gram) % EMBEDDING_DIMENSIONS] += 1.0
+    norm = math.sqrt(sum(value * value for value in vector))
+    return [value / norm for value in vector]
+
+
+def complete(model, prompt):
+    """LLMの代わりに、モデル名とプロンプトの先頭を返します。"""
+    head = (prompt or "")[:200]
+    return f"[{model}] ローカル実行のため、LLMの応答の代わりにプロンプトの先頭を返します。\n\n{head}"
+
+
+def register_shims(conn):
+    """
+    DuckDBの接続に互換レイヤーの関数を登録します。
+
+    マクロと型の別名は接続中のデータベースに保存されるため、同じデータベースを開いた他の接続（dbtのスレッドなど）からも使えます。
+    読み取り専用で開くデータベースには登録できないため、インメモリのデータベースに登録してから、読み取り専用でattachしてください。
+
+    Args:
+        conn: DuckDBの接続
+    """
+    existing_types = {
+        row[0] for row in conn.execute(
+            "select type_name from duckdb_types() where database_name = current_database() and schema_name = current_schema()"
+        ).fetchall()
+    }
+    for name, definition in SHIM_TYPES.items():
+        if name not in existing_types:
+            conn.execute(f"create type {name} as {definition}")
+
+    for name, definition in SHIM_MACROS.items():
+        conn.execute(f"create or replace macro {name}{definition}")
+
+    varchar = duckdb.type("VARCHAR")
+    functions = {
+        "cortex_embed_text_1024": (embed_text, duckdb.type(f"FLOAT[{EMBEDDING_DIMENSIONS}]")),
+        "cortex_complete": (complete, varchar),
+    }
+    for name, (function, return_type) in functions.items():
+        # 同じ接続に2回登録するとエラーになるため、登録済みなら置き換える
+        try:
+            conn.remove_function(name)
+        except duckdb.InvalidInputException:
+            pass
+        conn.create_function(name, function, [varchar, varchar], return_type, side_effects=False)
+
+    # SNOWFLAKE.CORTEX.xxx の形で呼べるよう、snowflakeという名前のデータベースにcortexスキーマを作る
+    conn.execute("attach if not exists ':memory:' as snowflake")
+    conn.execute("create schema if not exists snowflake.cortex")
+    conn.execute("create or replace macro snowflake.cortex.embed_text_1024(model, text) as cortex_embed_text_1024(model, text)")
+    conn.execute("create or replace macro snowflake.cortex.complete(model, prompt) as cortex_complete(model, prompt)")
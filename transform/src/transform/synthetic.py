@@ -0,0 +1,306 @@
+"""synthetic
+
+dbtのモデルとUIのクエリを、ローカルのDuckDBで実行・計測するためのテナント（ロード済みの生テーブル）を作るコマンドです。
+loadがSnowflakeに作るのと同じ名前・列の生テーブル（spaces, pages, page_bodies, views, viewers, _dlt_loads）を作ります。
+
+- 合成テナント: 1万〜100万ページ規模のテナントを、乱数のシードから決定的に生成します。
+- CSVのテナント: ui/tests/data の *.csv（pagesは本文を含む）を読み込みます。
+
+Examples:
+    # 10万ページ・100スペースのテナントを生成する
+    $ synthetic-tenant confluence.duckdb --schema confluence --pages 100000 --spaces 100
+    # ui/tests/data のCSVを読み込む
+    $ synthetic-tenant confluence.duckdb --schema confluence --csv-dir ../ui/tests/data
+"""
+import argparse
+import sys
+import time
+from datetime import date
+from pathlib import Path
+
+import duckdb
+
+# 合成テナントのロードID
+LOAD_ID = "1721870781.2151089"
+
+# ページIDの開始値（ui/tests/data のCSVと同じ）
+FIRST_PAGE_ID = 1000000
+
+# 生テーブルの作成順
+RAW_TABLES = ["_dlt_loads", "spaces", "pages", "page_bodies", "views", "viewers"]
+
+
+def generate_tenant(
+    conn,
+    schema: str,
+    pages: int = 10000,
+    spaces: int = 10,
+    seed: int = 0,
+    as_of: date = date(2024, 8, 1),
+    history_days: int = 365,
+    activity_days: int = 28,
+    fanout: int = 8,
+    view_probability: float = 0.3,
+):
+    """
+    合成テナントの生テーブルをschemaに作ります（既存のテーブルは置き換えます）。
+
+    ページはスペースに順番に割り振り、各スペースのページはfanout分木の木にします（スペースの最初のページが根）。
+    作成日時はページの番号順に history_days 日前から as_of まで並ぶため、親は必ず子より先に作成されています。
+    閲覧数・閲覧者数は、as_of までの activity_days 日間について、各ページ・各日を view_probability の確率で作ります。
+
+    Args:
+        conn: DuckDBの接続
+        schema: 生テーブルを作るスキーマ
+        pages: ページ数
+        spaces: スペース数
+        seed: 乱数のシード。同じ引数なら（同じバージョンのDuckDBでは）同じテナントになります（乱数はrandom()ではなく、シードを含めた値のhashで作るため）
+        as_of: ロード日（_dlt_loads.inserted_at の日付）
+        history_days: 最初のページの作成日の、as_of からの日数
+        activity_days: 閲覧数・閲覧者数を作る日数
+        fanout: ページの木の子の数
+        view_probability: ページ・日ごとに閲覧がある確率
+    """
+    conn.execute(f"create schema if not exists {schema}")
+    params = dict(
+        pages=pages,
+        spaces=spaces,
+        as_of=as_of,
+        history_seconds=history_days * 86400,
+        activity_days=activity_days,
+        fanout=fanout,
+        view_probability=view_probability,
+        seed=seed,
+        load_id=LOAD_ID,
+        first_page_id=FIRST_PAGE_ID,
+    )
+
+    conn.execute(f"""
+        create or replace table {schema}._dlt_loads as
+        select
+            $load_id as load_id,
+            'confluence' as schema_name,
+            0 as status,
+            $as_of::timestamptz as inserted_at,
+            'synthetic' as schema_version_hash
+    """, {k: params[k] for k in ["load_id", "as_of"]})
+
+    conn.execute(f"""
+        create or replace table {schema}.spaces as
+        select
+            $as_of::timestamptz - to_seconds($history_seconds) as created_at,
+            'synthetic-author' as author_id,
+            ($first_page_id + i)::varchar as homepage_id,
+            'スペース' || i as name,
+            'sp' || i as key,
+            (1000 + i)::varchar as id,
+            'global' as type,
+            'current' as status,
+            '/spaces/sp' || i as _links__webui,
+            $load_id as _dlt_load_id,
+            md5('space' || i)[:14] as _dlt_id
+        from
+            range($spaces) t(i)
+    """, {k: params[k] for k in ["as_of", "history_seconds", "first_page_id", "spaces", "load_id"]})
+
+    # n番目のページは、スペース n % spaces の、スペース内で n // spaces 番目のページ
+    # スペース内でi番目のページの親は、スペース内で (i - 1) // fanout 番目のページ
+    conn.execute(f"""
+        create or replace table {schema}.pages as
+        with numbered as (
+            select
+                n,
+                n % $spaces as space_index,
+                n // $spaces as index_in_space,
+                $as_of::timestamptz - to_seconds($history_seconds)
+                    + to_seconds(($history_seconds * n // $pages)::bigint) as created_at,
+                (hash(n, $seed) % 5)::integer as edits
+            from
+                range($pages) t(n)
+        )
+        select
+            if(index_in_space = 0, null, 'page') as parent_type,
+            created_at,
+            'author' || (n % 97) as author_id,
+            ($first_page_id + n)::varchar as id,
+            1 + edits as version__number,
+            null::varchar as version__message,
+            false as version__minor_edit,
+            'author' || ((n + edits) % 97) as version__author_id,
+            least(created_at + to_days(edits * 7), $as_of::timestamptz) as version__created_at,
+            null::bigint as position,
+            'ページ ' || n as title,
+            'current' as status,
+            (1000 + space_index)::varchar as space_id,
+            if(
+                index_in_space = 0,
+                null,
+                ($first_page_id + ((index_in_space - 1) // $fanout) * $spaces + space_index)::varchar
+            ) as parent_id,
+            'author' || (n % 97) as owner_id,
+            '/pages/edit-v2.action?pageId=' || ($first_page_id + n) as _links__editui,
+            '/spaces/sp' || space_index || '/pages/' || ($first_page_id + n) as _links__webui,
+            '/x/' || n as _links__tinyui,
+            $load_id as _dlt_load_id,
+            md5('page' || n)[:14] as _dlt_id
+        from
+            numbered
+    """, {k: params[k] for k in ["spaces", "as_of", "history_seconds", "pages", "seed", "first_page_id", "fanout", "load_id"]})
+
+    conn.execute(f"""
+        create or replace table {schema}.page_bodies as
+        select
+            id as page_id,
+            version__number as version,
+            '<h1>' || title || '</h1>'
+                || '<p>' || repeat('このページは合成テナントの本文です。', (1 + hash(id, $seed) % 20)::integer) || '</p>'
+                || '<h2>手順</h2><ol><li><p>準備する</p></li><li><p>実行する</p></li></ol>'
+                || '<table><tbody><tr><th><p>項目</p></th><th><p>値</p></th></tr>'
+                || '<tr><td><p>バージョン</p></td><td><p>' || version__number || '</p></td></tr></tbody></table>'
+                as body__storage__value,
+            'storage' as body__storage__representation,
+            _dlt_load_id,
+            _dlt_id
+        from
+            {schema}.pages
+    """, {"seed": seed})
+
+    for table, column, scale in [("views", "views", 20), ("viewers", "viewers", 5)]:
+        conn.execute(f"""
+            create or replace table {schema}.{table} as
+            select
+                t1.id as page_id,
+                t2.date::date as date,
+                (1 + hash(t1.id, t2.date, $seed, '{column}') % {scale})::bigint as {column},
+                $load_id as _dlt_load_id,
+                md5(t1.id || t2.date::varchar)[:14] as _dlt_id
+            from
+                {schema}.pages t1
+                cross join range(
+                    $as_of::date - to_days($activity_days - 1),
+                    $as_of::date + to_days(1),
+                    interval 1 day
+                ) t2(date)
+            where
+                t2.date >= t1.created_at::date
+                and hash(t1.id, t2.date, $seed) % 1000000 < $view_probability * 1000000
+        """, {k: params[k] for k in ["load_id", "as_of", "activity_days", "view_probability", "seed"]})
+
+
+def timestamptz(column: str) -> str:
+    """CSVの日時の列をtimestamptzにする式を返します。"2024-07-01 12:00:00.000 +0000" のような時差の表記も読めるようにします。"""
+    return rf"regexp_replace({column}, ' ?([+-]\d{{2}}):?(\d{{2}})$', '\1:\2')::timestamptz"
+
+
+def load_csv_tenant(conn, schema: str, csv_dir: Path):
+    """
+    ui/tests/data のCSVからテナントの生テーブルをschemaに作ります（既存のテーブルは置き換えます）。
+
+    pages.csvは本文の列（BODY__STORAGE__*）を含むため、pagesとpage_bodiesに分けます。
+    views.csvがなければ、空のviewsを作ります。
+    """
+    conn.execute(f"create schema if not exists {schema}")
+    conn.execute(f"""
+        create or replace table {schema}._dlt_loads as
+        select
+            load_id::varchar as load_id,
+            schema_name,
+            status,
+            {timestamptz('inserted_at')} as inserted_at,
+            schema_version_hash
+        from
+            read_csv(?, header = true, all_varchar = true)
+    """, [str(csv_dir / "_dlt_loads.csv")])
+
+    conn.execute(f"""
+        create or replace table {schema}.spaces as
+        select
+            * replace ({timestamptz('created_at')} as created_at)
+        from
+            read_csv(?, header = true, all_varchar = true)
+    """, [str(csv_dir / "spaces.csv")])
+
+    conn.execute(f"""
+        create or replace table {schema}.pages as
+        select
+            * exclude (body__storage__value, body__storage__representation)
+            replace (
+                {timestamptz('created_at')} as created_at,
+                {timestamptz('version__created_at')} as version__created_at,
+                version__number::bigint as version__number,
+                nullif(parent_id, '') as parent_id,
+                nullif(parent_type, '') as parent_type
+            )
+        from
+            read_csv(?, header = true, all_varchar = true)
+    """, [str(csv_dir / "pages.csv")])
+
+    conn.execute(f"""
+        create or replace table {schema}.page_bodies as
+        select
+            id as page_id,
+            version__number::bigint as version,
+            body__storage__value,
+            body__storage__representation,
+            _dlt_load_id,
+            _dlt_id
+        from
+            read_csv(?, header = true, all_varchar = true)
+    """, [str(csv_dir / "pages.csv")])
+
+    for table in ["views", "viewers"]:
+        path = csv_dir / f"{table}.csv"
+        if path.is_file():
+            conn.execute(f"""
+                create or replace table {schema}.{table} as
+                select
+                    * replace (date::date as date, {table}::bigint as {table})
+                from
+                    read_csv(?, header = true, all_varchar = true)
+            """, [str(path)])
+        else:
+            conn.execute(f"""
+                create or replace table {schema}.{table} (
+                    page_id varchar,
+                    date date,
+                    {table} bigint,
+                    _dlt_load_id varchar,
+                    _dlt_id varchar
+                )
+            """)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="synthetic-tenant",
+        description="dbtのモデルとUIのクエリをローカルで実行するための、テナントの生テーブルをDuckDBに作ります。",
+    )
+    parser.add_argument("database", type=Path, help="DuckDBのデータベースファイル")
+    parser.add_argument("--schema", required=True, help="生テーブルを作るスキーマ（dbtの環境変数SCHEMAと同じ）")
+    parser.add_argument("--csv-dir", type=Path, help="CSVを読み込むディレクトリ。指定しなければ合成テナントを生成する")
+    parser.add_argument("--pages", type=int, default=10000, help="ページ数")
+    parser.add_argument("--spaces", type=int, default=10, help="スペース数")
+    parser.add_argument("--seed", type=int, default=0, help="乱数のシード")
+    parser.add_argument("--as-of", type=date.fromisoformat, default=date(2024, 8, 1), help="ロード日（YYYY-MM-DD）")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    with duckdb.connect(str(args.database)) as conn:
+        if args.csv_dir is not None:
+            load_csv_tenant(conn, args.schema, args.csv_dir)
+        else:
+            generate_tenant(conn, args.schema, args.pages, args.spaces, args.seed, args.as_of)
+        counts = {
+            table: conn.execute(f"select count(*) from {args.schema}.{table}").fetchone()[0] for table in RAW_TABLES
+        }
+    elapsed = time.perf_counter() - start
+
+    print(
+        f"created {', '.join(f'{table}={count}' for table, count in counts.items())} in {elapsed:.2f}s",
+        file=sys.stderr,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from transform.synthetic import load_csv_tenant
+
+from ui import local, queries
+
+# uiのテストデータ（transformのsynthetic-tenantでテナントの生テーブルにする）
+TEST_DATA_DIR = Path(__file__).resolve().parents[2] / "tests" / "data"
+DBT_PROJECT_DIR = Path(__file__).resolve().parents[3] / "transform" / "data_transform"
+
+
+@pytest.fixture(scope="session")
+def duckdb_path(tmp_path_factory):
+    """duckdb_path
+    テストデータのテナントに dbt run --target duckdb を実行したデータベースファイルのパスを返します。
+    queries.pyのクエリがそのまま実行できるように、ファイル名とスキーマはUI__DATABASE, UI__SCHEMA（queries.DATABASE, queries.SCHEMA）に合わせます。
+    """
+    import duckdb
+
+    tmp_path = tmp_path_factory.mktemp("duckdb")
+    path = tmp_path / f"{queries.DATABASE}.duckdb"
+    with duckdb.connect(str(path)) as conn:
+        load_csv_tenant(conn, queries.SCHEMA, TEST_DATA_DIR)
+    subprocess.run(
+        [
+            sys.executable, "-m", "dbt.cli.main", "run",
+            "--target", "duckdb",
+            "--profiles-dir", ".",
+            "--target-path", str(tmp_path / "target"),
+            "--log-path", str(tmp_path / "logs"),
+        ],
+        cwd=DBT_PROJECT_DIR,
+        env={**os.environ, "DBT__DUCKDB_PATH": str(path), "DATABASE": queries.DATABASE, "SCHEMA": queries.SCHEMA},
+        check=True,
+        capture_output=True,
+    )
+    return str(path)
+
+
+@pytest.mark.unit
+class TestLocal:
+
+    def test__benchmark_cases__run(self, duckdb_path):
+        """test__benchmark_cases__run
+        benchmark_casesのクエリが、それぞれのパラメータでdbtのモデルに実行できる
+        """
+        cases = local.benchmark_cases(duckdb_path)
+
+        assert [name for name, _, _ in cases] == [
+            "ALL_SPACES",
+            "LAST_RUN_DATE_QUERY",
+            "RECENT_PAGE_ACTIVITY_QUERY",
+            "RECENT_PAGE_ACTIVITY_DETAILS_QUERY",
+            "OUTDATED_PAGE_ACTIVITY_QUERY",
+            "OUTDATED_PAGE_ACTIVITY_DETAILS_QUERY",
+            "PAGES_UNIQUE_USER_ACCESS_HISTORY_QUERY",
+            "PAGE_MD_CONTENTS_QUERY",
+            "SEARCH_ASSISTANT_QUERY",
+        ]
+        for name, query, params in cases:
+            table = local.execute_arrow(duckdb_path, query, params)
+            assert table.num_columns > 0, name
+
+    def test__benchmark_cases__details_first_page(self, duckdb_path):
+        """test__benchmark_cases__details_first_page
+        詳細情報のクエリは、最初のページ（PAGE_SIZEより1行多くまで）をrow_orderの順に返す
+        """
+        cases = {name: (query, params) for name, query, params in local.benchmark_cases(duckdb_path)}
+
+        for name in ["RECENT_PAGE_ACTIVITY_DETAILS_QUERY", "OUTDATED_PAGE_ACTIVITY_DETAILS_QUERY"]:
+            row_orders = local.execute_arrow(duckdb_path, *cases[name]).column("ROW_ORDER").to_pylist()
+            assert len(row_orders) <= queries.PAGE_SIZE + 1
+            assert row_orders == sorted(row_orders)
+
+    def test__main(self, duckdb_path, capsys):
+        """test__main
+        python -m ui.local が、すべてのクエリのレイテンシを表示する
+        """
+        assert local.main([duckdb_path, "--repeat", "2"]) == 0
+
+        lines = capsys.readouterr().out.splitlines()
+        assert len(lines) == 9
+        assert all(" ms" in line for line in lines)
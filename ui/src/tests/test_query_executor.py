@@ -0,0 +1,209 @@
+import threading
+import time
+from concurrent.futures import CancelledError
+
+import pytest
+
+from ui.query_executor import QueryExecutor, QueryTimeoutError
+from ui.result_cache import LoadScopedCache
+
+
+class FakeJob:
+    """is_doneがTrueになるまで結果を返さない、偽のAsyncJob"""
+    def __init__(self, sql, params, delay, error=None):
+        self.sql = sql
+        self.params = params
+        self.done_at = time.monotonic() + delay
+        self.error = error
+        self.cancelled = False
+
+    def is_done(self):
+        return time.monotonic() >= self.done_at
+
+    def cancel(self):
+        self.cancelled = True
+
+    def result(self):
+        if self.error is not None:
+            raise self.error
+        return (self.sql, tuple(self.params))
+
+
+class FakeLaunch:
+    """クエリ本文ごとの所要秒数（と結果を取り出すときの例外）でFakeJobを起動し、起動したジョブを記録するlaunch"""
+    def __init__(self, delays, errors=None):
+        self._delays = delays
+        self._errors = errors or {}
+        self._lock = threading.Lock()
+        self.jobs = []
+
+    def __call__(self, sql, params):
+        job = FakeJob(sql, params, self._delays.get(sql, 0.0), self._errors.get(sql))
+        with self._lock:
+            self.jobs.append(job)
+        return job
+
+
+@pytest.fixture
+def executor_factory():
+    executors = []
+
+    def create(launch, **kwargs):
+        kwargs.setdefault("min_poll_interval", 0.001)
+        kwargs.setdefault("max_poll_interval", 0.01)
+        executor = QueryExecutor(launch, **kwargs)
+        executors.append(executor)
+        return executor
+
+    yield create
+    for executor in executors:
+        executor.shutdown()
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "condition was not met"
+        time.sleep(0.005)
+
+
+@pytest.mark.unit
+class TestQueryExecutor:
+
+    def test__as_completed__out_of_order(self, executor_factory):
+        """test__as_completed__out_of_order
+        as_completedは終わった順に返し、クエリの番号で投入した順の結果と対応づけられる
+        """
+        launch = FakeLaunch({"slow": 0.2, "medium": 0.1, "fast": 0.0})
+        executor = executor_factory(launch)
+
+        with executor.submit([("slow", (1,)), ("medium", (2,)), ("fast", (3,))]) as batch:
+            completed = list(batch.as_completed())
+
+        assert [index for index, _ in completed] == [2, 1, 0]
+        assert dict(completed) == {0: ("slow", (1,)), 1: ("medium", (2,)), 2: ("fast", (3,))}
+
+    def test__results__submitted_order(self, executor_factory):
+        """test__results__submitted_order
+        resultsは、終わった順に関係なく投入した順に返す
+        """
+        launch = FakeLaunch({"slow": 0.1})
+        executor = executor_factory(launch)
+
+        with executor.submit([("slow", ()), ("fast", ())]) as batch:
+            results = batch.results()
+
+        assert results == [("slow", ()), ("fast", ())]
+        assert sorted(timing.status for timing in batch.timings) == ["done", "done"]
+
+    def test__submit__timeout(self, executor_factory):
+        """test__submit__timeout
+        タイムアウトを過ぎたクエリは、ジョブをキャンセルしてQueryTimeoutErrorを送出する。他のクエリの結果は返す
+        """
+        launch = FakeLaunch({"slow": 60})
+        executor = executor_factory(launch, timeout=0.1)
+
+        start = time.monotonic()
+        with executor.submit([("slow", ()), ("fast", ())]) as batch:
+            completed = batch.as_completed()
+            assert next(completed) == (1, ("fast", ()))
+            with pytest.raises(QueryTimeoutError):
+                next(completed)
+        assert time.monotonic() - start < 5
+
+        slow_job = next(job for job in launch.jobs if job.sql == "slow")
+        assert slow_job.cancelled
+        wait_until(lambda: len(batch.timings) == 2)
+        assert {timing.index: timing.status for timing in batch.timings} == {0: "timeout", 1: "done"}
+
+    def test__submit__per_query_timeout(self, executor_factory):
+        """test__submit__per_query_timeout
+        クエリごとのタイムアウト（3つ目の要素）は、実行器のデフォルトより優先する
+        """
+        launch = FakeLaunch({"slow": 60})
+        executor = executor_factory(launch, timeout=None)
+
+        with executor.submit([("slow", (), 0.05)]) as batch:
+            with pytest.raises(QueryTimeoutError):
+                batch.results()
+
+    def test__cancel__stops_running_jobs(self, executor_factory):
+        """test__cancel__stops_running_jobs
+        with文を抜けると、終わっていないクエリのジョブをキャンセルし、待っていたスレッドも止まる
+        """
+        launch = FakeLaunch({"slow": 60})
+        executor = executor_factory(launch, max_workers=2)
+
+        with executor.submit([("slow", ()), ("fast", ())]) as batch:
+            index, result = next(batch.as_completed())
+            assert (index, result) == (1, ("fast", ()))
+            wait_until(lambda: len(launch.jobs) == 2)
+
+        slow_job = next(job for job in launch.jobs if job.sql == "slow")
+        wait_until(lambda: slow_job.cancelled)
+        wait_until(lambda: len(batch.timings) == 2)
+        assert {timing.index: timing.status for timing in batch.timings} == {0: "cancelled", 1: "done"}
+
+        # スレッドが解放され、次のバッチを実行できる
+        with executor.submit([("fast", (1,)), ("fast", (2,))]) as batch:
+            assert batch.results() == [("fast", (1,)), ("fast", (2,))]
+
+    def test__cancel__queued_queries_are_not_launched(self, executor_factory):
+        """test__cancel__queued_queries_are_not_launched
+        スレッドの空きを待っているクエリは、キャンセルしたら起動しない
+        """
+        launch = FakeLaunch({"slow": 60})
+        executor = executor_factory(launch, max_workers=1)
+
+        batch = executor.submit([("slow", ()), ("queued", ())])
+        wait_until(lambda: len(launch.jobs) == 1)
+        batch.cancel()
+
+        with pytest.raises(CancelledError):
+            batch.results()
+        time.sleep(0.05)
+        assert [job.sql for job in launch.jobs] == ["slow"]
+
+    def test__as_completed__error(self, executor_factory):
+        """test__as_completed__error
+        失敗したクエリの例外は、as_completedで結果を受け取るときに送出する
+        """
+        launch = FakeLaunch({}, errors={"broken": ValueError("syntax error")})
+        executor = executor_factory(launch)
+
+        with executor.submit([("broken", ())]) as batch:
+            with pytest.raises(ValueError, match="syntax error"):
+                list(batch.as_completed())
+        wait_until(lambda: len(batch.timings) == 1)
+        assert batch.timings[0].status == "error"
+
+    def test__submit__cached_by_load_id(self, executor_factory):
+        """test__submit__cached_by_load_id
+        キャッシュを渡すと、同じ (クエリ, パラメータ) は最新のロードIDの間クエリを起動せずに返し、ロードIDが変わったら起動し直す
+        """
+        load_ids = iter(["load-1", "load-1", "load-2"])
+        cache = LoadScopedCache(lambda: next(load_ids), check_interval=0)
+        launch = FakeLaunch({})
+        executor = executor_factory(launch, cache=cache)
+
+        for _ in range(3):
+            with executor.submit([("fast", (1,))], scope="space-a") as batch:
+                assert batch.results() == [("fast", (1,))]
+
+        assert len(launch.jobs) == 2
+        assert batch.timings[0].status == "done"
+
+    def test__submit__background(self, executor_factory):
+        """test__submit__background
+        background=Trueで投入したクエリは別のスレッドプールでbackground_workers個ずつ実行し、あとから投入した画面のクエリを待たせない
+        """
+        launch = FakeLaunch({"slow": 0.5})
+        executor = executor_factory(launch, max_workers=1, background_workers=1)
+
+        background = executor.submit([("slow", (1,)), ("slow", (2,))], background=True)
+        wait_until(lambda: len(launch.jobs) == 1)
+        with executor.submit([("fast", ())]) as batch:
+            assert batch.results() == [("fast", ())]
+
+        assert [job.sql for job in launch.jobs] == ["slow", "fast"]
+        assert background.results() == [("slow", (1,)), ("slow", (2,))]
@@ -0,0 +1,225 @@
+import threading
+
+import pytest
+
+from ui.result_cache import MISSING, LoadScopedCache
+
+
+class FakeLoadIds:
+    """最新のロードIDを、テストから切り替えられるfetch_load_id"""
+    def __init__(self, load_id="load-1"):
+        self.load_id = load_id
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if isinstance(self.load_id, Exception):
+            raise self.load_id
+        return self.load_id
+
+
+class Sized:
+    """estimate_sizeでnbytesバイトと見積もられる結果"""
+    def __init__(self, nbytes):
+        self.nbytes = nbytes
+
+
+@pytest.fixture
+def load_ids():
+    return FakeLoadIds()
+
+
+@pytest.mark.unit
+class TestLoadScopedCache:
+
+    def test__get__hit_and_miss(self, load_ids):
+        """test__get__hit_and_miss
+        保存した結果はgetで返し、保存していないキーはMISSINGを返す
+        """
+        cache = LoadScopedCache(load_ids, check_interval=0)
+        load_id = cache.load_id()
+
+        assert cache.get(load_id, "a") is MISSING
+        cache.put(load_id, "a", None)
+
+        assert cache.get(load_id, "a") is None
+        stats = cache.stats()
+        assert (stats.hits, stats.misses, stats.entries) == (1, 1, 1)
+
+    def test__put__evicts_least_recently_used(self, load_ids):
+        """test__put__evicts_least_recently_used
+        合計がmax_bytesを超えたら、最も長く使われていない結果から捨てる（getで使うと新しくなる）
+        """
+        cache = LoadScopedCache(load_ids, check_interval=0, max_bytes=300)
+        load_id = cache.load_id()
+        cache.put(load_id, "a", Sized(100))
+        cache.put(load_id, "b", Sized(100))
+        cache.put(load_id, "c", Sized(100))
+        cache.get(load_id, "a")
+
+        cache.put(load_id, "d", Sized(100))
+
+        assert cache.get(load_id, "b") is MISSING
+        assert all(cache.get(load_id, key) is not MISSING for key in ["a", "c", "d"])
+        stats = cache.stats()
+        assert stats.evictions == 1
+        assert stats.bytes == 300
+
+    def test__put__replaces_same_key(self, load_ids):
+        """test__put__replaces_same_key
+        同じキーに保存し直したら、前の結果の大きさを合計から引く
+        """
+        cache = LoadScopedCache(load_ids, check_interval=0, max_bytes=300)
+        load_id = cache.load_id()
+        cache.put(load_id, "a", Sized(200))
+        cache.put(load_id, "a", Sized(100))
+
+        assert cache.stats().bytes == 100
+        assert cache.get(load_id, "a").nbytes == 100
+
+    def test__put__too_large(self, load_ids):
+        """test__put__too_large
+        max_bytesより大きい結果は保存せず、他の結果も捨てない
+        """
+        cache = LoadScopedCache(load_ids, check_interval=0, max_bytes=300)
+        load_id = cache.load_id()
+        cache.put(load_id, "a", Sized(100))
+
+        cache.put(load_id, "b", Sized(400))
+
+        assert cache.get(load_id, "b") is MISSING
+        assert cache.get(load_id, "a") is not MISSING
+
+    def test__load_id__invalidates_on_new_load(self, load_ids):
+        """test__load_id__invalidates_on_new_load
+        ロードIDが変わったら、保存していた結果をすべて捨てる
+        """
+        cache = LoadScopedCache(load_ids, check_interval=0)
+        old_load_id = cache.load_id()
+        cache.put(old_load_id, "a", Sized(100))
+
+        load_ids.load_id = "load-2"
+        new_load_id = cache.load_id()
+
+        assert new_load_id == "load-2"
+        assert cache.get(new_load_id, "a") is MISSING
+        stats = cache.stats()
+        assert (stats.load_id, stats.entries, stats.bytes, stats.invalidations) == ("load-2", 0, 0, 1)
+
+    def test__get__stale_load_id(self, load_ids):
+        """test__get__stale_load_id
+        古いロードIDでgetしても、新しいロードIDで保存した結果は返さない
+        """
+        cache = LoadScopedCache(load_ids, check_interval=0)
+        old_load_id = cache.load_id()
+        load_ids.load_id = "load-2"
+        new_load_id = cache.load_id()
+        cache.put(new_load_id, "a", Sized(100))
+
+        assert cache.get(old_load_id, "a") is MISSING
+
+    def test__put__rejects_stale_load_id(self, load_ids):
+        """test__put__rejects_stale_load_id
+        計算中にロードIDが変わったら、古いロードIDで計算した結果は保存しない
+        """
+        cache = LoadScopedCache(load_ids, check_interval=0)
+        old_load_id = cache.load_id()
+        load_ids.load_id = "load-2"
+        new_load_id = cache.load_id()
+
+        cache.put(old_load_id, "a", Sized(100))
+
+        assert cache.get(new_load_id, "a") is MISSING
+        assert cache.stats().entries == 0
+
+    def test__load_id__check_interval(self, load_ids):
+        """test__load_id__check_interval
+        前回の確認からcheck_interval秒たつまでは、ロードIDを確認し直さない
+        """
+        cache = LoadScopedCache(load_ids, check_interval=3600)
+        cache.load_id()
+        load_ids.load_id = "load-2"
+
+        assert cache.load_id() == "load-1"
+        assert load_ids.calls == 1
+
+    def test__load_id__fetch_failure_keeps_results(self, load_ids):
+        """test__load_id__fetch_failure_keeps_results
+        ロードIDの確認に失敗しても、前回のロードIDと保存した結果を使い続ける
+        """
+        cache = LoadScopedCache(load_ids, check_interval=0)
+        load_id = cache.load_id()
+        cache.put(load_id, "a", Sized(100))
+        load_ids.load_id = ConnectionError("warehouse is suspended")
+
+        assert cache.load_id() == "load-1"
+        assert cache.get(load_id, "a") is not MISSING
+
+    def test__on_new_load__most_viewed_scopes(self, load_ids):
+        """test__on_new_load__most_viewed_scopes
+        ロードIDが変わったら、よく見られているスコープprewarm_scopes個でon_new_loadを呼ぶ。最初の確認では呼ばない
+        """
+        calls = []
+        called = threading.Event()
+
+        def on_new_load(*args):
+            calls.append(args)
+            called.set()
+
+        cache = LoadScopedCache(load_ids, check_interval=0, on_new_load=on_new_load, prewarm_scopes=2)
+        load_id = cache.load_id()
+        for scope, views in [("space-a", 1), ("space-b", 3), ("space-c", 2)]:
+            for _ in range(views):
+                cache.get(load_id, "a", scope=scope)
+        assert calls == []
+
+        load_ids.load_id = "load-2"
+        cache.load_id()
+
+        assert called.wait(5)
+        assert calls == [("load-2", ["space-b", "space-c"])]
+
+    def test__on_new_load__does_not_block(self, load_ids):
+        """test__on_new_load__does_not_block
+        on_new_loadは別のスレッドで呼ぶため、終わるのを待たずにload_idが新しいロードIDを返す。on_new_loadの例外は送出しない
+        """
+        started, release, finished = threading.Event(), threading.Event(), threading.Event()
+
+        def on_new_load(load_id, scopes):
+            started.set()
+            try:
+                release.wait(5)
+                raise RuntimeError("prewarm failed")
+            finally:
+                finished.set()
+
+        cache = LoadScopedCache(load_ids, check_interval=0, on_new_load=on_new_load)
+        cache.load_id()
+        load_ids.load_id = "load-2"
+
+        assert cache.load_id() == "load-2"
+        assert started.wait(5)
+        assert not finished.is_set()
+        release.set()
+        assert finished.wait(5)
+
+    def test__put__concurrent(self, load_ids):
+        """test__put__concurrent
+        複数のスレッドから保存しても、合計のバイト数がmax_bytesを超えない
+        """
+        cache = LoadScopedCache(load_ids, check_interval=0, max_bytes=1000)
+        load_id = cache.load_id()
+
+        def put_many(thread):
+            for i in range(200):
+                cache.put(load_id, (thread, i), Sized(10))
+
+        threads = [threading.Thread(target=put_many, args=(thread,)) for thread in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        stats = cache.stats()
+        assert stats.bytes == 1000
+        assert stats.entries == 100
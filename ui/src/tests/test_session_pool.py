@@ -0,0 +1,229 @@
+import itertools
+import threading
+import time
+
+import pytest
+
+from ui.session_pool import SessionPool
+
+
+class FakeSession:
+    """作られた順に番号を持つ、偽のSnowflakeのセッション"""
+    def __init__(self, number):
+        self.number = number
+        self.alive = True
+        self.closed = False
+
+
+class SessionExpired(Exception):
+    """セッションの期限切れを表す例外"""
+
+
+class FakeSessionFactory:
+    """FakeSessionを作り、作ったセッションを記録するcreate_session"""
+    def __init__(self):
+        self._numbers = itertools.count()
+        self.sessions = []
+
+    def __call__(self):
+        session = FakeSession(next(self._numbers))
+        self.sessions.append(session)
+        return session
+
+
+def health_check(session):
+    if not session.alive:
+        raise ConnectionError("session is dead")
+
+
+def close_session(session):
+    session.closed = True
+
+
+@pytest.fixture
+def factory():
+    return FakeSessionFactory()
+
+
+def run_in_thread(pool, function, timeout=5):
+    """pool.runを別スレッドで実行し、timeout秒以内に終わらなければ失敗させる（プールが詰まってもテストが止まらないように）"""
+    results = []
+    thread = threading.Thread(target=lambda: results.append(pool.run(function)), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "pool.run did not return"
+    return results[0]
+
+
+@pytest.mark.unit
+class TestSessionPool:
+
+    def test__run__concurrency_is_capped(self, factory):
+        """test__run__concurrency_is_capped
+        同時に実行される処理は size * max_concurrency 件までで、超えた分は空くまで待つ
+        """
+        pool = SessionPool(factory, size=2, max_concurrency=2)
+        lock = threading.Lock()
+        running = 0
+        max_running = 0
+        per_session = {}
+        max_per_session = 0
+
+        def function(session):
+            nonlocal running, max_running, max_per_session
+            with lock:
+                running += 1
+                max_running = max(max_running, running)
+                per_session[session.number] = per_session.get(session.number, 0) + 1
+                max_per_session = max(max_per_session, per_session[session.number])
+            time.sleep(0.05)
+            with lock:
+                running -= 1
+                per_session[session.number] -= 1
+
+        threads = [threading.Thread(target=pool.run, args=(function,)) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+
+        assert max_running == 4
+        assert max_per_session == 2
+        assert len(factory.sessions) == 2
+        metrics = pool.metrics()
+        assert metrics.sessions == 2
+        assert metrics.acquisitions == 10
+        assert metrics.handshakes == 2
+        assert metrics.waits > 0
+
+    def test__run__reuses_session(self, factory):
+        """test__run__reuses_session
+        順に実行した処理は、同じセッションを使い回す
+        """
+        pool = SessionPool(factory, size=2)
+
+        numbers = [pool.run(lambda session: session.number) for _ in range(5)]
+
+        assert numbers == [0] * 5
+        assert pool.metrics().reuses == 4
+        assert pool.metrics().reuse_ratio == pytest.approx(0.8)
+
+    def test__run__health_check_reconnects_dead_session(self, factory):
+        """test__run__health_check_reconnects_dead_session
+        health_check_interval秒以上使われていないセッションが死活確認に失敗したら、作り直して古いセッションを閉じる
+        """
+        pool = SessionPool(
+            factory, size=1, health_check_interval=0, health_check=health_check, close_session=close_session
+        )
+        first = pool.run(lambda session: session)
+        first.alive = False
+
+        second = pool.run(lambda session: session)
+
+        assert second is not first
+        assert first.closed
+        metrics = pool.metrics()
+        assert metrics.health_check_failures == 1
+        assert metrics.reconnects == 1
+        assert metrics.sessions == 1
+
+    def test__run__health_check_skipped_for_recent_session(self, factory):
+        """test__run__health_check_skipped_for_recent_session
+        最近使われたセッションは、死活確認をせずに貸し出す
+        """
+        checked = []
+        pool = SessionPool(factory, size=1, health_check_interval=300, health_check=checked.append)
+
+        pool.run(lambda session: None)
+        pool.run(lambda session: None)
+
+        assert checked == []
+
+    def test__run__expired_session_is_replaced(self, factory):
+        """test__run__expired_session_is_replaced
+        処理がセッションの期限切れで失敗したら、セッションを作り直して1回だけ再実行する
+        """
+        pool = SessionPool(
+            factory, size=1, is_expired=lambda e: isinstance(e, SessionExpired), close_session=close_session
+        )
+        pool.run(lambda session: None)
+
+        def function(session):
+            if session.number == 0:
+                raise SessionExpired()
+            return session.number
+
+        assert pool.run(function) == 1
+        assert factory.sessions[0].closed
+        assert pool.metrics().reconnects == 1
+        # 作り直したセッションを、以降も使い回す
+        assert pool.run(lambda session: session.number) == 1
+
+    def test__run__expired_twice_raises(self, factory):
+        """test__run__expired_twice_raises
+        作り直したセッションでも期限切れになれば、再実行せずに例外を送出する
+        """
+        pool = SessionPool(factory, size=1, is_expired=lambda e: isinstance(e, SessionExpired))
+
+        def function(session):
+            raise SessionExpired()
+
+        with pytest.raises(SessionExpired):
+            pool.run(function)
+        assert len(factory.sessions) == 2
+
+    def test__run__releases_slot_when_function_raises(self, factory):
+        """test__run__releases_slot_when_function_raises
+        処理が例外を送出しても、セッションの枠を返す（1枠しかないプールでも次の処理が実行できる）
+        """
+        pool = SessionPool(factory, size=1, max_concurrency=1)
+
+        def function(session):
+            raise ValueError("query failed")
+
+        for _ in range(3):
+            with pytest.raises(ValueError):
+                pool.run(function)
+
+        assert run_in_thread(pool, lambda session: session.number) == 0
+
+    def test__run__releases_slot_when_create_fails(self):
+        """test__run__releases_slot_when_create_fails
+        セッションの作成に失敗したら、その枠を捨てて、次の処理で作り直す
+        """
+        attempts = []
+
+        def create_session():
+            attempts.append(None)
+            if len(attempts) == 1:
+                raise ConnectionError("login failed")
+            return FakeSession(len(attempts))
+
+        pool = SessionPool(create_session, size=1, max_concurrency=1)
+
+        with pytest.raises(ConnectionError):
+            pool.run(lambda session: session)
+        assert pool.metrics().sessions == 0
+
+        assert run_in_thread(pool, lambda session: session.number) == 2
+
+    def test__close__closes_all_sessions(self, factory):
+        """test__close__closes_all_sessions
+        closeで、作ったすべてのセッションを閉じる
+        """
+        pool = SessionPool(factory, size=2, close_session=close_session)
+        pool.run(lambda session: None)
+
+        pool.close()
+
+        assert all(session.closed for session in factory.sessions)
+        assert pool.metrics().sessions == 0
+
+    def test__init__invalid_size(self, factory):
+        """test__init__invalid_size
+        sizeやmax_concurrencyが1未満ならValueErrorを送出する
+        """
+        with pytest.raises(ValueError):
+            SessionPool(factory, size=0)
+        with pytest.raises(ValueError):
+            SessionPool(factory, max_concurrency=0)
@@ -0,0 +1,146 @@
+import pyarrow as pa
+import pytest
+
+from ui import utils
+from ui.utils import ArrowAsyncJob
+
+
+class FakeCursor:
+    """クエリIDごとの結果を、コネクタのカーソルと同じメソッドで返す偽のカーソル"""
+    def __init__(self, results):
+        self._results = results
+        self._query_id = None
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.closed = True
+
+    def get_results_from_sfqid(self, query_id):
+        self._query_id = query_id
+
+    def fetch_arrow_all(self, force_return_table=False):
+        table = self._results[self._query_id]
+        if table.num_rows == 0 and not force_return_table:
+            return None
+        return table
+
+
+class FakeConnection:
+    def __init__(self, results):
+        self._results = results
+        self.cursors = []
+
+    def cursor(self):
+        cursor = FakeCursor(self._results)
+        self.cursors.append(cursor)
+        return cursor
+
+
+class FakeAsyncJob:
+    def __init__(self, query_id, done):
+        self.query_id = query_id
+        self._done = done
+        self.cancelled = False
+
+    def is_done(self):
+        return self._done
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class FakeSession:
+    """クエリIDからAsyncJobとカーソルで結果を取り出せる、偽のSnowflakeのセッション"""
+    def __init__(self, results, done=True):
+        self.connection = FakeConnection(results)
+        self._done = done
+        self.jobs = []
+
+    def create_async_job(self, query_id):
+        job = FakeAsyncJob(query_id, self._done)
+        self.jobs.append(job)
+        return job
+
+
+class FakePool:
+    """runのたびに同じセッションを貸し出し、貸し出した回数を数える偽のSessionPool"""
+    def __init__(self, session):
+        self._session = session
+        self.runs = 0
+
+    def run(self, func):
+        self.runs += 1
+        return func(self._session)
+
+
+@pytest.mark.unit
+class TestArrowAsyncJob:
+
+    def test__result__finished(self):
+        """test__result__finished
+        完了したクエリの結果を、プールから借りたセッションのカーソルでpyarrow.Tableとして取り出し、カーソルを閉じる
+        """
+        table = pa.table({"PAGE_ID": ["1", "2"], "VIEWS": [3, 4]})
+        session = FakeSession({"query-1": table, "query-2": pa.table({"PAGE_ID": ["9"]})})
+        pool = FakePool(session)
+
+        result = ArrowAsyncJob(pool, "query-1").result()
+        assert result.equals(table)
+        assert pool.runs == 1
+        assert [cursor.closed for cursor in session.connection.cursors] == [True]
+
+    def test__result__empty(self):
+        """test__result__empty
+        0件の結果でもNoneではなく、列を持つ空のテーブルを返す
+        """
+        schema = pa.schema([("PAGE_ID", pa.string()), ("VIEWS", pa.int64())])
+        pool = FakePool(FakeSession({"query-1": schema.empty_table()}))
+
+        result = ArrowAsyncJob(pool, "query-1").result()
+        assert result.num_rows == 0
+        assert result.schema.equals(schema)
+
+    def test__is_done_and_cancel(self):
+        """test__is_done_and_cancel
+        状態の確認とキャンセルは、そのたびにプールからセッションを借りて、クエリIDで行う
+        """
+        session = FakeSession({}, done=False)
+        pool = FakePool(session)
+        job = ArrowAsyncJob(pool, "query-1")
+
+        assert job.is_done() is False
+        job.cancel()
+        assert pool.runs == 2
+        assert [async_job.query_id for async_job in session.jobs] == ["query-1", "query-1"]
+        assert session.jobs[-1].cancelled
+
+
+class FakeExecutor:
+    """submitに渡された引数を記録する、偽のQueryExecutor"""
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, queries, scope=None, background=False):
+        self.submitted.append((queries, scope, background))
+
+
+@pytest.mark.unit
+class TestPrewarm:
+
+    def test__prewarm__background_without_scope(self, monkeypatch):
+        """test__prewarm__background_without_scope
+        登録したクエリを、スペースごとにbackground=Trueで投入し、スペースが見られた回数には数えない（scopeを渡さない）
+        """
+        executor = FakeExecutor()
+        monkeypatch.setattr(utils, "get_query_executor", lambda: executor)
+        monkeypatch.setattr(utils, "PREWARM_QUERY_BUILDERS", {"queries": lambda space_id: [("QUERY", (space_id,))]})
+
+        utils.prewarm("load-2", ["space-a", "space-b"])
+
+        assert executor.submitted == [
+            ([("QUERY", ("space-a",))], None, True),
+            ([("QUERY", ("space-b",))], None, True),
+        ]
@@ -2,7 +2,7 @@ from pathlib import Path
 
 import streamlit as st
 from ui.queries import PAGE_MD_CONTENTS_QUERY, REVIEW_QUERY
-from ui.utils import create_execute_query
+from ui.utils import cache_by_load, create_execute_query
 
 TEMPLATES = {
     "レビュー用プロンプト": """
@@ -25,7 +25,7 @@ TEMPLATES = {
 """
 }
 
-@st.cache_data
+@cache_by_load
 def get_md_contents(page_id):
     """
     ページの本文（マークダウン）の取得
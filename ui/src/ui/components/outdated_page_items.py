@@ -1,10 +1,19 @@
 from dataclasses import dataclass
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 import streamlit as st
-import pandas as pd
+import pyarrow as pa
 
-from ui.queries import LAST_RUN_DATE_QUERY, OUTDATED_PAGE_ACTIVITY_DETAILS_QUERY, OUTDATED_PAGE_ACTIVITY_QUERY
-from ui.utils import create_execute_queries
+from ui.queries import PAGE_SIZE, LAST_RUN_DATE_QUERY, OUTDATED_PAGE_ACTIVITY_DETAILS_QUERY, OUTDATED_PAGE_ACTIVITY_QUERY
+from ui.utils import register_prewarm_queries, submit_queries
+from ui.components import page_navigation
+
+# タブのキーと、活動状態（詳細テーブルのactivity_category）の対応
+CATEGORIES = {
+    'hot_page': "活発なページ",
+    'stable_page': "安定したページ",
+    'unread_page': "見逃されたページ",
+    'archive_page': "アーカイブ",
+}
 
 @dataclass
 class TabContents:
@@ -40,39 +49,51 @@ class OutdatedPagesSummary:
         )
 
     @classmethod
-    def from_df(cls, df: pd.DataFrame) -> 'OutdatedPagesSummary':
-        if len(df) == 0:
+    def from_table(cls, table: pa.Table) -> 'OutdatedPagesSummary':
+        if table.num_rows == 0:
             return cls(0, 0, 0, 0, 0, 0, 0, 0, 0, 0)
-        elif len(df) == 1:
-            return cls(*(df.iloc[0, 1:6].astype(int).tolist() + [0] * 5))
-        elif len(df) == 2:
-            return cls(*(df.iloc[1, 1:6].astype(int).tolist() + df.iloc[0, 1:6].astype(int).tolist()))
+        elif table.num_rows == 1:
+            return cls(*[int(table.column(i)[0].as_py()) for i in range(1, 11)])
         else:
-            raise ValueError("Unexpected number of rows in dataframe")
+            raise ValueError("Unexpected number of rows in table")
 
 @dataclass
 class OutdatedPagesDetail:
-    details_df: pd.DataFrame
-    table_df: pd.DataFrame
+    details_table: pa.Table
+    display_table: pa.Table
+    next_cursor: Optional[int]  # 次のページを読むときのカーソル（最後の行のROW_ORDER）。次のページがなければNone
 
     @classmethod
-    def from_df(cls, raw_df: pd.DataFrame) -> 'OutdatedPagesDetail':
-        details_df = raw_df.sort_values(by=["ACTIVITY_CATEGORY", "PATH"], ascending=[False, True])
-        table_df = details_df[["TITLE", "ACTIVITY_CATEGORY", "TOTAL_VIEWS", "AVG_VIEWERS", "PATH", "CREATED_AT", "UPDATED_AT"]]
-        return cls(details_df, table_df)
-
-@st.cache_data
-def get_queries_result(space_id: str) -> List[pd.DataFrame]:
-    queries = [
+    def from_table(cls, table: pa.Table, page_size: int) -> 'OutdatedPagesDetail':
+        # ソートはSQLのorder byで済ませているため、列を絞るだけにする
+        # SQLはpage_sizeより1行多く返すので、page_sizeを超えた分があれば次のページがある
+        next_cursor = None
+        if table.num_rows > page_size:
+            table = table.slice(0, page_size)
+            next_cursor = table.column("ROW_ORDER")[-1].as_py()
+        display_table = table.select(["TITLE", "ACTIVITY_CATEGORY", "TOTAL_VIEWS", "AVG_VIEWERS", "PATH", "CREATED_AT", "UPDATED_AT"])
+        return cls(table, display_table, next_cursor)
+
+    def page_ids(self, rows: List[int]) -> List[str]:
+        return self.details_table.column("PAGE_ID").take(pa.array(rows, pa.int64())).to_pylist()
+
+def build_queries(space_id: str, key: Optional[str] = None, cursor: int = 0) -> List[Tuple[str, tuple]]:
+    """
+    2_古くなったページで実行するクエリのリストを返す。
+    keyを渡すと、そのタブの詳細情報のcursorより後の1ページ分だけを読む（開いていないタブは読まない）。
+    keyを渡さなければ、すべてのタブの最初のページを読む（新しいロードが反映されたときに、先に作っておくため）。
+    """
+    keys = [key] if key is not None else list(CATEGORIES)
+    return [
         (OUTDATED_PAGE_ACTIVITY_QUERY, (space_id,)),
         (LAST_RUN_DATE_QUERY, ()),
-        (OUTDATED_PAGE_ACTIVITY_DETAILS_QUERY, (space_id, "活発なページ")),
-        (OUTDATED_PAGE_ACTIVITY_DETAILS_QUERY, (space_id, "安定したページ")),
-        (OUTDATED_PAGE_ACTIVITY_DETAILS_QUERY, (space_id, "見逃されたページ")),
-        (OUTDATED_PAGE_ACTIVITY_DETAILS_QUERY, (space_id, "アーカイブ")),
+    ] + [
+        (OUTDATED_PAGE_ACTIVITY_DETAILS_QUERY, (space_id, CATEGORIES[key], cursor))
+        for key in keys
     ]
-    execute_queries = create_execute_queries()
-    return execute_queries(queries)
+
+# 新しいロードが反映されたら、よく見られているスペースの結果を先に作っておく
+register_prewarm_queries(build_queries)
 
 def update_metrics(summary: OutdatedPagesSummary, last_run_date: str, placeholders: dict):
     placeholders['total_pages'].metric("古くなったページ", summary.total_pages, summary.deltas[0], help="この期間に作成されたページの総数です。")
@@ -82,9 +103,10 @@ def update_metrics(summary: OutdatedPagesSummary, last_run_date: str, placeholde
     placeholders['archive_pages'].metric("アーカイブ", summary.archived_pages, summary.deltas[4], help="更新もされず、閲覧者が少ないページです。")
     placeholders['last_run_date'].metric("データ更新日時", last_run_date, help="このページのデータが最後に集計された時刻です。")
 
-def update_tab_content(tab: TabContents, details: OutdatedPagesDetail, key: str):
-    event = tab.page_dataframe_placeholder.dataframe(
-        details.table_df,
+def update_tab_content(tab: TabContents, details: OutdatedPagesDetail, key: str, cursor: int):
+    container = tab.page_dataframe_placeholder.container()
+    event = container.dataframe(
+        details.display_table,
         hide_index=True,
         column_config={
             "TITLE": "タイトル",
@@ -97,24 +119,40 @@ def update_tab_content(tab: TabContents, details: OutdatedPagesDetail, key: str)
         },
         on_select="rerun",
         selection_mode=["multi-row"],
-        key=f"outdated_page_details_df_{key}"
+        # 選択はページ内の行番で管理されるため、ページが変わったら選択を解除する
+        key=f"outdated_page_details_df_{key}_{cursor}"
     )
-    
-    return details.details_df.iloc[event.selection.rows]["PAGE_ID"].to_list()
+    page_navigation.bind(container, f"outdated_{key}", PAGE_SIZE, details.display_table.num_rows, details.next_cursor)
 
-def bind(metric_placeholders: dict, tab_contents: dict):
-    space_id = st.session_state.space_id
-    results = get_queries_result(space_id)
+    return details.page_ids(event.selection.rows)
 
-    summary = OutdatedPagesSummary.from_df(results[0])
-    last_run_date = results[1].iat[0, 0].strftime('%Y-%m-%d')
-    details = [OutdatedPagesDetail.from_df(df) for df in results[2:]]
+def bind(metric_placeholders: dict, tab: TabContents, key: str) -> List[str]:
+    """
+    2_古くなったページのメトリクスと、開いているタブ（key）の詳細情報を取得して描画し、選択された行のページIDのリストを返す
 
-    update_metrics(summary, last_run_date, metric_placeholders)
+    Args:
+        metric_placeholders: メトリクスのプレースホルダの辞書
+        tab: 開いているタブのプレースホルダ
+        key: 開いているタブのキー（CATEGORIESのキー）
+    """
+    space_id = st.session_state.space_id
+    # ページ送りの状態はタブごとに持つ
+    cursor = page_navigation.get_cursor(f"outdated_{key}", space_id)
 
-    selected_ids_dict = {}
-    tab_keys = ['hot_page', 'stable_page', 'unread_page', 'archive_page']
-    for tab, detail, key in zip(tab_contents.values(), details, tab_keys):
-        selected_ids_dict[key] = update_tab_content(tab, detail, key)
+    # クエリを並行に実行し、終わったものから描画する
+    summary = None
+    last_run_date = None
+    selected_ids = []
+    with submit_queries(build_queries(space_id, key, cursor), scope=space_id) as batch:
+        for index, result in batch.as_completed():
+            if index == 0:
+                summary = OutdatedPagesSummary.from_table(result)
+            elif index == 1:
+                last_run_date = result.column(0)[0].as_py().strftime('%Y-%m-%d')
+            else:
+                selected_ids = update_tab_content(tab, OutdatedPagesDetail.from_table(result, PAGE_SIZE), key, cursor)
+            # メトリクスは件数と更新日時の両方がそろったら描画する
+            if index < 2 and summary is not None and last_run_date is not None:
+                update_metrics(summary, last_run_date, metric_placeholders)
 
-    return selected_ids_dict
+    return selected_ids
@@ -1,12 +1,12 @@
 import streamlit as st
 from ui.queries import PAGES_UNIQUE_USER_ACCESS_HISTORY_QUERY
-from ui.utils import create_execute_query
+from ui.utils import cache_by_load, create_execute_query
 
-@st.cache_data
+@cache_by_load
 def get_page_access_history(space_id,page_ids: list):
     """
     対象のページのアクセスユーザ数を取得
-    2回目以降はキャッシュから返却する
+    2回目以降は（新しいロードが反映されるまで）キャッシュから返却する
     """
     # page_ids_strは、SQL内部でPARSE_JSON(TO_JSON(page_ids_str)) にかけられる。
     # これは、バインド変数が配列をサポートしないため。
@@ -0,0 +1,46 @@
+import streamlit as st
+
+def get_cursor(key, space_id):
+    """
+    一覧（key）で表示中のページのカーソルを返す。カーソルは、前のページの最後の行のROW_ORDER（最初のページは0）。
+
+    一覧ごとに、これまでに開いたページのカーソルをsession stateに保存しておき、「前のページ」で1つ戻る。
+    スペースが切り替わっていれば、最初のページに戻す。
+
+    Args:
+        key: 一覧を区別するキー（タブごとに別のキーにする）
+        space_id: 表示中のスペースのID
+    """
+    state = st.session_state.get(f"{key}_pages")
+    if state is None or state["space_id"] != space_id:
+        state = {"space_id": space_id, "cursors": [0]}
+        st.session_state[f"{key}_pages"] = state
+    return state["cursors"][-1]
+
+def go_next(state, next_cursor):
+    state["cursors"].append(next_cursor)
+
+def go_previous(state):
+    state["cursors"].pop()
+
+def bind(container, key, page_size, row_count, next_cursor):
+    """
+    一覧の下に「前のページ」「次のページ」のボタンと、表示中の件数を描画する
+
+    Args:
+        container: ボタンを描画するコンテナ
+        key: get_cursorに渡したキー
+        page_size: 1ページの行数
+        row_count: 表示中のページの行数
+        next_cursor: 次のページのカーソル。次のページがなければNone
+    """
+    state = st.session_state[f"{key}_pages"]
+    page = len(state["cursors"])
+    if page == 1 and next_cursor is None:
+        # 1ページに収まるならボタンは出さない
+        return
+    prev_col, next_col, caption_col = container.columns([1, 1, 4])
+    prev_col.button("前のページ", key=f"{key}_previous_page", disabled=page == 1, on_click=go_previous, args=(state,))
+    next_col.button("次のページ", key=f"{key}_next_page", disabled=next_cursor is None, on_click=go_next, args=(state, next_cursor))
+    start = (page - 1) * page_size + 1
+    caption_col.caption(f"{start}〜{start + row_count - 1}件目")
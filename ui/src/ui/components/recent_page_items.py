@@ -4,22 +4,27 @@ from datetime import datetime
 import streamlit as st
 import pandas as pd
 
-from ui.queries import RECENT_PAGE_ACTIVITY_QUERY, RECENT_PAGE_ACTIVITY_DETAILS_QUERY, LAST_RUN_DATE_QUERY
+from ui.queries import PAGE_SIZE, RECENT_PAGE_ACTIVITY_QUERY, RECENT_PAGE_ACTIVITY_DETAILS_QUERY, LAST_RUN_DATE_QUERY
 from ui.models import RecentlyPagesDetailModel, RecentlyPagesSummaryModel
-from ui.utils import create_execute_queries
+from ui.utils import register_prewarm_queries, submit_queries
+from ui.components import page_navigation
 
-@st.cache_data
-def get_queries_result(space_id):
+# ページ送りの状態を保存するキー
+PAGE_NAVIGATION_KEY = "recent_page"
+
+def build_queries(space_id, cursor=0):
     """
-    クエリの実行をする。2回目以降はキャッシュから結果を返却する。
+    1_最近作成されたページで実行するクエリのリストを返す。詳細情報は、cursorより後の1ページ分を取得する。
+    結果はutilsの実行器がロードIDごとにキャッシュするため、2回目以降（開いたことのあるページ）はキャッシュから返却される。
     """
-    queries = [
+    return [
         (RECENT_PAGE_ACTIVITY_QUERY, (space_id, )),
-        (RECENT_PAGE_ACTIVITY_DETAILS_QUERY, (space_id, )),
+        (RECENT_PAGE_ACTIVITY_DETAILS_QUERY, (space_id, cursor)),
         (LAST_RUN_DATE_QUERY, ())
     ]
-    execute_queries = create_execute_queries()
-    return execute_queries(queries)
+
+# 新しいロードが反映されたら、よく見られているスペースの結果を先に作っておく
+register_prewarm_queries(build_queries)
 
 def bind(
     added_pages_metric_placeholder,
@@ -38,22 +43,34 @@ def bind(
         last_run_date_metric_placeholder: データ更新日時のプレースホルダ
         page_dataframe_placeholder: データフレーム用のプレースホルダ
     """
-    # データの取得
     space_id = st.session_state.space_id
-    results = get_queries_result(space_id)
+    cursor = page_navigation.get_cursor(PAGE_NAVIGATION_KEY, space_id)
+    selected_page_ids = []
+
+    # クエリを並行に実行し、終わったものからそれぞれの表示領域に置き換える
+    with submit_queries(build_queries(space_id, cursor), scope=space_id) as batch:
+        for index, result in batch.as_completed():
+            if index == 0:
+                summary = RecentlyPagesSummaryModel.from_table(result)
+                added_pages_metric_placeholder.metric("追加されたページ", summary.added_pages, summary.added_pages_delta, help="この期間に作成されたページの総数です。")
+                hot_pages_metric_placeholder.metric("活発なページ", summary.hot_pages, summary.hot_pages_delta, help="多くのユーザーが閲覧したページです。")
+                unreaded_pages_metric_placeholder.metric("見逃されたページ", summary.unreaded_pages, summary.unreaded_pages_delta, help="最近作成されたにもかかわらず、閲覧者が少ないページです。")
+            elif index == 1:
+                details = RecentlyPagesDetailModel.from_table(result, PAGE_SIZE)
+                selected_page_ids = bind_details(page_dataframe_placeholder, details, cursor)
+            elif index == 2:
+                last_run_date = result.column(0)[0].as_py().strftime('%Y-%m-%d')
+                last_run_date_metric_placeholder.metric("データ更新日時", last_run_date, help="このページのデータが最後に集計された時刻です。")
 
-    # 結果をそれぞれ扱いやすいオブジェクトにマップする
-    summary = RecentlyPagesSummaryModel.from_df(results[0])
-    details = RecentlyPagesDetailModel.from_df(results[1])
-    last_run_date = results[2].iat[0,0].strftime('%Y-%m-%d')
+    return selected_page_ids
 
-    # プレースホルダを要素に置き換え
-    added_pages_metric_placeholder.metric("追加されたページ", summary.added_pages, summary.added_pages_delta, help="この期間に作成されたページの総数です。")
-    hot_pages_metric_placeholder.metric("活発なページ", summary.hot_pages, summary.hot_pages_delta, help="多くのユーザーが閲覧したページです。")
-    unreaded_pages_metric_placeholder.metric("見逃されたページ", summary.unreaded_pages, summary.unreaded_pages_delta, help="最近作成されたにもかかわらず、閲覧者が少ないページです。")
-    last_run_date_metric_placeholder.metric("データ更新日時", last_run_date, help="このページのデータが最後に集計された時刻です。")
-    event = page_dataframe_placeholder.dataframe(
-                    details.table_df,
+def bind_details(page_dataframe_placeholder, details, cursor):
+    """
+    詳細情報（1ページ分）とページ送りのボタンをデータフレームのプレースホルダにバインドし、選択された行のページIDのリストを返す
+    """
+    container = page_dataframe_placeholder.container()
+    event = container.dataframe(
+                    details.display_table,
                     hide_index=True,
                     column_config={
                         "TITLE": "タイトル",
@@ -70,9 +87,11 @@ def bind(
                             format="YYYY.M.D H:mm:ss"
                         ),
                     },
-                    key="recent_page_details_df",
+                    # 選択はページ内の行番で管理されるため、ページが変わったら選択を解除する
+                    key=f"recent_page_details_df_{cursor}",
                     on_select="rerun",
                     selection_mode=["multi-row"]
             )
+    page_navigation.bind(container, PAGE_NAVIGATION_KEY, PAGE_SIZE, details.display_table.num_rows, details.next_cursor)
 
-    return details.details_df.iloc[event.selection.rows]["PAGE_ID"].to_list()
+    return details.page_ids(event.selection.rows)
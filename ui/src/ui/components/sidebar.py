@@ -1,10 +1,10 @@
 import streamlit as st
 import pandas as pd
 
-from ui.utils import create_execute_query
+from ui.utils import cache_by_load, create_execute_query
 from ui.queries import ALL_SPACES
 
-@st.cache_data
+@cache_by_load
 def get_all_spaces() -> pd.DataFrame:
     """get_all_spaces
 
@@ -0,0 +1,156 @@
+"""local
+
+Snowflakeの代わりに、dbt run --target duckdb で作ったローカルのDuckDBのデータベースにクエリを実行します。
+環境変数 UI__DUCKDB_PATH にデータベースファイルのパスを設定すると、utilsのクエリ実行関数がこのモジュールを使います。
+
+queries.pyのクエリは書き換えずに実行します。Snowflakeにしかない関数（iff, parse_json, SNOWFLAKE.CORTEX.*など）は、
+transformパッケージの互換レイヤー（transform.duckdb_shims）で置き換えます。
+
+Examples:
+    # UIのクエリのレイテンシを計測する
+    $ UI__DATABASE=confluence UI__SCHEMA=confluence python -m ui.local ../transform/data_transform/confluence.duckdb --repeat 20
+"""
+import argparse
+import statistics
+import sys
+import time
+from functools import lru_cache
+from pathlib import Path
+
+import duckdb
+import pyarrow as pa
+from transform.duckdb_shims import register_shims
+
+from ui import queries
+
+
+@lru_cache
+def connect(path):
+    """
+    データベースファイルを読み取り専用で開いた接続を返します。同じパスには同じ接続を返します。
+
+    dbtが作ったビューはファイル名（拡張子を除く）をデータベース名として参照するため、ファイル名の名前でattachします。
+    queries.pyのクエリも同じ名前で参照するよう、環境変数 UI__DATABASE にはファイル名（拡張子を除く）を設定してください。
+    互換レイヤーは読み取り専用のファイルには登録できないため、インメモリのデータベースに登録します。
+    """
+    conn = duckdb.connect()
+    conn.execute(f"attach '{path}' as {Path(path).stem} (read_only)")
+    register_shims(conn)
+    return conn
+
+
+def execute(path, query, params=()):
+    """
+    クエリを実行して、結果をpd.DataFrameで返します。
+    Snowflakeと同じく、列名は大文字にします。
+    """
+    # 接続はスレッド間で共有できないため、クエリごとにカーソルを作る
+    with connect(path).cursor() as cursor:
+        df = cursor.execute(query, list(params)).df()
+    df.columns = [column.upper() for column in df.columns]
+    return df
+
+
+def execute_arrow(path, query, params=()):
+    """
+    クエリを実行して、結果をpyarrow.Tableで返します（pandasを経由しません）。
+    Snowflakeと同じく、列名は大文字にします。
+    """
+    with connect(path).cursor() as cursor:
+        table = cursor.execute(query, list(params)).arrow()
+    # DuckDB 1.4以降の.arrow()はテーブルではなくRecordBatchReaderを返す
+    if isinstance(table, pa.RecordBatchReader):
+        table = table.read_all()
+    return table.rename_columns([column.upper() for column in table.column_names])
+
+
+def create_execute_query(path):
+    """utils.create_execute_queryのローカル版。"""
+    def execute_query(query, params=()):
+        return execute(path, query, params)
+    return execute_query
+
+
+class CompletedJob:
+    """実行済みのクエリの結果を、snowparkのAsyncJobと同じメソッドで返すジョブ"""
+    def __init__(self, result):
+        self._result = result
+
+    def is_done(self):
+        return True
+
+    def cancel(self):
+        pass
+
+    def result(self):
+        return self._result
+
+
+def create_launch(path):
+    """
+    utils.get_query_executorのlaunchのローカル版。
+    DuckDBのクエリは起動した時点で実行し終えるため、実行時間はQueryTimingのqueue_secondsに含まれます。
+    """
+    def launch(query, params=()):
+        return CompletedJob(execute_arrow(path, query, params))
+    return launch
+
+
+def benchmark_cases(path):
+    """
+    レイテンシを計測するクエリと、そのパラメータのリストを返します。
+    パラメータには、最もページ数の多いスペースと、そのスペースのページを使います。
+    """
+    space_id = execute(path, f"""
+        select space_id
+        from {queries.DATABASE}.{queries.SCHEMA}.cleansed_pages
+        group by space_id
+        order by count(*) desc
+        limit 1
+    """).iat[0, 0]
+    page_ids = execute(path, f"""
+        select page_id
+        from {queries.DATABASE}.{queries.SCHEMA}.cleansed_pages
+        where space_id = ?
+        limit 10
+    """, [space_id])["PAGE_ID"].tolist()
+    return [
+        ("ALL_SPACES", queries.ALL_SPACES, []),
+        ("LAST_RUN_DATE_QUERY", queries.LAST_RUN_DATE_QUERY, []),
+        ("RECENT_PAGE_ACTIVITY_QUERY", queries.RECENT_PAGE_ACTIVITY_QUERY, [space_id]),
+        # 詳細情報は、最初のページ（カーソル0）を読む
+        ("RECENT_PAGE_ACTIVITY_DETAILS_QUERY", queries.RECENT_PAGE_ACTIVITY_DETAILS_QUERY, [space_id, 0]),
+        ("OUTDATED_PAGE_ACTIVITY_QUERY", queries.OUTDATED_PAGE_ACTIVITY_QUERY, [space_id]),
+        ("OUTDATED_PAGE_ACTIVITY_DETAILS_QUERY", queries.OUTDATED_PAGE_ACTIVITY_DETAILS_QUERY, [space_id, "活発なページ", 0]),
+        (
+            "PAGES_UNIQUE_USER_ACCESS_HISTORY_QUERY",
+            queries.PAGES_UNIQUE_USER_ACCESS_HISTORY_QUERY,
+            [space_id, f"[{','.join(page_ids)}]"],
+        ),
+        ("PAGE_MD_CONTENTS_QUERY", queries.PAGE_MD_CONTENTS_QUERY, page_ids[:1]),
+        ("SEARCH_ASSISTANT_QUERY", queries.SEARCH_ASSISTANT_QUERY, ["要件定義の進め方", "要件定義の進め方"]),
+    ]
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m ui.local",
+        description="UIのクエリを、ローカルのDuckDBのデータベースに実行してレイテンシを計測します。",
+    )
+    parser.add_argument("database", help="dbt run --target duckdb で作ったデータベースファイル")
+    parser.add_argument("--repeat", type=int, default=10, help="クエリごとの実行回数")
+    args = parser.parse_args(argv)
+
+    for name, query, params in benchmark_cases(args.database):
+        latencies = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            df = execute(args.database, query, params)
+            latencies.append((time.perf_counter() - start) * 1000)
+        p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]
+        print(f"{name}: {len(df)} rows, p50 {statistics.median(latencies):.1f} ms, p95 {p95:.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
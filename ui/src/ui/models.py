@@ -1,7 +1,8 @@
 
 from dataclasses import dataclass
+from typing import Optional
 
-import pandas as pd
+import pyarrow as pa
 
 @dataclass
 class RecentlyPagesSummaryModel:
@@ -25,17 +26,16 @@ class RecentlyPagesSummaryModel:
         return self.unreaded_pages - self.prev_unreaded_pages
 
     @classmethod
-    def from_df(cls, df):
+    def from_table(cls, table):
         """
-        RECENT_PAGE_ACTIVITY_QUERY の結果からサマリーを計算する
+        RECENT_PAGE_ACTIVITY_QUERY の結果（pyarrow.Table）からサマリーを計算する
 
         Examples:
-            >>> df
-                | agg_target_date | added_pages | hot_pages | unreaded_pages |
-                | :-------------- | :---------- | :-------- | :------------- |
-                | 2024-07-01      |           1 |         2 |              3 |
-                | 2024-07-02      |           4 |         5 |              6 |
-            >>> result = RecentlyPagesSummaryModel.from_df(df)
+            >>> table
+                | agg_target_date | added_pages | hot_pages | unreaded_pages | prev_added_pages | prev_hot_pages | prev_unreaded_pages |
+                | :-------------- | :---------- | :-------- | :------------- | :--------------- | :------------- | :------------------ |
+                | 2024-07-02      |           1 |         2 |              3 |                4 |              5 |                   6 |
+            >>> result = RecentlyPagesSummaryModel.from_table(table)
                 # ▼こうなる
                 # RecentlyPagesSummaryModel(
                 #     added_pages=1
@@ -46,29 +46,35 @@ class RecentlyPagesSummaryModel:
                 #     prev_unreaded_pages=6
                 # )
         """
-        if len(df) == 0:
+        if table.num_rows == 0:
             # データが1件も返らなければ0件とする
             return cls(0,0,0,0,0,0)
-        elif len(df) == 1:
-            # 1日分しかデータが返らなければ、prevを0とする
-            return cls(int(df.iat[0,1]), int(df.iat[0,2]), int(df.iat[0,3]), 0, 0, 0)
-        elif len(df) == 2:
-            # 2日データが返れば、それぞれの値を設定する
-            return cls(int(df.iat[1,1]), int(df.iat[1,2]), int(df.iat[1,3]), int(df.iat[0,1]), int(df.iat[0,2]), int(df.iat[0,3]))
+        elif table.num_rows == 1:
+            # 直近2日分の件数は、1行に横持ちで返る
+            return cls(*[int(table.column(i)[0].as_py()) for i in range(1, 7)])
         else:
             raise Exception("内部エラー：最近作成されたページの取得で予想外のエラーが発生しました。")
 
 @dataclass
 class RecentlyPagesDetailModel:
-    details_df: pd.DataFrame # SQL叩いて取れた生データ
-    table_df: pd.DataFrame # 画面に表示する列だけを抽出したテーブル
+    details_table: pa.Table # SQL叩いて取れた生データ（1ページ分）
+    display_table: pa.Table # 画面に表示する列だけを抽出したテーブル
+    next_cursor: Optional[int] # 次のページを読むときのカーソル（最後の行のROW_ORDER）。次のページがなければNone
 
     @classmethod
-    def from_df(cls, raw_df):
+    def from_table(cls, table, page_size):
         # テーブルを画面に表示するとき、並び順を「活動状態」「階層」ごとにしたい。
         # チェックボックスによるテーブルの選択は、その並び順の行番で管理される（3行目を選択したら、"2"がeventオブジェクトからとれる）。
         # よって、生データと画面表示用のデータが、同じ並び順になっていてほしい。
-        # details_dfの時点でソートを行い、table_dfで列を絞るようにした。
-        details_df = raw_df.sort_values(by=["ACTIVITY_CATEGORY", "PATH"], ascending=[False, True])
-        table_df = details_df[["TITLE", "ACTIVITY_CATEGORY", "TOTAL_VIEWS", "AVG_VIEWERS", "PATH", "CREATED_AT", "UPDATED_AT"]]
-        return cls(details_df, table_df)
+        # ソートはSQLのorder byで済ませ、display_tableで列を絞るようにした（Arrowのselectはデータをコピーしない）。
+        # SQLはpage_sizeより1行多く返すので、page_sizeを超えた分があれば次のページがある。
+        next_cursor = None
+        if table.num_rows > page_size:
+            table = table.slice(0, page_size)
+            next_cursor = table.column("ROW_ORDER")[-1].as_py()
+        display_table = table.select(["TITLE", "ACTIVITY_CATEGORY", "TOTAL_VIEWS", "AVG_VIEWERS", "PATH", "CREATED_AT", "UPDATED_AT"])
+        return cls(table, display_table, next_cursor)
+
+    def page_ids(self, rows):
+        """画面で選択された行番のページIDのリストを返す"""
+        return self.details_table.column("PAGE_ID").take(pa.array(rows, pa.int64())).to_pylist()
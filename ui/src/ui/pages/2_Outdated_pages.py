@@ -3,7 +3,7 @@ from dataclasses import dataclass
 import streamlit as st
 
 from ui.components.sidebar import bind as render_sidebar
-from ui.components.outdated_page_items import TabContents, bind as render_outdated_page_items
+from ui.components.outdated_page_items import CATEGORIES, TabContents, bind as render_outdated_page_items
 from ui.components.page_access_history_linechart import bind as render_page_access_history_linechart
 from ui.components.document_review_items import bind as render_document_review_items
 
@@ -37,7 +37,7 @@ def build_tab_contents(tab):
     """
     各タブのレイアウト作成
     Args:
-        tab (streamlit) : タブエリアのオブジェクト
+        tab (streamlit) : タブエリアのオブジェクト（選んだ活動状態の一覧を描画するコンテナ）
     Returns:
         TabContents: タブごとに作成されるプレースホルダを管理する名前付きタプル
     """
@@ -76,12 +76,17 @@ def build_tab_contents(tab):
         review_results_placeholder,
     )
 
+# st.tabsはすべてのタブを毎回描画するため、ラジオボタンで選んだ活動状態の一覧だけを読み込んで描画する
 tab_row = st.container(border=False)
-tab1, tab2, tab3, tab4 = tab_row.tabs(["活発なページ", "安定したページ", "見逃されたページ", "アーカイブ"])
-hot_page_tab = build_tab_contents(tab1)
-stable_page_tab = build_tab_contents(tab2)
-unread_page_tab = build_tab_contents(tab3)
-archive_page_tab = build_tab_contents(tab4)
+selected_key = tab_row.radio(
+    "活動状態",
+    list(CATEGORIES),
+    format_func=CATEGORIES.get,
+    horizontal=True,
+    label_visibility="collapsed",
+    key="outdated_page_category",
+)
+tab = build_tab_contents(tab_row)
 
 
 # データ取得と描画
@@ -94,30 +99,24 @@ placeholders = {
         'archive_pages': archive_pages_metric_placeholder,
         'last_run_date': last_run_date_metric_placeholder,
     }
-tabs = {
-        'hot_page': hot_page_tab,
-        'stable_page': stable_page_tab,
-        'unread_page': unread_page_tab,
-        'archive_page': archive_page_tab
-    }
-selected_ids_dict = render_outdated_page_items(
+selected_ids = render_outdated_page_items(
     placeholders,
-    tabs
+    tab,
+    selected_key
 )
 
-for key, selected_ids in selected_ids_dict.items():
-    render_page_access_history_linechart(
-        tabs[key].line_chart_placeholder,
-        selected_ids
-    )
-    render_document_review_items(
-        tabs[key].raw_doc_placeholder,
-        tabs[key].review_prompt_template_selectbox_placeholder,
-        f"review_prompt_template_selectbox_{key}",
-        tabs[key].review_prompt_textarea_placeholder,
-        f"review_prompt_textarea_{key}",
-        tabs[key].review_run_button_placeholder,
-        f"review_run_button_{key}",
-        tabs[key].review_results_placeholder,
-        selected_ids
-    )
+render_page_access_history_linechart(
+    tab.line_chart_placeholder,
+    selected_ids
+)
+render_document_review_items(
+    tab.raw_doc_placeholder,
+    tab.review_prompt_template_selectbox_placeholder,
+    f"review_prompt_template_selectbox_{selected_key}",
+    tab.review_prompt_textarea_placeholder,
+    f"review_prompt_textarea_{selected_key}",
+    tab.review_run_button_placeholder,
+    f"review_run_button_{selected_key}",
+    tab.review_results_placeholder,
+    selected_ids
+)
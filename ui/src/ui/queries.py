@@ -1,7 +1,13 @@
+import os
+
 import streamlit as st
 
-DATABASE = "PLEASE_SET_YOUR_DATABASE_NAME"
-SCHEMA = "PLEASE_SET_YOUR_SCHEMA_NAME"
+# 環境変数で上書きできる（ローカルのDuckDBで実行するときなど）
+DATABASE = os.environ.get("UI__DATABASE", "PLEASE_SET_YOUR_DATABASE_NAME")
+SCHEMA = os.environ.get("UI__SCHEMA", "PLEASE_SET_YOUR_SCHEMA_NAME")
+
+# ページの詳細の一覧を、1回に読む行数
+PAGE_SIZE = int(os.environ.get("UI__PAGE_SIZE", 200))
 
 # すべてのスペースを取得
 ALL_SPACES = f"""
@@ -15,44 +21,42 @@ ALL_SPACES = f"""
 # 最終クエリ日付
 LAST_RUN_DATE_QUERY = f"""
     select
-        max(agg_target_date) as date
+        agg_target_date as date
+    from
+        {DATABASE}.{SCHEMA}.latest_snapshot_dates
+    where
+        model_name = 'recent_page_activity'
+"""
+
+# 画面に反映されている最新のロードID
+# dbtがサービング層を作り直すと変わるため、UIのキャッシュのキーに使う。
+LOAD_ID_QUERY = f"""
+    select
+        max(load_id) as load_id
     from
-        {DATABASE}.{SCHEMA}.recent_page_activity
+        {DATABASE}.{SCHEMA}.latest_snapshot_dates
 """
 
 # 最近作成されたページの件数取得
-# 直近2日分を取得する。
+# 直近2日分の件数を横持ちにした1行を取得する。行がなければ0件とする。
 RECENT_PAGE_ACTIVITY_QUERY = f"""
     select
         agg_target_date,
-        count(page_id) as added_pages,
-        sum(
-            iff(activity_category='活発なページ', 1, 0)
-        ) as hot_pages,
-        sum(
-            iff(activity_category='見逃されたページ', 1, 0)
-        ) as unreaded_pages,
+        added_pages,
+        hot_pages,
+        unreaded_pages,
+        prev_added_pages,
+        prev_hot_pages,
+        prev_unreaded_pages
     from
-        {DATABASE}.{SCHEMA}.recent_page_activity
+        {DATABASE}.{SCHEMA}.recent_page_summary
     where
-        -- 直近２日分（２番目に大きい日付以上）
-        agg_target_date >= (
-            select
-                distinct agg_target_date
-            from
-                {DATABASE}.{SCHEMA}.recent_page_activity
-            order by
-                agg_target_date desc
-            limit 1 offset 1
-        )
-        and space_id = ?
-    group by
-        agg_target_date
-    order by
-        agg_target_date
+        space_id = ?
 """
 
 # 最近作成されたページの詳細情報取得
+# 詳細テーブルは最新の集計日の行だけを持つ。画面の並び順（活動状態・階層）のrow_orderで、カーソルより後の1ページ分を返す。
+# 次のページがあるかを知るため、PAGE_SIZEより1行多く読む。
 RECENT_PAGE_ACTIVITY_DETAILS_QUERY = f"""
     select
         agg_target_date,
@@ -64,58 +68,42 @@ RECENT_PAGE_ACTIVITY_DETAILS_QUERY = f"""
         path,
         total_views,
         avg_viewers,
-        activity_category
+        activity_category,
+        row_order
     from
-        {DATABASE}.{SCHEMA}.recent_page_activity
+        {DATABASE}.{SCHEMA}.recent_page_details
     where
-        agg_target_date = (
-            select
-                max(agg_target_date)
-            from
-                {DATABASE}.{SCHEMA}.recent_page_activity
-        )
-        and space_id = ?
+        space_id = ?
+        and row_order > ?
+    order by
+        row_order
+    limit {PAGE_SIZE + 1}
 """
 
 # 古くなったページの件数取得
-# 直近2日分を取得する。
+# 直近2日分の件数を横持ちにした1行を取得する。行がなければ0件とする。
 OUTDATED_PAGE_ACTIVITY_QUERY = f"""
     select
         agg_target_date,
-        count(page_id) as total_pages,
-        sum(
-            iff(activity_category='活発なページ', 1, 0)
-        ) as hot_pages,
-        sum(
-            iff(activity_category='見逃されたページ', 1, 0)
-        ) as unreaded_pages,
-        sum(
-            iff(activity_category='安定したページ', 1, 0)
-        ) as stable_pages,
-        sum(
-            iff(activity_category='アーカイブ', 1, 0)
-        ) as archive_pages,
+        total_pages,
+        hot_pages,
+        unreaded_pages,
+        stable_pages,
+        archive_pages,
+        prev_total_pages,
+        prev_hot_pages,
+        prev_unreaded_pages,
+        prev_stable_pages,
+        prev_archive_pages
     from
-        {DATABASE}.{SCHEMA}.outdated_page_activity
+        {DATABASE}.{SCHEMA}.outdated_page_summary
     where
-        -- 直近２日分（２番目に大きい日付以上）
-        agg_target_date >= (
-            select
-                distinct agg_target_date
-            from
-                {DATABASE}.{SCHEMA}.outdated_page_activity
-            order by
-                agg_target_date desc
-            limit 1 offset 1
-        )
-        and space_id = ?
-    group by
-        agg_target_date
-    order by
-        agg_target_date
+        space_id = ?
 """
 
 # 古くなったページの詳細情報取得
+# 詳細テーブルは最新の集計日の行だけを持つ。画面の並び順（活動状態・階層）のrow_orderで、カーソルより後の1ページ分を返す。
+# 次のページがあるかを知るため、PAGE_SIZEより1行多く読む。
 OUTDATED_PAGE_ACTIVITY_DETAILS_QUERY = f"""
     select
         agg_target_date,
@@ -127,18 +115,17 @@ OUTDATED_PAGE_ACTIVITY_DETAILS_QUERY = f"""
         path,
         total_views,
         avg_viewers,
-        activity_category
+        activity_category,
+        row_order
     from
-        {DATABASE}.{SCHEMA}.outdated_page_activity
+        {DATABASE}.{SCHEMA}.outdated_page_details
     where
-        agg_target_date = (
-            select
-                max(agg_target_date)
-            from
-                {DATABASE}.{SCHEMA}.outdated_page_activity
-        )
-        and space_id = ?
+        space_id = ?
         and activity_category = ?
+        and row_order > ?
+    order by
+        row_order
+    limit {PAGE_SIZE + 1}
 """
 
 # ページのユニークアクセス数を取得
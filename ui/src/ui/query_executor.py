@@ -0,0 +1,197 @@
+"""query_executor
+
+複数のクエリを並行に実行し、終わったものから結果を返す実行器です。
+utils.get_query_executorが、st.cache_resourceでプロセスに1つだけ作ります。
+
+クエリごとにスレッドプールのスレッドを1つ使い、次の順に処理します。
+
+1. launchでクエリを起動し、ジョブ（snowparkのAsyncJobなど、is_done, cancelを持つオブジェクト）を受け取る
+2. ジョブのis_doneを、間隔を倍々に伸ばしながら（max_poll_interval秒まで）確認する
+3. 終わったら、fetch_resultで結果を取り出す
+
+タイムアウトを過ぎたクエリと、キャンセルされたバッチの終わっていないクエリは、ジョブのcancelで止めます。
+cache（result_cache.LoadScopedCache）を渡すと、(クエリ, パラメータ) ごとの結果を最新のロードIDの間保存し、2回目以降はクエリを起動せずに返します。
+結果を先に作っておくためのクエリは background=True で投入すると、画面のクエリとは別の少ないスレッドで実行し、画面のクエリを待たせません。
+
+Examples:
+    >>> executor = QueryExecutor(launch, fetch_result=lambda job: job.result(result_type="pandas"))
+    >>> with executor.submit([(QUERY_A, (space_id,)), (QUERY_B, (), 30)]) as batch:
+    ...     for index, df in batch.as_completed():
+    ...         placeholders[index].dataframe(df)
+    >>> batch.timings
+    [QueryTiming(index=1, queue_seconds=0.12, wall_seconds=0.31, status='done'), ...]
+"""
+import logging
+import threading
+import time
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Any, Callable, Hashable, Iterator, Optional
+
+from ui.result_cache import MISSING, LoadScopedCache
+
+logger = logging.getLogger(__name__)
+
+
+class QueryTimeoutError(TimeoutError):
+    """クエリがタイムアウトまでに終わらなかった"""
+
+
+@dataclass
+class QueryTiming:
+    index: int  # バッチ内のクエリの番号
+    queue_seconds: float  # 投入から、クエリが起動されるまでの時間（スレッド・セッションの空き待ちを含む）
+    wall_seconds: float  # 投入から、結果を取り出し終わるまでの時間
+    status: str  # done, cached, timeout, cancelled, error
+
+
+class QueryBatch:
+    """
+    executor.submitで投入したクエリのまとまり。
+
+    with文で使うと、ブロックを抜けるときに終わっていないクエリをキャンセルします。
+    Streamlitはスペースの切り替えなどで再実行するとき、実行中のスクリプトに例外を送出するため、読み込み途中のクエリもここで止まります。
+    """
+    def __init__(self, futures: list[Future], cancel_event: threading.Event):
+        self._futures = futures
+        self._cancel_event = cancel_event
+        self.timings: list[QueryTiming] = []
+
+    def __enter__(self) -> 'QueryBatch':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cancel()
+
+    def as_completed(self) -> Iterator[tuple[int, Any]]:
+        """終わったクエリから順に (クエリの番号, 結果) を返します。失敗したクエリがあれば、その例外を送出します。"""
+        indexes = {future: index for index, future in enumerate(self._futures)}
+        for future in as_completed(self._futures):
+            yield indexes[future], future.result()
+
+    def results(self) -> list:
+        """すべてのクエリの結果を、投入した順に返します。"""
+        return [future.result() for future in self._futures]
+
+    def cancel(self):
+        """終わっていないクエリをキャンセルします。"""
+        self._cancel_event.set()
+        for future in self._futures:
+            future.cancel()
+
+
+class QueryExecutor:
+    """
+    Args:
+        launch: (クエリ, パラメータ) を受け取ってクエリを起動し、ジョブを返す関数
+        fetch_result: 終わったジョブから結果を取り出す関数
+        max_workers: 同時に待てるクエリの数
+        timeout: クエリごとのタイムアウトの、投入からの秒数のデフォルト。Noneならタイムアウトしない
+        min_poll_interval: is_doneを確認する最初の間隔
+        max_poll_interval: is_doneを確認する最大の間隔
+        cache: 結果を保存するキャッシュ。Noneなら保存しない
+        background_workers: background=Trueで投入したクエリを、同時に待てる数
+    """
+    def __init__(
+        self,
+        launch: Callable[[str, Any], Any],
+        fetch_result: Callable[[Any], Any] = lambda job: job.result(),
+        max_workers: int = 8,
+        timeout: Optional[float] = None,
+        min_poll_interval: float = 0.01,
+        max_poll_interval: float = 1.0,
+        cache: Optional[LoadScopedCache] = None,
+        background_workers: int = 1,
+    ):
+        self._launch = launch
+        self._fetch_result = fetch_result
+        self._thread_pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="query-executor")
+        self._background_thread_pool = ThreadPoolExecutor(
+            max_workers=background_workers, thread_name_prefix="query-executor-background"
+        )
+        self._timeout = timeout
+        self._min_poll_interval = min_poll_interval
+        self._max_poll_interval = max_poll_interval
+        self._cache = cache
+
+    def submit(self, queries, scope: Hashable = None, background: bool = False) -> QueryBatch:
+        """
+        クエリを投入し、QueryBatchを返します。
+
+        Args:
+            queries: (クエリ, パラメータ) または (クエリ, パラメータ, タイムアウトの秒数) のリスト
+            scope: キャッシュに、どのスコープ（スペースなど）の結果かを伝える値
+            background: Trueなら、画面のクエリとは別のスレッドプールで実行する（結果を先に作っておくクエリ用）
+        """
+        cancel_event = threading.Event()
+        futures = []
+        batch = QueryBatch(futures, cancel_event)
+        submitted_at = time.perf_counter()
+        thread_pool = self._background_thread_pool if background else self._thread_pool
+        load_id = self._cache.load_id() if self._cache is not None else None
+        for index, query in enumerate(queries):
+            sql, params = query[0], query[1]
+            timeout = query[2] if len(query) > 2 else self._timeout
+            key = (sql, tuple(params))
+            cached = self._cache.get(load_id, key, scope) if self._cache is not None else MISSING
+            if cached is not MISSING:
+                future = Future()
+                future.set_result(cached)
+                batch.timings.append(QueryTiming(index, 0.0, 0.0, "cached"))
+            else:
+                future = thread_pool.submit(
+                    self._run, batch, index, sql, params, (load_id, key), timeout, submitted_at, cancel_event
+                )
+            futures.append(future)
+        return batch
+
+    def _run(self, batch, index, sql, params, cache_key, timeout, submitted_at, cancel_event):
+        queue_seconds = 0.0
+        status = "error"
+        try:
+            if cancel_event.is_set():
+                status = "cancelled"
+                raise CancelledError()
+            job = self._launch(sql, params)
+            queue_seconds = time.perf_counter() - submitted_at
+            waited = self._wait(job, submitted_at, timeout, cancel_event)
+            if waited == "timeout":
+                status = "timeout"
+                raise QueryTimeoutError(f"query {index} did not finish in {timeout} seconds")
+            if waited == "cancelled":
+                status = "cancelled"
+                raise CancelledError()
+            result = self._fetch_result(job)
+            status = "done"
+            if self._cache is not None:
+                self._cache.put(*cache_key, result)
+            return result
+        finally:
+            timing = QueryTiming(index, queue_seconds, time.perf_counter() - submitted_at, status)
+            batch.timings.append(timing)
+            logger.info(
+                "query %d %s: queue %.3fs, wall %.3fs", timing.index, timing.status, timing.queue_seconds, timing.wall_seconds
+            )
+
+    def _wait(self, job, submitted_at, timeout, cancel_event) -> str:
+        """ジョブが終わるまで待ち、done, timeout, cancelled のいずれかを返します。終わらなかったジョブはキャンセルします。"""
+        interval = self._min_poll_interval
+        while not job.is_done():
+            wait_seconds = interval
+            if timeout is not None:
+                remaining = timeout - (time.perf_counter() - submitted_at)
+                if remaining <= 0:
+                    job.cancel()
+                    return "timeout"
+                wait_seconds = min(interval, remaining)
+            # キャンセルされたら、待ち時間の途中でも抜ける
+            if cancel_event.wait(wait_seconds):
+                job.cancel()
+                return "cancelled"
+            interval = min(interval * 2, self._max_poll_interval)
+        return "done"
+
+    def shutdown(self):
+        """スレッドプールを止めます。"""
+        self._thread_pool.shutdown(wait=False, cancel_futures=True)
+        self._background_thread_pool.shutdown(wait=False, cancel_futures=True)
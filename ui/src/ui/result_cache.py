@@ -0,0 +1,167 @@
+"""result_cache
+
+クエリの結果を、最新のロードIDごとに保存するキャッシュです。
+utils.get_result_cacheが、st.cache_resourceでプロセスに1つだけ作ります。
+
+- ロードIDは、前回の確認から check_interval 秒以上たっていれば確認し直します（それまでは前回の値を使います）。
+- ロードIDが変わったら、保存していた結果をすべて捨て、on_new_loadを呼びます（よく見られているスペースの結果を先に作るため）。
+  ロードIDの確認は画面の操作の中で行われるため、on_new_loadは終わるのを待たずに別のスレッドで呼びます。
+- 保存した結果の合計が max_bytes を超えたら、最も長く使われていない結果から捨てます。
+
+結果の計算を始めたあとでロードIDが変わった場合、計算し終えた古い結果は保存しません。
+そのため、getとputには、計算を始める前にload_idで受け取ったロードIDを渡します。
+
+Examples:
+    >>> cache = LoadScopedCache(fetch_load_id, check_interval=60, max_bytes=512 * 1024 * 1024)
+    >>> load_id = cache.load_id()
+    >>> value = cache.get(load_id, key, scope=space_id)
+    >>> if value is MISSING:
+    ...     value = compute()
+    ...     cache.put(load_id, key, value)
+"""
+import logging
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, replace
+from typing import Any, Callable, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+# キャッシュに結果がないことを表す値（Noneも結果として保存できるようにするため）
+MISSING = object()
+
+
+def estimate_size(value) -> int:
+    """結果のおおよそのバイト数を返します。"""
+    if hasattr(value, "nbytes"):
+        # pyarrow.Table
+        return int(value.nbytes)
+    if hasattr(value, "memory_usage"):
+        # pd.DataFrame
+        return int(value.memory_usage(deep=True).sum())
+    return sys.getsizeof(value)
+
+
+@dataclass
+class CacheStats:
+    load_id: Optional[str] = None  # 現在のロードID
+    entries: int = 0  # 保存している結果の数
+    bytes: int = 0  # 保存している結果の合計のバイト数
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0  # max_bytesを超えて捨てた結果の数
+    invalidations: int = 0  # ロードIDが変わって結果を捨てた回数
+    load_id_checks: int = 0  # ロードIDを確認した回数
+
+
+class LoadScopedCache:
+    """
+    Args:
+        fetch_load_id: 最新のロードIDを返す関数
+        check_interval: ロードIDを確認する最短の間隔（秒）
+        max_bytes: 保存する結果の合計の上限（バイト）
+        on_new_load: ロードIDが変わったときに、(新しいロードID, よく見られているスコープのリスト) で別のスレッドから呼ぶ関数
+        prewarm_scopes: on_new_loadに渡すスコープの数
+    """
+    def __init__(
+        self,
+        fetch_load_id: Callable[[], Optional[str]],
+        check_interval: float = 60.0,
+        max_bytes: int = 512 * 1024 * 1024,
+        on_new_load: Optional[Callable[[str, list], None]] = None,
+        prewarm_scopes: int = 5,
+    ):
+        self._fetch_load_id = fetch_load_id
+        self._check_interval = check_interval
+        self._max_bytes = max_bytes
+        self._on_new_load = on_new_load
+        self._prewarm_scopes = prewarm_scopes
+        self._lock = threading.Lock()
+        self._check_lock = threading.Lock()
+        self._entries: OrderedDict[Hashable, tuple[Any, int]] = OrderedDict()
+        self._scope_views: Counter = Counter()
+        self._load_id: Optional[str] = None
+        self._checked_at: Optional[float] = None
+        self._stats = CacheStats()
+
+    def load_id(self) -> Optional[str]:
+        """
+        現在のロードIDを返します。前回の確認から check_interval 秒以上たっていれば、確認し直します。
+        確認は同時に1つのスレッドだけが行い、他のスレッドは前回の値を使います。
+        """
+        if self._checked_at is not None and time.monotonic() - self._checked_at < self._check_interval:
+            return self._load_id
+        if not self._check_lock.acquire(blocking=self._checked_at is None):
+            return self._load_id
+        try:
+            if self._checked_at is not None and time.monotonic() - self._checked_at < self._check_interval:
+                return self._load_id
+            try:
+                load_id = self._fetch_load_id()
+            except Exception:
+                # 確認に失敗しても画面は止めず、次の確認まで前回のロードIDを使う
+                logger.warning("failed to fetch the latest load id", exc_info=True)
+                load_id = self._load_id
+            self._checked_at = time.monotonic()
+            self._update_load_id(load_id)
+            return load_id
+        finally:
+            self._check_lock.release()
+
+    def get(self, load_id: Optional[str], key: Hashable, scope: Hashable = None) -> Any:
+        """保存した結果を返します。なければMISSINGを返します。scopeを渡すと、そのスコープが見られた回数を数えます。"""
+        with self._lock:
+            if scope is not None:
+                self._scope_views[scope] += 1
+            if load_id != self._load_id or key not in self._entries:
+                self._stats.misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            self._stats.hits += 1
+            return self._entries[key][0]
+
+    def put(self, load_id: Optional[str], key: Hashable, value: Any):
+        """結果を保存します。load_idが現在のロードIDと違えば（計算中にロードIDが変わっていれば）保存しません。"""
+        size = estimate_size(value)
+        with self._lock:
+            if load_id != self._load_id or size > self._max_bytes:
+                return
+            if key in self._entries:
+                self._stats.bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self._stats.bytes += size
+            while self._stats.bytes > self._max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._stats.bytes -= evicted_size
+                self._stats.evictions += 1
+
+    def stats(self) -> CacheStats:
+        """現時点の統計のコピーを返します。"""
+        with self._lock:
+            return replace(self._stats, load_id=self._load_id, entries=len(self._entries))
+
+    def _update_load_id(self, load_id: Optional[str]):
+        with self._lock:
+            self._stats.load_id_checks += 1
+            if load_id == self._load_id:
+                return
+            is_first = self._load_id is None
+            self._load_id = load_id
+            self._entries.clear()
+            self._stats.bytes = 0
+            if not is_first:
+                self._stats.invalidations += 1
+            scopes = [scope for scope, _ in self._scope_views.most_common(self._prewarm_scopes)]
+        logger.info("load id changed to %s", load_id)
+        if self._on_new_load is not None and not is_first:
+            threading.Thread(
+                target=self._call_on_new_load, args=(load_id, scopes), name="result-cache-on-new-load", daemon=True
+            ).start()
+
+    def _call_on_new_load(self, load_id: Optional[str], scopes: list):
+        try:
+            self._on_new_load(load_id, scopes)
+        except Exception:
+            logger.warning("on_new_load failed for load id %s", load_id, exc_info=True)
@@ -0,0 +1,216 @@
+"""session_pool
+
+Snowflakeのセッションを、プロセス内で使い回すためのプールです。
+utils.get_session_poolが、st.cache_resourceでプロセスに1つだけ作ります。
+
+セッションの作成（ログインとTLSのハンドシェイク）は、初めて必要になったときと、再接続するときだけ行います。
+
+- セッションの数は size 個まで。同じセッションを同時に使うのは max_concurrency 件まで。すべて埋まっていれば空くまで待ちます。
+- health_check_interval 秒以上使われていないセッションは、貸し出す前に死活確認（select 1）をし、失敗したら作り直します。
+- クエリがセッションの期限切れで失敗したら（is_expiredがTrueを返す例外）、セッションを作り直して1回だけ再実行します。
+
+Examples:
+    >>> pool = SessionPool(lambda: Session.builder.configs(connection_parameters).create(), size=2)
+    >>> pool.run(lambda session: session.sql("select 1").to_pandas())
+    >>> pool.metrics()
+    PoolMetrics(sessions=1, acquisitions=1, reuses=0, handshakes=1, handshake_seconds=0.83, ...)
+"""
+import threading
+import time
+from dataclasses import dataclass, replace
+from typing import Any, Callable, Optional
+
+
+@dataclass
+class PoolMetrics:
+    sessions: int = 0  # 現在のセッション数
+    acquisitions: int = 0  # セッションを貸し出した回数
+    reuses: int = 0  # 作成済みのセッションを貸し出した回数
+    waits: int = 0  # 空いているセッションがなく、待った回数
+    handshakes: int = 0  # セッションを作った回数（再接続を含む）
+    handshake_seconds: float = 0.0  # セッションの作成にかかった時間の合計
+    health_check_failures: int = 0  # 死活確認に失敗した回数
+    reconnects: int = 0  # セッションを作り直した回数
+
+    @property
+    def reuse_ratio(self) -> float:
+        """貸し出しのうち、作成済みのセッションを使い回せた割合"""
+        return self.reuses / self.acquisitions if self.acquisitions else 0.0
+
+    @property
+    def avg_handshake_seconds(self) -> float:
+        """セッションの作成1回あたりの時間"""
+        return self.handshake_seconds / self.handshakes if self.handshakes else 0.0
+
+
+class _PooledSession:
+    """プール内の1つのセッションと、その利用状況"""
+    def __init__(self):
+        self.session = None
+        self.in_flight = 0  # このセッションを使っている実行中の処理の数
+        self.generation = 0  # セッションを作り直すたびに増える
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()  # 死活確認と再接続を、同じセッションで同時に行わないためのロック
+
+
+def check_health(session):
+    """セッションにselect 1を実行し、失敗すれば例外を送出します。"""
+    session.sql("select 1").collect()
+
+
+class SessionPool:
+    """
+    セッションのプール。
+
+    Args:
+        create_session: セッションを作る関数
+        size: セッションの最大数
+        max_concurrency: 1つのセッションを同時に使える処理の数
+        health_check_interval: この秒数以上使われていないセッションは、貸し出す前に死活確認をする
+        is_expired: 例外がセッションの期限切れによるものならTrueを返す関数
+        health_check: セッションの死活確認をする関数。失敗したら例外を送出する
+        close_session: 作り直す前の古いセッションを閉じる関数
+    """
+    def __init__(
+        self,
+        create_session: Callable[[], Any],
+        size: int = 2,
+        max_concurrency: int = 4,
+        health_check_interval: float = 300.0,
+        is_expired: Callable[[Exception], bool] = lambda e: False,
+        health_check: Callable[[Any], None] = check_health,
+        close_session: Optional[Callable[[Any], None]] = None,
+    ):
+        if size < 1 or max_concurrency < 1:
+            raise ValueError("size and max_concurrency must be at least 1")
+        self._create_session = create_session
+        self._size = size
+        self._max_concurrency = max_concurrency
+        self._health_check_interval = health_check_interval
+        self._is_expired = is_expired
+        self._health_check = health_check
+        self._close_session = close_session
+        self._sessions: list[_PooledSession] = []
+        self._condition = threading.Condition()
+        self._metrics = PoolMetrics()
+
+    def run(self, function: Callable[[Any], Any]) -> Any:
+        """
+        セッションを1つ借りてfunction(session)を実行し、その戻り値を返します。
+        セッションの期限切れで失敗した場合は、セッションを作り直して1回だけ再実行します。
+        """
+        pooled = self._acquire()
+        try:
+            generation = pooled.generation
+            try:
+                return function(pooled.session)
+            except Exception as e:
+                if not self._is_expired(e):
+                    raise
+                self._reconnect(pooled, generation)
+                return function(pooled.session)
+        finally:
+            self._release(pooled)
+
+    def metrics(self) -> PoolMetrics:
+        """現時点のメトリクスのコピーを返します。"""
+        with self._condition:
+            return replace(self._metrics, sessions=len(self._sessions))
+
+    def close(self):
+        """すべてのセッションを閉じます。実行中の処理があるセッションも閉じます。"""
+        with self._condition:
+            sessions, self._sessions = self._sessions, []
+        for pooled in sessions:
+            self._close(pooled.session)
+
+    def _acquire(self) -> _PooledSession:
+        with self._condition:
+            self._metrics.acquisitions += 1
+            waited = False
+            while True:
+                # 作成済みのセッションのうち、最も空いているものを使う
+                available = [pooled for pooled in self._sessions if pooled.session is not None and pooled.in_flight < self._max_concurrency]
+                if available:
+                    pooled = min(available, key=lambda pooled: pooled.in_flight)
+                    pooled.in_flight += 1
+                    self._metrics.reuses += 1
+                    break
+                if len(self._sessions) < self._size:
+                    # 枠を予約してから、ロックの外でセッションを作る
+                    pooled = _PooledSession()
+                    pooled.in_flight = 1
+                    self._sessions.append(pooled)
+                    break
+                if not waited:
+                    self._metrics.waits += 1
+                    waited = True
+                self._condition.wait()
+
+        try:
+            if pooled.session is None:
+                self._connect(pooled)
+            elif time.monotonic() - pooled.last_used >= self._health_check_interval:
+                self._ensure_healthy(pooled)
+        except BaseException:
+            with self._condition:
+                if pooled.session is None:
+                    # 作成に失敗した枠は捨てる
+                    self._sessions.remove(pooled)
+                else:
+                    pooled.in_flight -= 1
+                self._condition.notify_all()
+            raise
+        return pooled
+
+    def _release(self, pooled: _PooledSession):
+        with self._condition:
+            pooled.in_flight -= 1
+            pooled.last_used = time.monotonic()
+            self._condition.notify_all()
+
+    def _connect(self, pooled: _PooledSession):
+        start = time.perf_counter()
+        session = self._create_session()
+        elapsed = time.perf_counter() - start
+        with self._condition:
+            pooled.session = session
+            pooled.generation += 1
+            pooled.last_used = time.monotonic()
+            self._metrics.handshakes += 1
+            self._metrics.handshake_seconds += elapsed
+
+    def _ensure_healthy(self, pooled: _PooledSession):
+        with pooled.lock:
+            generation = pooled.generation
+            # 待っている間に他の処理が確認・再接続していれば、確認しない
+            if time.monotonic() - pooled.last_used < self._health_check_interval:
+                return
+            try:
+                self._health_check(pooled.session)
+                pooled.last_used = time.monotonic()
+                return
+            except Exception:
+                with self._condition:
+                    self._metrics.health_check_failures += 1
+        self._reconnect(pooled, generation)
+
+    def _reconnect(self, pooled: _PooledSession, generation: int):
+        """セッションを作り直します。generationが変わっていれば、他の処理が作り直し済みなので何もしません。"""
+        with pooled.lock:
+            if pooled.generation != generation:
+                return
+            old_session = pooled.session
+            self._connect(pooled)
+            with self._condition:
+                self._metrics.reconnects += 1
+        self._close(old_session)
+
+    def _close(self, session):
+        if self._close_session is None or session is None:
+            return
+        try:
+            self._close_session(session)
+        except Exception:
+            # 期限切れのセッションは閉じるときにも失敗することがあるが、捨てるだけなので無視する
+            pass
@@ -1,13 +1,233 @@
 import os
 import base64
-from time import sleep
+import functools
 
-import pandas as pd
 import streamlit as st
 from snowflake.snowpark import Session
 from snowflake.snowpark.context import get_active_session
 from snowflake.snowpark.exceptions import SnowparkSessionException
 
+from ui.queries import LOAD_ID_QUERY
+from ui.query_executor import QueryBatch, QueryExecutor
+from ui.result_cache import MISSING, LoadScopedCache
+from ui.session_pool import SessionPool
+
+# ローカルのDuckDBのデータベースファイルのパスを設定する環境変数。
+# ui.localはduckdbとtransformパッケージを使うため、設定されているときだけインポートする（streamlit in snowflakeにはない）
+DUCKDB_PATH_ENV = "UI__DUCKDB_PATH"
+
+# セッションの期限切れ・認証トークンの期限切れを表すSnowflakeのエラーコード
+SESSION_EXPIRED_ERROR_CODES = {390111, 390112, 390114}
+
+
+def is_session_expired(e):
+    """例外が、Snowflakeのセッションの期限切れによるものならTrueを返します。"""
+    code = getattr(e, "sql_error_code", None) or getattr(e, "errno", None)
+    return code in SESSION_EXPIRED_ERROR_CODES
+
+
+@st.cache_resource
+def get_session_pool():
+    """get_session_pool
+    Snowflakeのセッションのプールを返すリソース。プロセスに1つだけ作り、すべてのページの再実行で使い回します。
+
+    streamlit in snowflakeの内部ならば、Snowflakeが管理するセッションをそのまま使います。
+    外部（開発中のローカル環境など）ならば、.streamlit/secrets.tomlの接続情報でセッションを作ります。
+    秘密鍵のデコードは、プールを作るときの1回だけです。
+
+    プールの大きさは環境変数で変えられます。
+    - UI__SESSION_POOL_SIZE: セッションの最大数（デフォルト2）
+    - UI__SESSION_MAX_CONCURRENCY: 1つのセッションで同時に実行する処理の数（デフォルト4）
+    - UI__SESSION_HEALTH_CHECK_INTERVAL: この秒数以上使われていないセッションは、使う前に死活確認をする（デフォルト300）
+
+    Examples:
+        >>> get_session_pool().metrics()
+        PoolMetrics(sessions=2, acquisitions=120, reuses=118, waits=0, handshakes=2, handshake_seconds=1.7, ...)
+    """
+    try:
+        # streamlit in snowflakeの内部ならば、snowparkセッションを使ってクエリ実行
+        session = get_active_session()
+        return SessionPool(lambda: session, size=1, is_expired=is_session_expired)
+    except SnowparkSessionException as e:
+        # streamlit in snowflakeの外部（開発中のローカル環境など）ならば、python-connectorを使ってクエリ実行
+        if not os.path.isfile('.streamlit/secrets.toml'):
+            raise e
+    secrets = st.secrets["snowflake"]
+    connection_parameters = {
+        "user": secrets["user"],
+        "private_key": base64.b64decode(secrets["private_key"]),
+        "account": secrets["account"],
+        "warehouse": secrets["warehouse"],
+        "database": secrets["database"],
+        "schema": secrets["schema"]
+    }
+    return SessionPool(
+        lambda: Session.builder.configs(connection_parameters).create(),
+        size=int(os.environ.get("UI__SESSION_POOL_SIZE", 2)),
+        max_concurrency=int(os.environ.get("UI__SESSION_MAX_CONCURRENCY", 4)),
+        health_check_interval=float(os.environ.get("UI__SESSION_HEALTH_CHECK_INTERVAL", 300)),
+        is_expired=is_session_expired,
+        close_session=lambda session: session.close(),
+    )
+
+
+class ArrowAsyncJob:
+    """
+    snowparkのAsyncJobの結果を、pandasを経由せずにpyarrow.Tableで取り出すジョブ。
+    AsyncJob.resultはpandasのDataFrameかRowのリストしか返さないため、クエリIDからコネクタのカーソルで結果を取り出します。
+
+    クエリを起動したセッションは、起動したらプールに返します。状態の確認・キャンセル・結果の取り出しは、
+    そのたびにプールからセッションを借りて、クエリIDで行います（同じユーザーのクエリなら、どのセッションからでも扱える）。
+    そのため、同時に使うセッションの数はプールの上限を超えず、死活確認や再接続で閉じたセッションも使いません。
+    """
+    def __init__(self, pool, query_id):
+        self._pool = pool
+        self._query_id = query_id
+
+    def is_done(self):
+        return self._pool.run(lambda session: session.create_async_job(self._query_id).is_done())
+
+    def cancel(self):
+        self._pool.run(lambda session: session.create_async_job(self._query_id).cancel())
+
+    def result(self):
+        def fetch_arrow(session):
+            with session.connection.cursor() as cursor:
+                cursor.get_results_from_sfqid(self._query_id)
+                # 0件のときもNoneではなく、列を持つ空のテーブルを返す
+                return cursor.fetch_arrow_all(force_return_table=True)
+        return self._pool.run(fetch_arrow)
+
+
+# ロードIDが変わったときに、結果を先に作っておくクエリ。space_idからクエリのリストを作る関数を登録する
+PREWARM_QUERY_BUILDERS = {}
+
+
+def register_prewarm_queries(build_queries):
+    """register_prewarm_queries
+    新しいロードが反映されたときに、よく見られているスペースについて先に実行しておくクエリを登録します。
+
+    Args:
+        build_queries: space_idを受け取り、submit_queriesに渡すクエリのリストを返す関数
+    """
+    PREWARM_QUERY_BUILDERS[f"{build_queries.__module__}.{build_queries.__qualname__}"] = build_queries
+
+
+def prewarm(load_id, space_ids):
+    """
+    よく見られているスペースのクエリを、結果を待たずに投入します。結果は実行器がキャッシュに保存します。
+    画面のクエリを待たせないよう別のスレッドプールで実行し、スペースが見られた回数には数えません（scopeを渡さない）。
+    """
+    executor = get_query_executor()
+    for space_id in space_ids:
+        for build_queries in PREWARM_QUERY_BUILDERS.values():
+            executor.submit(build_queries(space_id), background=True)
+
+
+def fetch_load_id():
+    """画面に反映されている最新のロードIDを返します。"""
+    return create_execute_query()(LOAD_ID_QUERY, []).iat[0, 0]
+
+
+@st.cache_resource
+def get_result_cache():
+    """get_result_cache
+    クエリの結果のキャッシュを返すリソース。プロセスに1つだけ作ります。
+
+    キャッシュは最新のロードID（LOAD_ID_QUERY）ごとで、新しいロードが反映されたら捨てて、
+    よく見られているスペースのクエリ（register_prewarm_queriesで登録したもの）を先に実行します。
+
+    キャッシュの設定は環境変数で変えられます。
+    - UI__CACHE_CHECK_INTERVAL: ロードIDを確認する最短の間隔の秒数（デフォルト60）
+    - UI__CACHE_MAX_MB: 保存する結果の合計の上限のMB（デフォルト512）。超えたら最も長く使われていない結果から捨てる
+    - UI__CACHE_PREWARM_SPACES: 新しいロードが反映されたときに、先に実行しておくスペースの数（デフォルト5）
+
+    Examples:
+        >>> get_result_cache().stats()
+        CacheStats(load_id='1721870781.2151089', entries=42, bytes=1048576, hits=300, misses=42, ...)
+    """
+    return LoadScopedCache(
+        fetch_load_id,
+        check_interval=float(os.environ.get("UI__CACHE_CHECK_INTERVAL", 60)),
+        max_bytes=int(os.environ.get("UI__CACHE_MAX_MB", 512)) * 1024 * 1024,
+        on_new_load=prewarm,
+        prewarm_scopes=int(os.environ.get("UI__CACHE_PREWARM_SPACES", 5)),
+    )
+
+
+def cache_by_load(function):
+    """cache_by_load
+    関数の結果を、引数ごとにget_result_cacheのキャッシュに保存するデコレータ。
+    st.cache_dataと違い、新しいロードが反映されたら結果を捨てます。引数のリストはタプルにしてキーにします。
+
+    Examples:
+        >>> @cache_by_load
+        ... def get_all_spaces():
+        ...     return create_execute_query()(ALL_SPACES, [])
+    """
+    name = f"{function.__module__}.{function.__qualname__}"
+
+    @functools.wraps(function)
+    def wrapper(*args):
+        cache = get_result_cache()
+        load_id = cache.load_id()
+        key = (name, tuple(tuple(arg) if isinstance(arg, list) else arg for arg in args))
+        result = cache.get(load_id, key)
+        if result is MISSING:
+            result = function(*args)
+            cache.put(load_id, key, result)
+        return result
+    return wrapper
+
+
+@st.cache_resource
+def get_query_executor():
+    """get_query_executor
+    クエリを並行に実行する実行器を返すリソース。プロセスに1つだけ作ります。
+
+    Snowflakeでは、プールのセッションでクエリを非同期に起動し（collect_nowait）、AsyncJobが終わったら結果を取り出します。
+    結果はpandasを経由せず、Arrowのバッチのまま pyarrow.Table で返します。
+    ローカルのDuckDBのデータベースが指定されていれば、そちらにクエリを実行します。
+    (クエリ, パラメータ) ごとの結果は、get_result_cacheのキャッシュに保存して使い回します。
+
+    実行器の設定は環境変数で変えられます。
+    - UI__QUERY_WORKERS: 同時に待てるクエリの数（デフォルト8）
+    - UI__QUERY_TIMEOUT: クエリごとのタイムアウトの秒数（デフォルトなし）
+    """
+    if os.environ.get(DUCKDB_PATH_ENV):
+        # ローカルのDuckDBのデータベースが指定されていれば、Snowflakeではなくそちらにクエリ実行
+        from ui import local
+        launch = local.create_launch(os.environ[DUCKDB_PATH_ENV])
+    else:
+        pool = get_session_pool()
+        launch = lambda query, params: ArrowAsyncJob(
+            pool, pool.run(lambda session: session.sql(query, params=params).collect_nowait().query_id)
+        )
+    timeout = os.environ.get("UI__QUERY_TIMEOUT")
+    return QueryExecutor(
+        launch,
+        max_workers=int(os.environ.get("UI__QUERY_WORKERS", 8)),
+        timeout=float(timeout) if timeout else None,
+        cache=get_result_cache(),
+    )
+
+
+def submit_queries(queries, scope=None) -> QueryBatch:
+    """submit_queries
+    複数のクエリを並行に実行し、終わったものから結果を返すQueryBatchを返します。
+    with文で使うと、ブロックを抜けるときに終わっていないクエリをキャンセルします。
+
+    Args:
+        queries: (クエリ, パラメータ) または (クエリ, パラメータ, タイムアウトの秒数) のリスト
+        scope: どのスペースのクエリか。キャッシュがよく見られているスペースを数えるのに使う
+
+    Examples:
+        >>> with submit_queries([(QUERY_A, (space_id,)), (QUERY_B, ())], scope=space_id) as batch:
+        ...     for index, df in batch.as_completed():
+        ...         placeholders[index].dataframe(df)
+    """
+    return get_query_executor().submit(queries, scope)
+
 
 def create_execute_query():
     """create_execute_query
@@ -20,40 +240,30 @@ def create_execute_query():
         >>> execute_query = create_execute_query()
         >>> execute_query("select * from table where id = ?", params=(1,))
     """
-    try:
-        # streamlit in snowflakeの内部ならば、snowparkセッションを使ってクエリ実行
-        session = get_active_session()
-    except SnowparkSessionException as e:
-        if not os.path.isfile('.streamlit/secrets.toml'):
-            raise e
-        secrets = st.secrets["snowflake"]
-        connection_parameters = {
-            "user": secrets["user"],
-            "private_key": base64.b64decode(secrets["private_key"]),
-            "account": secrets["account"],
-            "warehouse": secrets["warehouse"],
-            "database": secrets["database"],
-            "schema": secrets["schema"]
-        }
-        session = Session.builder.configs(connection_parameters).create()
-        # streamlit in snowflakeの外部（開発中のローカル環境など）ならば、python-connectorを使ってクエリ実行
-    finally:
-        def execute_query(query, params=()):
-            return session.sql(query, params=params).to_pandas()
-        return execute_query
+    if os.environ.get(DUCKDB_PATH_ENV):
+        # ローカルのDuckDBのデータベースが指定されていれば、Snowflakeではなくそちらにクエリ実行
+        from ui import local
+        return local.create_execute_query(os.environ[DUCKDB_PATH_ENV])
+    # プールのセッションを使い回してクエリ実行
+    pool = get_session_pool()
+
+    def execute_query(query, params=()):
+        return pool.run(lambda session: session.sql(query, params=params).to_pandas())
+    return execute_query
 
 def create_execute_queries():
     """create_execute_queries
     クエリ実行用関数 execute_queries を作成するクロージャ。
 
     ### execute_queries
-    execute_queriesは複数のクエリのリストを受け取り、非同期に実行します。
+    execute_queriesは複数のクエリのリストを受け取り、並行に実行します（get_query_executorを使います）。
+    結果を終わったものから受け取るには、submit_queriesを使ってください。
 
     Args:
         queries: クエリのリスト。リストの要素は、それぞれクエリ本文とパラメータ辞書を保持したタプルです。
 
     Returns:
-        list: 各クエリの処理結果が格納されたpd.DataFrame。並び順は、投入されたクエリリストの順序に一致。
+        list: 各クエリの処理結果が格納されたpyarrow.Table。並び順は、投入されたクエリリストの順序に一致。
 
     Raises:
         リストに含まれるクエリのうち一つでもエラーが起きたら、そのエラーをRaiseします。
@@ -74,36 +284,9 @@ def create_execute_queries():
             | :----------------- |
             | 2024-08-27 00:00:00|
     """
-    try:
-        # streamlit in snowflakeの内部ならば、snowparkセッションを使ってクエリ実行
-        session = get_active_session()    
-    except SnowparkSessionException as e:
-        # streamlit in snowflakeの外部（開発中のローカル環境など）ならば、python-connectorを使ってクエリ実行
-        if not os.path.isfile('.streamlit/secrets.toml'):
-            raise e
-        secrets = st.secrets["snowflake"]
-        connection_parameters = {
-            "user": secrets["user"],
-            "private_key": base64.b64decode(secrets["private_key"]),
-            "account": secrets["account"],
-            "warehouse": secrets["warehouse"],
-            "database": secrets["database"],
-            "schema": secrets["schema"]
-        }
-        session = Session.builder.configs(connection_parameters).create()
-    finally:
-        def execute_queries(queries):
-            query_ids = []
-            for query in queries:
-                # すべて非同期に起動する。
-                query_id = session.sql(query[0], params=query[1]).collect_nowait().query_id
-                query_ids.append(query_id)
-            
-            # すべてのクエリの完了を待機する
-            while not all([session.create_async_job(query_id).is_done() for query_id in query_ids]):
-                sleep(0.05)
-
-            # クエリ結果を取り出す。
-            results = [session.create_async_job(query_id).result(result_type="pandas") for query_id in query_ids]
-            return results
-        return execute_queries
+    executor = get_query_executor()
+
+    def execute_queries(queries):
+        with executor.submit(queries) as batch:
+            return batch.results()
+    return execute_queries